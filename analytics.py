@@ -0,0 +1,197 @@
+"""
+Vectorized portfolio analytics.
+
+The functions in this module turn a portfolio's transactions and aligned daily
+price data into time series with array operations, instead of walking the date
+range one day (and one ticker) at a time.
+"""
+import numpy as np
+import pandas as pd
+
+
+def portfolio_time_series(transactions, prices, fx_rates, initial=None):
+    """
+    Simulates the portfolio over the dates of ``prices``.
+
+    Cash from sales is kept in the portfolio and used for later purchases; when a
+    purchase costs more than the cash on hand, the difference is new money
+    invested into the portfolio.
+
+    Args:
+        transactions (pd.DataFrame): One row per transaction in chronological order,
+            with the columns date (normalized), ticker, type ('buy' or 'sell'),
+            quantity and value (quantity * price, in CAD).
+        prices (pd.DataFrame): Daily close of every ticker (columns) for every
+            simulated date (index).
+        fx_rates (pd.DataFrame): Rate converting each close to CAD, aligned with prices.
+        initial (dict, optional): State of the portfolio before the first date, with
+            the keys holdings (pd.Series per ticker), cash and invested. Defaults
+            to an empty portfolio.
+
+    Returns:
+        tuple: A DataFrame indexed by date with the columns cash_invested,
+        portfolio_value, equity and cash, and a Series with the final holdings
+        of every ticker.
+    """
+    dates = prices.index
+    tickers = prices.columns
+
+    is_buy = (transactions["type"] == "buy").to_numpy()
+    is_sell = (transactions["type"] == "sell").to_numpy()
+    quantity = transactions["quantity"].to_numpy()
+    value = transactions["value"].to_numpy(dtype=float)
+    signed_quantity = np.where(is_buy, quantity, np.where(is_sell, -quantity, 0))
+    cash_flow = np.where(is_buy, -value, np.where(is_sell, value, 0.0))
+
+    initial_cash = initial["cash"] if initial else 0.0
+    initial_invested = initial["invested"] if initial else 0.0
+
+    # Cash never goes negative: the running total of cash flows is topped up by
+    # the largest shortfall seen so far, which is exactly the money invested.
+    running_total = initial_cash + np.cumsum(cash_flow)
+    invested = initial_invested + np.maximum.accumulate(np.maximum(-running_total, 0.0))
+    cash = running_total + (invested - initial_invested)
+
+    # State after the last transaction on or before each date (the initial state before the first one).
+    txn_dates = transactions["date"].to_numpy(dtype="datetime64[ns]")
+    last_txn = np.searchsorted(txn_dates, dates.to_numpy(), side="right")
+    invested_ts = np.concatenate(([initial_invested], invested))[last_txn]
+    cash_ts = np.concatenate(([initial_cash], cash))[last_txn]
+
+    # Holdings matrix: net quantity traded per (date, ticker), accumulated over time.
+    day_index = np.searchsorted(dates.to_numpy(), txn_dates)
+    ticker_index = tickers.get_indexer(transactions["ticker"])
+    in_range = day_index < len(dates)
+    deltas = np.zeros((len(dates), len(tickers)), dtype=signed_quantity.dtype)
+    np.add.at(deltas, (day_index[in_range], ticker_index[in_range]), signed_quantity[in_range])
+    holdings = np.cumsum(deltas, axis=0)
+    if initial:
+        holdings = holdings + initial["holdings"].reindex(tickers, fill_value=0).to_numpy()
+
+    position_values = holdings * prices.to_numpy(dtype=float) * fx_rates.to_numpy(dtype=float)
+    equity_ts = np.where(holdings != 0, position_values, 0.0).sum(axis=1)
+
+    series = pd.DataFrame(
+        {
+            "cash_invested": invested_ts,
+            "portfolio_value": equity_ts + cash_ts,
+            "equity": equity_ts,
+            "cash": cash_ts,
+        },
+        index=dates,
+    )
+    if len(dates):
+        final_holdings = pd.Series(holdings[-1], index=tickers)
+    elif initial:
+        final_holdings = initial["holdings"].reindex(tickers, fill_value=0)
+    else:
+        final_holdings = pd.Series(np.zeros(len(tickers), dtype=deltas.dtype), index=tickers)
+    return series, final_holdings
+
+
+def benchmark_shares(cash_invested, prices, initial_invested=0.0, initial_shares=0.0):
+    """
+    Returns the number of benchmark shares held per date when, whenever
+    additional money is invested in the portfolio, the same amount is invested
+    in the benchmark at that day's closing price.
+
+    Args:
+        cash_invested (pd.Series): Total money invested in the portfolio per date.
+        prices (pd.Series): Benchmark closing price for the same dates.
+        initial_invested (float): Money invested before the first date.
+        initial_shares (float): Benchmark shares held before the first date.
+
+    Returns:
+        pd.Series: Benchmark shares per date.
+    """
+    additional_investment = np.diff(cash_invested.to_numpy(dtype=float), prepend=initial_invested)
+    price = prices.reindex(cash_invested.index).to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares_bought = np.where(
+            (additional_investment > 0) & (price != 0), additional_investment / price, 0.0
+        )
+    return pd.Series(initial_shares + np.cumsum(shares_bought), index=cash_invested.index)
+
+
+def pnl_percentage_series(value, cash_invested):
+    """
+    Returns the daily profit and loss of a portfolio as a percentage of the
+    previous day's value, excluding the money invested on that day.
+    """
+    pnl = value.diff().fillna(0) - cash_invested.diff().fillna(0)
+    prev_value = value.shift(1)
+    return (pnl / prev_value.replace(0, np.nan)).fillna(0) * 100
+
+
+def roi_percentage(final_value, cash_invested):
+    """
+    Returns the return on investment in percent, or 0 when nothing was invested.
+    """
+    if cash_invested == 0:
+        return 0
+    return (final_value - cash_invested) / cash_invested * 100
+
+
+def nearest_bars(index, times):
+    """
+    Returns the position of the bar of ``index`` nearest to each of ``times``,
+    found by binary search; ties go to the earlier bar.
+
+    Args:
+        index (pd.DatetimeIndex): Increasing bar timestamps.
+        times (pd.DatetimeIndex): Timestamps in the same timezone as ``index``.
+
+    Returns:
+        np.ndarray: One position per timestamp.
+    """
+    bars = index.asi8
+    values = times.asi8
+    right = np.clip(np.searchsorted(bars, values), 0, len(bars) - 1)
+    left = np.clip(right - 1, 0, len(bars) - 1)
+    use_left = (values - bars[left]) <= (bars[right] - values)
+    return np.where(use_left, left, right)
+
+
+def transaction_markers(transactions, index):
+    """
+    Places the buys and sells of a ticker on its price bars, adding up the
+    quantities of the transactions that land on the same bar.
+
+    Dates without a timezone are taken as UTC. On daily bars (all at midnight,
+    without a timezone) a transaction lands on the bar of its day, or the
+    nearest trading day; on intraday bars, on the nearest bar.
+
+    Args:
+        transactions (list): The ticker's transactions, as in the portfolio.
+        index (pd.DatetimeIndex): Increasing bar timestamps.
+
+    Returns:
+        list: {"type", "position", "price", "quantity"} per bar and side, in
+        order of first transaction, with the price of the first transaction.
+    """
+    if not transactions or len(index) == 0:
+        return []
+    dates = pd.Series([txn["date"] for txn in transactions])
+    times = pd.DatetimeIndex(pd.to_datetime(dates, format="ISO8601", errors="coerce", utc=True))
+    for date in dates[times.isna()]:
+        print(f"Error parsing transaction date: {date}")
+
+    if index.tz is None:
+        times = times.tz_convert(None)
+        if (index == index.normalize()).all():
+            times = times.normalize()
+    else:
+        times = times.tz_convert(index.tz)
+    valid = ~times.isna()
+    positions = np.full(len(times), -1)
+    positions[valid] = nearest_bars(index, times[valid])
+
+    markers = {}
+    for txn, position in zip(transactions, positions):
+        if position < 0 or txn["type"] not in ("buy", "sell"):
+            continue
+        key = (txn["type"], int(position))
+        if key not in markers:
+            markers[key] = {"type": txn["type"], "position": int(position), "price": txn["price"], "quantity": 0}
+        markers[key]["quantity"] += txn["quantity"]
+    return list(markers.values())
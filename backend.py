@@ -1,12 +1,27 @@
-from flask import Flask
+import io
+import os
+import time
+
+from flask import Flask, Response, abort, g, jsonify, stream_with_context
 from flask_cors import CORS
 import pandas as pd
-from report import get_comparison_data, get_portfolio_performances
+from columnar import parse_format
+from downsample import parse_view
+from intraday import parse_interval
+import metrics
+from market_data import INFO_TTL, QUOTE_TTL
+from portfolio_store import csv_rows, json_rows, ndjson_rows, portfolio_rows, portfolio_store
+from report import get_comparison_data, get_portfolio_performances, iter_portfolio_performances
+from result_cache import ResultCache
 from flask import request
 
 app = Flask(__name__)
 CORS(app)
 
+# Portfolio served when a request does not name one; it is created in the
+# portfolio store with the sample transactions below on first start
+DEFAULT_PORTFOLIO = os.environ.get("DEFAULT_PORTFOLIO", "default")
+
 portfolio = {
     "INR": {
         "ADANIENT.NS": [
@@ -55,21 +70,338 @@ portfolio = {
 # start_date = "2020-02-05"
 # end_date = "2025-04-02"
 
+if portfolio_store.get(DEFAULT_PORTFOLIO) is None:
+    try:
+        portfolio_store.create(DEFAULT_PORTFOLIO)
+        portfolio_store.add_transactions(DEFAULT_PORTFOLIO, portfolio_rows(portfolio))
+    except ValueError:
+        pass  # created by another process in the meantime
+
+# Serialized responses, keyed by the portfolio's transactions, the request
+# parameters and the market-data date. The performance payload includes live
+# quotes, so it is only reused for as long as the quotes themselves are.
+comparison_cache = ResultCache(ttl=INFO_TTL)
+performance_cache = ResultCache(ttl=QUOTE_TTL)
+
+
+def cached_json(cache, name, portfolio, params, compute):
+    """
+    Returns a JSON response for ``compute()``, reusing the serialized payload of
+    an identical earlier request for ``portfolio`` while it is still valid.
+    """
+
+    def serialized():
+        data = compute()
+        with metrics.stage("serialize"):
+            return app.json.dumps(data).encode()
+
+    payload = cache.get_or_compute(name, portfolio, params, serialized)
+    return Response(payload, mimetype=app.json.mimetype)
+
+
+# Per-stage timings are returned in a Server-Timing header on every response
+# when TIMING_HEADERS=1, or on the requests sending "X-Timing: 1"
+TIMING_HEADERS = os.environ.get("TIMING_HEADERS", "0") == "1"
+
+
+@app.before_request
+def start_timing():
+    g.request_start = time.perf_counter()
+    g.timings = metrics.start_request_timing()
+
+
+@app.after_request
+def record_timing(response):
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.request_seconds.observe(elapsed, endpoint=endpoint)
+    metrics.requests_total.inc(endpoint=endpoint, status=response.status_code)
+    if TIMING_HEADERS or request.headers.get("X-Timing") == "1":
+        response.headers["Server-Timing"] = metrics.server_timing(g.timings, elapsed)
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+@app.route("/metrics")
+def get_metrics():
+    """
+    Exposes the request, stage, cache and market-data metrics in the
+    Prometheus text format.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def requested_portfolio(request_data=None):
+    """
+    Returns the portfolio named by a "portfolio" id in the request body or
+    query string (DEFAULT_PORTFOLIO by default), or answers 404 if it does not exist.
+    """
+    portfolio_id = (request_data or {}).get("portfolio") or request.args.get(
+        "portfolio", DEFAULT_PORTFOLIO
+    )
+    requested = portfolio_store.get(portfolio_id)
+    if requested is None:
+        abort(404, description=f"Unknown portfolio {portfolio_id}")
+    return requested
+
+
+def requested_format(request_data=None):
+    """
+    Returns the series format asked for with a "format" field in the request
+    body or query string ("json" by default, or "columnar").
+    """
+    value = (request_data or {}).get("format") or request.args.get("format")
+    return parse_format(value)
+
+
+def requested_view(request_data=None):
+    """
+    Returns the chart size asked for with "points" (a target number of points)
+    and "range" (the viewport, [start, end] or "start,end") in the request body
+    or query string, as (points, view).
+    """
+    request_data = request_data or {}
+    points = request_data.get("points") or request.args.get("points")
+    if points:
+        try:
+            points = int(points)
+        except (ValueError, TypeError):
+            abort(400, description=f"Invalid points {points!r}")
+        # LTTB keeps the first and last points and at least one in between
+        if points < 3:
+            abort(400, description=f"Invalid points {points}: at least 3 are needed")
+    value = request_data.get("range") or request.args.get("range")
+    try:
+        view = parse_view(value)
+    except (ValueError, TypeError):
+        abort(400, description=f"Invalid range {value!r}")
+    return (points or None), view
+
+
+def requested_interval(request_data=None):
+    """
+    Returns the bar size asked for with an "interval" field in the request body
+    or query string ("1d" by default, or an intraday interval such as "15m").
+    """
+    value = (request_data or {}).get("interval") or request.args.get("interval")
+    return parse_interval(value)
+
+
+# Windows of the range selector, ending today
+WINDOWS = {
+    "1m": pd.DateOffset(months=1),
+    "6m": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+}
+
+
+def requested_window(request_data=None):
+    """
+    Returns the window of days asked for with "start" and "end" dates, or a
+    "window" ("1m", "6m", "1y" or "ytd") ending today, in the request body or
+    query string, as (start, end); either is None when not restricted. Answers
+    400 for a date that does not parse, an unknown window or an end before the
+    start.
+    """
+    request_data = request_data or {}
+
+    def get(name):
+        return request_data.get(name) or request.args.get(name)
+
+    def get_date(name):
+        value = get(name)
+        if not value:
+            return None
+        try:
+            day = pd.Timestamp(value)
+        except (ValueError, TypeError):
+            abort(400, description=f"Invalid {name} {value!r}")
+        if day is pd.NaT:
+            abort(400, description=f"Invalid {name} {value!r}")
+        return day.tz_localize(None) if day.tz is not None else day
+
+    window = get("window")
+    if window in WINDOWS:
+        return (pd.Timestamp.today().normalize() - WINDOWS[window]).isoformat(), None
+    if window == "ytd":
+        return pd.Timestamp.today().replace(month=1, day=1).normalize().isoformat(), None
+    if window:
+        abort(400, description=f"Invalid window {window!r}: expected one of {', '.join([*WINDOWS, 'ytd'])}")
+    start, end = get_date("start"), get_date("end")
+    if start is not None and end is not None and end < start:
+        abort(400, description=f"Invalid window: end {end.date()} is before start {start.date()}")
+    return tuple(day.isoformat() if day is not None else None for day in (start, end))
+
 
 @app.route("/comparison", methods=["GET", "POST"])
 def helloWorld():
     if request.method == "POST":
         request_data = request.get_json()
         # print(request_data)
-        comparison = request_data.get("comparison")
-        return get_comparison_data(portfolio, comparison=comparison)
+        comparison = request_data.get("comparisons") or request_data.get("comparison")
+        series_format = requested_format(request_data)
+        points, view = requested_view(request_data)
+        start, end = requested_window(request_data)
     else:
-        return get_comparison_data(portfolio)
+        request_data = None
+        comparison = "^IXIC"
+        series_format = requested_format()
+        points, view = requested_view()
+        start, end = requested_window()
+    selected_portfolio = requested_portfolio(request_data)
+    return cached_json(
+        comparison_cache,
+        "comparison",
+        selected_portfolio,
+        {
+            "comparison": comparison,
+            "format": series_format,
+            "points": points,
+            "range": view,
+            "start": start,
+            "end": end,
+        },
+        lambda: get_comparison_data(
+            selected_portfolio,
+            comparison=comparison,
+            series_format=series_format,
+            points=points,
+            view=view,
+            start=start,
+            end=end,
+        ),
+    )
 
 
 @app.route("/indiv_performance", methods=["GET", "POST"])
 def get_portfolio():
-    return get_portfolio_performances(portfolio)
+    request_data = request.get_json(silent=True)
+    series_format = requested_format(request_data)
+    points, view = requested_view(request_data)
+    start, end = requested_window(request_data)
+    interval = requested_interval(request_data)
+    selected_portfolio = requested_portfolio(request_data)
+    return cached_json(
+        performance_cache,
+        "indiv_performance",
+        selected_portfolio,
+        {
+            "format": series_format,
+            "points": points,
+            "range": view,
+            "start": start,
+            "end": end,
+            "interval": interval,
+        },
+        lambda: get_portfolio_performances(
+            selected_portfolio,
+            series_format=series_format,
+            points=points,
+            view=view,
+            start=start,
+            end=end,
+            interval=interval,
+        ),
+    )
+
+
+@app.route("/indiv_performance/stream", methods=["GET", "POST"])
+def stream_portfolio():
+    """
+    Streams the performance of every ticker as newline-delimited JSON, one
+    {"currency", "ticker", "performance"} object per line, as soon as each
+    ticker is ready. Takes the same parameters as /indiv_performance.
+    """
+    request_data = request.get_json(silent=True)
+    series_format = requested_format(request_data)
+    points, view = requested_view(request_data)
+    start, end = requested_window(request_data)
+    interval = requested_interval(request_data)
+    selected_portfolio = requested_portfolio(request_data)
+
+    def generate():
+        for currency, ticker, performance in iter_portfolio_performances(
+            selected_portfolio,
+            series_format=series_format,
+            points=points,
+            view=view,
+            start=start,
+            end=end,
+            interval=interval,
+        ):
+            line = {"currency": currency, "ticker": ticker, "performance": performance}
+            yield app.json.dumps(line) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/portfolios", methods=["GET", "POST"])
+def portfolios():
+    """
+    GET lists the portfolios with their number of transactions; POST creates
+    one, with the "id" given in the body or a random one, and returns its id.
+    """
+    if request.method == "GET":
+        return jsonify(portfolio_store.counts())
+    portfolio_id = (request.get_json(silent=True) or {}).get("id")
+    try:
+        portfolio_id = portfolio_store.create(portfolio_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"id": portfolio_id}), 201
+
+
+@app.route("/portfolios/<portfolio_id>", methods=["GET", "DELETE"])
+def portfolio_by_id(portfolio_id):
+    """
+    GET returns the transactions of a portfolio by currency and ticker; DELETE
+    deletes it.
+    """
+    if request.method == "DELETE":
+        if not portfolio_store.delete(portfolio_id):
+            abort(404, description=f"Unknown portfolio {portfolio_id}")
+        return "", 204
+    requested = portfolio_store.get(portfolio_id)
+    if requested is None:
+        abort(404, description=f"Unknown portfolio {portfolio_id}")
+    return jsonify(requested)
+
+
+@app.route("/portfolios/<portfolio_id>/transactions", methods=["GET", "POST"])
+def portfolio_transactions(portfolio_id):
+    """
+    GET returns the transactions of one "ticker" of a portfolio in date order,
+    or answers 404 if the portfolio does not exist.
+
+    POST imports transactions in bulk, streamed from the request body:
+    text/csv (a broker export with date, ticker/symbol, type/side,
+    quantity/qty, price and optional currency columns), application/x-ndjson
+    (one transaction per line) or application/json (a transaction, a list of
+    them or a portfolio by currency and ticker). The import is all or nothing;
+    a bad row answers 400 with its number.
+    """
+    if request.method == "GET":
+        if portfolio_store.get(portfolio_id) is None:
+            abort(404, description=f"Unknown portfolio {portfolio_id}")
+        return jsonify(portfolio_store.ticker_transactions(portfolio_id, request.args.get("ticker", "")))
+
+    mimetype = request.mimetype
+    if mimetype == "text/csv":
+        rows = csv_rows(io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline=""))
+    elif mimetype == "application/x-ndjson":
+        rows = ndjson_rows(io.TextIOWrapper(request.stream, encoding="utf-8"))
+    else:
+        data = request.get_json(silent=True)
+        if data is None:
+            return jsonify({"error": "Expected CSV, newline-delimited JSON or JSON"}), 415
+        rows = json_rows(data)
+    try:
+        added = portfolio_store.add_transactions(portfolio_id, rows)
+    except KeyError:
+        abort(404, description=f"Unknown portfolio {portfolio_id}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"imported": added}), 201
 
 
 if __name__ == "__main__":
@@ -0,0 +1,234 @@
+"""
+Batch generation of PDF reports for many portfolios.
+
+    python batch_report.py portfolios/ --out reports --workers 4
+
+Every argument is a JSON file holding one portfolio (named after the file) or
+an object of portfolios by name, or a directory of such files. The market data
+of all portfolios is fetched once up front: the daily closes of the union of
+their tickers go to the price store, and the hourly bars and company
+information are handed to the worker processes rendering the reports, so a
+ticker held by hundreds of portfolios is downloaded once. A portfolio that
+fails is reported and skipped without stopping the others.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import report_pages
+from intraday import intraday_store
+from market_data import fetch_concurrently, get_info, prime_info
+from price_store import price_store
+from report import generate_report, get_start_date
+
+
+def is_portfolio(value):
+    """
+    Returns whether ``value`` is one portfolio ({currency: {ticker: [transactions]}}).
+    """
+    return isinstance(value, dict) and all(
+        isinstance(tickers, dict) and all(isinstance(txns, list) for txns in tickers.values())
+        for tickers in value.values()
+    )
+
+
+def load_portfolios(paths):
+    """
+    Reads the portfolios from JSON files and directories of JSON files.
+
+    Returns:
+        dict: The portfolios by name, in the order they were found.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json")
+            )
+        else:
+            files.append(path)
+
+    portfolios = {}
+    for file in files:
+        with open(file) as f:
+            data = json.load(f)
+        if is_portfolio(data):
+            portfolios[os.path.splitext(os.path.basename(file))[0]] = data
+        else:
+            portfolios.update(data)
+    return portfolios
+
+
+def prefetch(portfolios, start_date, comparison):
+    """
+    Fetches the market data of all portfolios at once, from ``start_date`` on:
+    the daily closes of the union of their tickers and the comparison index
+    into the price store, and their hourly session bars and company information.
+
+    Returns:
+        tuple: The hourly bars by ticker and the company information by ticker.
+    """
+    tickers = list(
+        dict.fromkeys(
+            ticker
+            for portfolio in portfolios.values()
+            for currency in portfolio.values()
+            for ticker in currency
+        )
+    )
+    end_date = datetime.today() + timedelta(days=1)
+
+    price_store.refresh(tickers + [comparison], start_date, end_date)
+    hourly_data = intraday_store.get_bars_many(tickers, start_date, end_date, "1h")
+    infos, errors = fetch_concurrently(get_info, tickers)
+    for ticker, e in errors.items():
+        print(f"Error fetching details for {ticker}: {e}")
+    return hourly_data, infos
+
+
+def portfolio_bars(portfolio, hourly_data, start_date):
+    """
+    Returns the hourly bars of the tickers of ``portfolio`` from ``start_date``
+    (its first transaction) on, out of those fetched for all portfolios.
+    """
+    start = pd.Timestamp(start_date)
+    bars = {}
+    for currency in portfolio.values():
+        for ticker in currency:
+            if ticker in hourly_data:
+                data = hourly_data[ticker]
+                first = start.tz_localize(data.index.tz) if data.index.tz is not None else start
+                bars[ticker] = data[data.index >= first]
+    return bars
+
+
+def _init_worker(infos):
+    # Pages are drawn in the worker itself rather than in a pool of its own
+    report_pages.REPORT_WORKERS = 1
+    prime_info(infos)
+
+
+def render(name, portfolio, out, w, comparison, hourly_data):
+    """
+    Renders the report of one portfolio to ``{out}/{name}.pdf``, plotting the
+    hourly bars returned by ``portfolio_bars()``.
+
+    Returns:
+        float: The seconds taken.
+    """
+    start = time.perf_counter()
+    start_date = get_start_date(portfolio)
+    end_date = datetime.today() + timedelta(days=1)
+    generate_report(
+        portfolio, start_date, end_date, w, os.path.join(out, name), comparison, hourly_data
+    )
+    return time.perf_counter() - start
+
+
+def run(portfolios, out, w=26, comparison="^IXIC", workers=None):
+    """
+    Renders the reports of ``portfolios`` on ``workers`` processes (one per CPU
+    by default), printing progress as they complete.
+
+    Returns:
+        dict: The error of every portfolio that failed, by name.
+    """
+    os.makedirs(out, exist_ok=True)
+    start = time.perf_counter()
+    total = len(portfolios)
+    failures = {}
+    completed = []
+
+    def progress(name, seconds=None, error=None):
+        completed.append(name)
+        if error is not None:
+            failures[name] = error
+        status = f"done in {seconds:.1f}s" if error is None else f"failed: {error}"
+        print(f"[{len(completed)}/{total}] {name}: {status}")
+
+    # Portfolios whose transactions cannot be read, or without any, fail here,
+    # before the market data of the others is fetched
+    start_dates = {}
+    for name, portfolio in portfolios.items():
+        try:
+            start_date = get_start_date(portfolio)
+        except Exception as e:
+            progress(name, error=e)
+            continue
+        if start_date is None:
+            progress(name, error=ValueError("The portfolio has no transactions"))
+            continue
+        start_dates[name] = start_date
+    portfolios = {name: portfolios[name] for name in start_dates}
+    if not portfolios:
+        return failures
+
+    hourly_data, infos = prefetch(portfolios, min(start_dates.values()), comparison)
+    print(f"Fetched market data in {time.perf_counter() - start:.1f}s")
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        prime_info(infos)
+        for name, portfolio in portfolios.items():
+            try:
+                bars = portfolio_bars(portfolio, hourly_data, start_dates[name])
+                progress(name, render(name, portfolio, out, w, comparison, bars))
+            except Exception as e:
+                progress(name, error=e)
+    else:
+        # Workers are started fresh rather than forked, so none of them shares
+        # the parent's SQLite connections
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(infos,),
+        ) as pool:
+            futures = {
+                pool.submit(
+                    render,
+                    name,
+                    portfolio,
+                    out,
+                    w,
+                    comparison,
+                    portfolio_bars(portfolio, hourly_data, start_dates[name]),
+                ): name
+                for name, portfolio in portfolios.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    progress(name, future.result())
+                except Exception as e:
+                    progress(name, error=e)
+
+    print(
+        f"{total - len(failures)} of {total} reports written to {out} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the PDF reports of many portfolios.")
+    parser.add_argument("paths", nargs="+", help="Portfolio JSON files or directories of them.")
+    parser.add_argument("--out", default="reports", help="Directory the reports are written to.")
+    parser.add_argument("--workers", type=int, help="Reports rendered at once (default: one per CPU).")
+    parser.add_argument("--width", type=float, default=26, help="Page width in inches.")
+    parser.add_argument("--comparison", default="^IXIC", help="Comparison index ticker.")
+    args = parser.parse_args()
+
+    portfolios = load_portfolios(args.paths)
+    failures = run(portfolios, args.out, args.width, args.comparison, args.workers)
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
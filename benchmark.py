@@ -0,0 +1,311 @@
+"""
+Benchmarks of the analytics hot paths on synthetic portfolios and offline data.
+
+    python benchmark.py --tickers 12 --years 3 --transactions 1000 --repeat 5
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json --tolerance 0.2
+
+A portfolio of ``--tickers`` tickers spread over USD, CAD and INR with
+``--transactions`` random trades over ``--years`` years is generated together
+with synthetic fixtures for its tickers, so the results depend neither on the
+network nor on real market data. Every case is timed ``--repeat`` times after a
+warm-up run and once more under tracemalloc for its memory peak; the time spent
+in each stage (price store, parsing, company details, quotes, simulation, FX,
+downsampling, serialization, rendering) is reported next to the wall time.
+
+With --baseline, cases whose median time or memory peak grew by more than
+``--tolerance`` compared with a saved run are reported as regressions and the
+command exits with status 1.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+CURRENCY_SUFFIXES = {"USD": "", "CAD": ".TO", "INR": ".NS"}
+COMPARISON = "^IXIC"
+
+
+def synthetic_portfolio(tickers, years, transactions, seed=0):
+    """
+    Returns a portfolio of ``tickers`` tickers spread over USD, CAD and INR with
+    ``transactions`` random buys and sells over the last ``years`` years; a
+    ticker is never sold short.
+    """
+    rng = np.random.default_rng(seed)
+    currencies = list(CURRENCY_SUFFIXES)
+    names = [
+        f"B{i:03d}{CURRENCY_SUFFIXES[currencies[i % len(currencies)]]}" for i in range(tickers)
+    ]
+    end = pd.Timestamp(datetime.today()).normalize() - pd.offsets.BDay(1)
+    days = pd.bdate_range(end - pd.DateOffset(years=years), end)
+    dates = np.sort(rng.choice(len(days), transactions))
+    holdings = defaultdict(int)
+    portfolio = {currency: {} for currency in currencies}
+    for i, day in enumerate(dates):
+        ticker = names[rng.integers(len(names))]
+        currency = currencies[names.index(ticker) % len(currencies)]
+        if holdings[ticker] > 0 and rng.random() < 0.4:
+            txn_type, quantity = "sell", int(rng.integers(1, holdings[ticker] + 1))
+            holdings[ticker] -= quantity
+        else:
+            txn_type, quantity = "buy", int(rng.integers(1, 100))
+            holdings[ticker] += quantity
+        hour = days[day] + pd.Timedelta(hours=14 + int(rng.integers(0, 6)))
+        portfolio[currency].setdefault(ticker, []).append(
+            {
+                "type": txn_type,
+                "date": hour.strftime("%Y-%m-%d %H:%M:%S"),
+                "quantity": quantity,
+                "price": round(float(rng.uniform(5, 500)), 2),
+            }
+        )
+    return {currency: tickers for currency, tickers in portfolio.items() if tickers}
+
+
+@contextmanager
+def stage_timing(stages):
+    """
+    Wraps the functions of ``stages`` ((module, attribute, stage name) tuples)
+    so the seconds spent in them are added up per stage name while the context
+    is active. Calls made on other threads are counted too.
+    """
+    totals = defaultdict(float)
+    originals = []
+    for module, attribute, name in stages:
+        original = getattr(module, attribute)
+
+        def timed(*args, _original=original, _name=name, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                totals[_name] += time.perf_counter() - start
+
+        originals.append((module, attribute, original))
+        setattr(module, attribute, timed)
+    try:
+        yield totals
+    finally:
+        for module, attribute, original in reversed(originals):
+            setattr(module, attribute, original)
+
+
+def measure(run, setup, stages, repeat):
+    """
+    Times ``run()`` ``repeat`` times after a warm-up run, calling ``setup()``
+    before every run, then runs it once more under tracemalloc.
+
+    Returns:
+        dict: median and min seconds, peak memory in bytes and the median
+        seconds per stage.
+    """
+    setup()
+    run()
+    times = []
+    stage_times = defaultdict(list)
+    for _ in range(repeat):
+        setup()
+        with stage_timing(stages) as totals:
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        for name, seconds in totals.items():
+            stage_times[name].append(seconds)
+
+    setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "peak": peak,
+        "stages": {name: statistics.median(seconds) for name, seconds in stage_times.items()},
+    }
+
+
+def print_results(results):
+    print(f"{'case':<24} {'median':>10} {'min':>10} {'peak':>10}   stages (median ms)")
+    for case, result in results.items():
+        stages = ", ".join(
+            f"{name} {seconds * 1000:.1f}"
+            for name, seconds in sorted(result["stages"].items(), key=lambda item: -item[1])
+        )
+        print(
+            f"{case:<24} {result['median'] * 1000:8.1f}ms {result['min'] * 1000:8.1f}ms"
+            f" {result['peak'] / 2**20:8.1f}MB   {stages}"
+        )
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Returns a description of every case whose median time or memory peak grew
+    by more than ``tolerance`` (a fraction) compared with ``baseline``.
+    """
+    found = []
+    for case, result in results.items():
+        before = baseline.get(case)
+        if before is None:
+            continue
+        for metric in ("median", "peak"):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                found.append(
+                    f"{case} {metric}: {before[metric]:.4g} -> {result[metric]:.4g}"
+                    f" (+{(result[metric] / before[metric] - 1) * 100:.0f}%)"
+                )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analytics hot paths on offline data.")
+    parser.add_argument("--tickers", type=int, default=12, help="Tickers in the synthetic portfolio.")
+    parser.add_argument("--years", type=int, default=3, help="Years of history.")
+    parser.add_argument("--transactions", type=int, default=1000, help="Transactions in the portfolio.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--case", nargs="+", help="Cases to run (default: all but generate_report with --no-report)."
+    )
+    parser.add_argument("--no-report", action="store_true", help="Skip the PDF report case.")
+    parser.add_argument("--save", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with results saved by --save.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed growth over the baseline.")
+    args = parser.parse_args()
+
+    # The stores are module singletons opened on import, so they are pointed at
+    # a scratch directory before the analytics modules are imported
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    os.environ["PRICE_STORE_PATH"] = os.path.join(workdir, "prices.sqlite")
+    os.environ["SERIES_STORE_PATH"] = os.path.join(workdir, "series.sqlite")
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    import fx
+    import market_data
+    import price_store
+    import report
+    import report_pages
+    import rollforward
+
+    portfolio = synthetic_portfolio(args.tickers, args.years, args.transactions, args.seed)
+    tickers = [ticker for currency in portfolio.values() for ticker in currency]
+    start = report.get_start_date(portfolio) - timedelta(days=7)
+    fixtures = os.path.join(workdir, "fixtures")
+    market_data.write_synthetic_fixtures(
+        fixtures, tickers + [COMPARISON], start, datetime.today(), seed=args.seed
+    )
+    market_data.set_provider(market_data.FixtureProvider(fixtures))
+
+    stages = [
+        (price_store.PriceStore, "refresh", "price_store.refresh"),
+        (price_store.PriceStore, "get_closes_frame", "price_store.read"),
+        (report, "parse_portfolio", "parse"),
+        (report, "get_stock_details_many", "details"),
+        (report, "get_quote", "quotes"),
+        (rollforward, "_simulate", "simulate"),
+        (fx.FxRateTable, "rates", "fx"),
+        (report, "downsample_indices", "downsample"),
+        (report, "encode_frame", "serialize"),
+        (report, "encode_series", "serialize"),
+        (report, "figure_pdf", "render"),
+        # Only functions called in this process are wrapped: the pages drawn
+        # by the report's worker processes are timed while they are collected
+        (report, "collect_ticker_pages", "render"),
+        (report, "write_pdf", "render"),
+    ]
+
+    def fresh_analytics():
+        report.analytics_cache.clear()
+        report.ledger_cache.clear()
+
+    def fresh_series():
+        fresh_analytics()
+        rollforward.series_store.clear()
+
+    def serialized(compute):
+        return lambda: json.dumps(compute(), default=list)
+
+    last_close = {
+        ticker: float(price_store.price_store.get_closes(ticker, start, datetime.today()).iloc[-1])
+        for ticker in tickers
+    }
+    ledger = report.get_ledger(portfolio)
+    report_file = os.path.join(workdir, "report")
+    cases = {
+        "comparison_full": (
+            serialized(lambda: report.get_comparison_data(portfolio, COMPARISON)),
+            fresh_series,
+        ),
+        "comparison_rollforward": (
+            serialized(lambda: report.get_comparison_data(portfolio, COMPARISON)),
+            fresh_analytics,
+        ),
+        "comparison_columnar": (
+            serialized(
+                lambda: report.get_comparison_data(portfolio, COMPARISON, "columnar", points=1000)
+            ),
+            fresh_analytics,
+        ),
+        "portfolio_performances": (
+            serialized(lambda: report.get_portfolio_performances(portfolio)),
+            lambda: None,
+        ),
+        "calc_ticker_performance": (
+            lambda: [
+                report.calc_ticker_performance(ledger.for_ticker(ticker), last_close[ticker], currency)
+                for ticker, currency in ledger.currencies.items()
+            ],
+            lambda: None,
+        ),
+        "generate_report": (
+            lambda: report.generate_report(
+                portfolio, report.get_start_date(portfolio),
+                datetime.today() + timedelta(days=1), 26, report_file,
+            ),
+            fresh_analytics,
+        ),
+    }
+    selected = args.case or [
+        case for case in cases if not (args.no_report and case == "generate_report")
+    ]
+
+    print(
+        f"{sum(len(txns) for currency in portfolio.values() for txns in currency.values())} transactions,"
+        f" {len(tickers)} tickers, {args.years} years, {args.repeat} runs per case,"
+        f" {report_pages.REPORT_WORKERS} report workers"
+    )
+    results = {}
+    for case in selected:
+        run, setup = cases[case]
+        results[case] = measure(run, setup, stages, args.repeat)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for regression in found:
+            print(f"Regression: {regression}")
+        raise SystemExit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Columnar encoding of time series for the JSON endpoints.
+
+``DataFrame.to_json()`` repeats every timestamp as an object key in every
+series and is embedded as a string, so the client has to parse it twice and
+rebuild the arrays from the keys. The columnar encoding sends the dates once, as
+epoch milliseconds shared by all series of a payload, followed by one plain
+array of values per series (NaN is encoded as null).
+"""
+import numpy as np
+import pandas as pd
+
+FORMATS = ("json", "columnar")
+
+
+def parse_format(value):
+    """
+    Returns the series format requested by a client, defaulting to "json" (the
+    ``to_json()`` strings) for unknown values.
+    """
+    return value if value in FORMATS else "json"
+
+
+def epoch_ms(index):
+    """
+    Returns the dates of ``index`` as epoch milliseconds, the keys ``to_json()``
+    uses for naive timestamps.
+    """
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return (index.to_numpy(dtype="datetime64[ns]").astype(np.int64) // 1_000_000).tolist()
+
+
+def encode_values(series):
+    """
+    Returns the values of ``series`` as a list of floats, with None for NaN.
+    Values are rounded to the 10 decimals ``to_json()`` keeps.
+    """
+    array = np.round(np.asarray(series, dtype=float), 10)
+    return np.where(np.isnan(array), None, array).tolist()
+
+
+def encode_series(series):
+    """
+    Encodes one series as {"index": [...], "values": [...]}.
+    """
+    return {"index": epoch_ms(series.index), "values": encode_values(series)}
+
+
+def encode_frame(columns, index):
+    """
+    Encodes several series sharing ``index`` as {"index": [...], name: [...], ...}.
+
+    Args:
+        columns (dict): The series (or arrays) aligned with ``index``, by name.
+        index (pd.DatetimeIndex): The dates shared by all series.
+
+    Returns:
+        dict: The epoch-millisecond index and one list of values per name.
+    """
+    encoded = {"index": epoch_ms(index)}
+    for name, column in columns.items():
+        encoded[name] = encode_values(column)
+    return encoded
@@ -0,0 +1,37 @@
+"""
+Shared fixtures of the tests: synthetic market data (see
+market_data.write_synthetic_fixtures) served from in-memory stores.
+"""
+import pytest
+
+import market_data
+import report
+import rollforward
+from market_data import FixtureProvider, set_provider, write_synthetic_fixtures
+from price_store import PriceStore
+from rollforward import SeriesStore
+
+
+@pytest.fixture(scope="session")
+def fixtures(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("fixtures")
+    write_synthetic_fixtures(directory, ["AAA", "BBB.TO", "^IXIC"], "2023-12-01", "2025-01-31")
+    # A ticker delisted in March 2024
+    write_synthetic_fixtures(directory, ["OLD"], "2023-12-01", "2024-03-28", seed=1)
+    return directory
+
+
+@pytest.fixture
+def market(fixtures, monkeypatch):
+    """
+    Serves the synthetic market data from in-memory stores.
+    """
+    previous = market_data._provider
+    set_provider(FixtureProvider(str(fixtures)))
+    store = PriceStore(":memory:")
+    monkeypatch.setattr(rollforward, "price_store", store)
+    monkeypatch.setattr(report, "price_store", store)
+    monkeypatch.setattr(rollforward, "series_store", SeriesStore(":memory:"))
+    report.analytics_cache.clear()
+    yield store
+    set_provider(previous)
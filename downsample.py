@@ -0,0 +1,169 @@
+"""
+Shape-preserving downsampling of time series for charts.
+
+A chart a few hundred pixels wide cannot show more than a few points per pixel,
+so long histories are reduced on the server before they are sent:
+
+- a single line is reduced with Largest-Triangle-Three-Buckets (LTTB), which
+  keeps the points that contribute most to the line's shape;
+- several series sharing one index (line and bar charts drawn together) are
+  reduced with min/max bucketing, which keeps every series' extremes per bucket
+  so spikes and drops survive.
+
+With a viewport, the rows inside it get the full point budget and the rows
+outside a small one, so the range slider still shows the whole history.
+"""
+import numpy as np
+import pandas as pd
+
+# Share of the point budget used for the rows outside the viewport, on each side.
+CONTEXT_SHARE = 0.1
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Returns the positions of the ``threshold`` points LTTB keeps of the line (x, y).
+
+    Args:
+        x (np.ndarray): Increasing x values.
+        y (np.ndarray): The y values (NaN is never preferred).
+        threshold (int): The number of points to keep.
+
+    Returns:
+        np.ndarray: Increasing positions, always including the first and last.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # threshold - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_hi = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        with np.errstate(all="ignore"):
+            avg_y = np.nanmean(y[hi:next_hi]) if not np.isnan(y[hi:next_hi]).all() else y[selected]
+            area = np.abs(
+                (x[selected] - avg_x) * (y[lo:hi] - y[selected])
+                - (x[selected] - x[lo:hi]) * (avg_y - y[selected])
+            )
+        selected = lo + int(np.argmax(np.where(np.isnan(area), -1.0, area)))
+        keep[bucket + 1] = selected
+    return keep
+
+
+def minmax_indices(columns, n, buckets):
+    """
+    Returns the positions of the minimum and maximum of every column in each of
+    ``buckets`` equal-width buckets, plus the first and last position.
+
+    Args:
+        columns (list): Arrays of length ``n``.
+        n (int): The number of rows.
+        buckets (int): The number of buckets.
+
+    Returns:
+        np.ndarray: Increasing unique positions.
+    """
+    if buckets * 2 >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    keep = [np.array([0, n - 1])]
+    for values in columns:
+        values = np.asarray(values, dtype=float)
+        missing = np.isnan(values)
+        # Sorted by bucket, then value, the first row of each bucket is its extreme
+        lowest = np.lexsort((np.where(missing, np.inf, values), bucket))[starts]
+        highest = np.lexsort((np.where(missing, np.inf, -values), bucket))[starts]
+        keep += [lowest, highest]
+    return np.unique(np.concatenate(keep))
+
+
+def _reduce(x, columns, points):
+    n = len(x)
+    if points is None or n <= points:
+        return np.arange(n)
+    if points <= 0:
+        return np.arange(0)
+    if len(columns) == 1:
+        return lttb_indices(x, columns[0], points)
+    # The series' extremes often coincide, so start from as many buckets as
+    # one series needs and use fewer until the union fits the budget
+    buckets = max(1, points // 2)
+    keep = minmax_indices(columns, n, buckets)
+    while len(keep) > points and buckets > 1:
+        buckets = max(1, min(buckets - 1, buckets * points // len(keep)))
+        keep = minmax_indices(columns, n, buckets)
+    return keep
+
+
+def downsample_indices(index, columns, points=None, view=None):
+    """
+    Returns the positions of the rows to send for a chart of ``points`` points.
+
+    Args:
+        index (pd.DatetimeIndex): The dates shared by the series.
+        columns (list): The series (or arrays) aligned with ``index``.
+        points (int, optional): The target number of points, or None to keep
+            every row.
+        view (tuple, optional): (start, end) of the viewport; either may be None.
+            Rows outside it are reduced to a small share of ``points``, or
+            dropped if ``points`` is None.
+
+    Returns:
+        np.ndarray: Increasing positions into ``index``.
+    """
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    x = index.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    columns = [np.asarray(column, dtype=float) for column in columns]
+    positions = np.arange(len(index))
+
+    if view is None:
+        segments = [(positions, points)]
+    else:
+        start, end = view
+        after_start = index >= start if start is not None else np.ones(len(index), dtype=bool)
+        before_end = index <= end if end is not None else np.ones(len(index), dtype=bool)
+        context = int(points * CONTEXT_SHARE) if points is not None else 0
+        segments = [
+            (positions[~after_start], context),
+            (positions[after_start & before_end], points),
+            (positions[~before_end], context),
+        ]
+
+    keep = []
+    for rows, budget in segments:
+        if len(rows):
+            keep.append(rows[_reduce(x[rows], [column[rows] for column in columns], budget)])
+    return np.concatenate(keep) if keep else positions[:0]
+
+
+def parse_view(value):
+    """
+    Parses a viewport given as [start, end] (dates or epoch milliseconds, either
+    may be null) or "start,end", returning (start, end) Timestamps or None.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if len(value) != 2:
+        return None
+    bounds = []
+    for bound in value:
+        if bound is None or bound == "":
+            bounds.append(None)
+        elif isinstance(bound, (int, float)) or str(bound).isdigit():
+            bounds.append(pd.Timestamp(int(bound), unit="ms"))
+        else:
+            bounds.append(pd.Timestamp(bound).tz_localize(None))
+    return tuple(bounds)
@@ -2,7 +2,7 @@
 import { use, useEffect, useState } from 'react';
 import Plot from 'react-plotly.js';
 import CardWidget from './CardWidget';
-import { info_layout, info_txt_layout, layout } from './constants';
+import { chart_points, info_layout, info_txt_layout, layout, portfolio_id, relayout_range } from './constants';
 // import '../styles/Dashboard.css';
 
 const comp_indices = [
@@ -37,127 +37,152 @@ function ComparisonWidget() {
     const [ revision, setRevision ] = useState(0);
     const [ selectedIndex, setselectedIndex ] = useState("^IXIC");
     const [ summaries, setSummaries ] = useState([]);
+    const [ data, setData ] = useState(null);
+    const [ view, setView ] = useState(null);
 
     useEffect(() => {
-        // Simulating data fetch
+        // Fetch the portfolio with every comparison index, downsampled for the
+        // charts and at full resolution inside the zoomed range
         const fetchData = async () => {
-            console.log(selectedIndex)
             const res = await fetch('http://localhost:3000/comparison', {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
                 },
-                body: JSON.stringify({ "comparison": selectedIndex }),
+                body: JSON.stringify({
+                    "portfolio": portfolio_id,
+                    "comparisons": comp_indices.map(index => index.ticker),
+                    "format": "columnar",
+                    "points": chart_points,
+                    "range": view,
+                }),
             }); // Replace with actual API endpoint
             const data = await res.json(); // Assuming the API returns JSON data
             console.log(data);
-            const investment_comp = JSON.parse(data.investment_comp);
-            const pnl_data = JSON.parse(data.pnl_data);
-            const revenue = [
-                {
-                    x: Object.keys(investment_comp[ 0 ]).map(date => new Date(parseInt(date))),
-                    y: Object.values(investment_comp[ 0 ]),
-                    type: 'scatter',
-                    mode: 'lines',
-                    marker: { color: 'cornflowerblue' },
-                    // fill: 'tozeroy',
-                    name: 'Portfolio Value (CAD)',
-                    hoverinfo: "x+y"
-                },
-                {
-                    x: Object.keys(investment_comp[ 1 ]).map(date => new Date(parseInt(date))),
-                    y: Object.values(investment_comp[ 1 ]),
-                    type: 'scatter',
-                    mode: 'lines',
-                    marker: { color: 'orange' },
-                    // fill: 'tozeroy',
-                    name: 'Cash Invested (CAD)'
-                },
-                {
-                    x: Object.keys(investment_comp[ 2 ]).map(date => new Date(parseInt(date))),
-                    y: Object.values(investment_comp[ 2 ]),
-                    type: 'scatter',
-                    mode: 'lines',
-                    marker: { color: 'seagreen' },
-                    // fill: 'tozeroy',
-                    name: 'Comparison Value (CAD)'
-                },
-            ];
-
-            const pnl = [
-                {
-                    x: Object.keys(pnl_data[ 0 ]).map(date => new Date(parseInt(date))),
-                    y: Object.values(pnl_data[ 0 ]),
-                    type: 'bar',
-                    // mode: 'lines+markers',
-                    marker: { color: Object.values(pnl_data[ 0 ]).map(value => value >= 0 ? 'green' : 'darkgreen') },
-                    // fill: 'tozeroy',
-                    name: 'Portfolio Daily % PnL'
-                },
-                {
-                    x: Object.keys(pnl_data[ 1 ]).map(date => new Date(parseInt(date))),
-                    y: Object.values(pnl_data[ 1 ]),
-                    type: 'bar',
-                    // mode: 'lines+markers',
-                    marker: { color: Object.values(pnl_data[ 0 ]).map(value => value >= 0 ? 'orange' : 'darkorange') },
-                    // fill: 'tozeroy',
-                    name: 'Comparison % PnL'
-                }
-            ];
-
-            const comp = [ {
-                labels: data.composition.labels,
-                values: data.composition.sizes,
-                type: 'pie',
-                textinfo: 'label',
-                // insidetextorientation: 'radial',
-                // marker: {
-                //     colors: [
-                //         '#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A', '#19d3f3',
-                //         '#FF6692', '#B6E880', '#FF97FF', '#FECB52'
-                //     ]
-                // },
-                name: 'Portfolio Composition',
-                textposition: "outside",
-            } ]
-
-            var portfolio_info = [
-                {
-                    type: "indicator",
-                    mode: "number",
-                    value: data.info.cash_invested,
-                    number: { prefix: "$", suffix: " CAD" },
-                    // delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
-                },
-                {
-                    type: "indicator",
-                    mode: "number+delta",
-                    value: data.info.portfolio_value,
-                    number: { prefix: "$", suffix: " CAD" },
-                    delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
-                },
-                {
-                    type: "indicator",
-                    mode: "number+delta",
-                    value: data.info.comp_value,
-                    number: { prefix: "$", suffix: " CAD" },
-                    delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
-                },
-            ];
-
-            setRevenueData(revenue);
-            setPnlData(pnl);
-            setCompositionData(comp);
-            setInfo(portfolio_info);
-            setSummaries(data.summaries);
-            setRevision(prev => prev + 1); // Trigger re-render
+            setData(data);
         };
 
         fetchData();
 
         return () => {
         }
-    }, [ selectedIndex ])
+    }, [ view ])
+
+    const onRelayout = (event) => {
+        const range = relayout_range(event);
+        if (range !== undefined) {
+            setView(range);
+        }
+    };
+
+    useEffect(() => {
+        // Switching the comparison index only swaps the comparison series
+        if (!data) {
+            return;
+        }
+        console.log(selectedIndex)
+        const benchmark = data.benchmarks[ selectedIndex ];
+        // All series share one index of epoch milliseconds
+        const dates = data.series.index.map(date => new Date(date));
+        const revenue = [
+            {
+                x: dates,
+                y: data.series.portfolio_value,
+                type: 'scatter',
+                mode: 'lines',
+                marker: { color: 'cornflowerblue' },
+                // fill: 'tozeroy',
+                name: 'Portfolio Value (CAD)',
+                hoverinfo: "x+y"
+            },
+            {
+                x: dates,
+                y: data.series.cash_invested,
+                type: 'scatter',
+                mode: 'lines',
+                marker: { color: 'orange' },
+                // fill: 'tozeroy',
+                name: 'Cash Invested (CAD)'
+            },
+            {
+                x: dates,
+                y: benchmark.value,
+                type: 'scatter',
+                mode: 'lines',
+                marker: { color: 'seagreen' },
+                // fill: 'tozeroy',
+                name: 'Comparison Value (CAD)'
+            },
+        ];
+
+        const pnl = [
+            {
+                x: dates,
+                y: data.series.pnl,
+                type: 'bar',
+                // mode: 'lines+markers',
+                marker: { color: data.series.pnl.map(value => value >= 0 ? 'green' : 'darkgreen') },
+                // fill: 'tozeroy',
+                name: 'Portfolio Daily % PnL'
+            },
+            {
+                x: dates,
+                y: benchmark.pnl,
+                type: 'bar',
+                // mode: 'lines+markers',
+                marker: { color: data.series.pnl.map(value => value >= 0 ? 'orange' : 'darkorange') },
+                // fill: 'tozeroy',
+                name: 'Comparison % PnL'
+            }
+        ];
+
+        const comp = [ {
+            labels: data.composition.labels,
+            values: data.composition.sizes,
+            type: 'pie',
+            textinfo: 'label',
+            // insidetextorientation: 'radial',
+            // marker: {
+            //     colors: [
+            //         '#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A', '#19d3f3',
+            //         '#FF6692', '#B6E880', '#FF97FF', '#FECB52'
+            //     ]
+            // },
+            name: 'Portfolio Composition',
+            textposition: "outside",
+        } ]
+
+        var portfolio_info = [
+            {
+                type: "indicator",
+                mode: "number",
+                value: data.info.cash_invested,
+                number: { prefix: "$", suffix: " CAD" },
+                // delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
+            },
+            {
+                type: "indicator",
+                mode: "number+delta",
+                value: data.info.portfolio_value,
+                number: { prefix: "$", suffix: " CAD" },
+                delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
+            },
+            {
+                type: "indicator",
+                mode: "number+delta",
+                value: benchmark.comp_value,
+                number: { prefix: "$", suffix: " CAD" },
+                delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
+            },
+        ];
+
+        setRevenueData(revenue);
+        setPnlData(pnl);
+        setCompositionData(comp);
+        setInfo(portfolio_info);
+        setSummaries(data.summaries);
+        setRevision(prev => prev + 1); // Trigger re-render
+    }, [ data, selectedIndex ])
 
 
 
@@ -239,7 +264,8 @@ function ComparisonWidget() {
                 <CardWidget style={ { gridColumn: "1 / span 2", gridRow: "3 / span 2" } } title={ "Portfolio Value vs Cash Invested vs Comparison Index" }>
                     <Plot
                         data={ revenueData }
-                        layout={ { ...layouts[ 1 ] } }
+                        layout={ { ...layouts[ 1 ], uirevision: "comparison" } }
+                        onRelayout={ onRelayout }
                         useResizeHandler={ true }
                         config={ { responsive: true, displaylogo: false } }
                         style={ { width: "100%", height: "100%" } }
@@ -249,7 +275,8 @@ function ComparisonWidget() {
                 <CardWidget style={ { gridColumn: "3 / span 2", gridRow: "3 / span 2", height: "27vw" } } title={ "Daily PnL Chart" }>
                     <Plot
                         data={ pnlData }
-                        layout={ { ...layouts[ 2 ] } }
+                        layout={ { ...layouts[ 2 ], uirevision: "comparison" } }
+                        onRelayout={ onRelayout }
                         useResizeHandler={ true }
                         config={ { responsive: true, displaylogo: false } }
                         style={ { width: "100%", height: "100%" } }
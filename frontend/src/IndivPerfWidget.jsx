@@ -1,7 +1,7 @@
 
 import { use, useEffect, useState } from 'react';
 import Plot from 'react-plotly.js';
-import { info_layout, info_txt_layout, layout } from './constants';
+import { chart_points, info_layout, info_txt_layout, layout, portfolio_id, range_interval, relayout_range } from './constants';
 import CardWidget from './CardWidget';
 // import '../styles/Dashboard.css';
 
@@ -10,81 +10,90 @@ function IndividualPerfWidget() {
     const [ perfData, setPerfData ] = useState({});
     const [ revision, setRevision ] = useState(0);
     const [ layouts, setLayouts ] = useState({});
+    const [ view, setView ] = useState(null);
 
     useEffect(() => {
         // Simulating data fetch
         const fetchData = async () => {
-            const res = await fetch('http://localhost:3000/indiv_performance', {
+            const params = new URLSearchParams({ portfolio: portfolio_id, format: "columnar", points: chart_points, interval: range_interval(view) });
+            if (view) {
+                params.set("range", view.join(","));
+            }
+            // Each ticker arrives on its own line as soon as it is ready
+            const res = await fetch(`http://localhost:3000/indiv_performance/stream?${params}`, {
                 method: "GET",
-                // headers: {
-                //     "Content-Type": "application/json",
-                // },
-                // body: JSON.stringify({ "comparison": selectedIndex }),
-            }); // Replace with actual API endpoint
-            const data = await res.json(); // Assuming the API returns JSON data
-            console.log(data);
-            const new_perf_data = {}
-            const new_layouts = {};
-            for (let currency in data) {
-                new_perf_data[ currency ] = {};
-                new_layouts[ currency ] = {};
-                for (let ticker in data[ currency ]) {
-                    const invested = data[ currency ][ ticker ][ 'performance' ][ 'total_invested' ];
-                    const final = data[ currency ][ ticker ][ 'performance' ][ 'final_value' ];
-                    const prices = JSON.parse(data[ currency ][ ticker ][ 'prices' ]);
-                    const transactions = data[ currency ][ ticker ][ 'transactions' ];
-                    new_perf_data[ currency ][ ticker ] = {
-                        info: {
-                            invested: [ {
-                                type: "indicator",
-                                mode: "number",
-                                value: invested,
-                                number: { prefix: "$", suffix: " CAD" },
-                                // delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
-                            } ],
-                            final: [ {
-                                type: "indicator",
-                                mode: "number+delta",
-                                value: final,
-                                number: { prefix: "$", suffix: " CAD" },
-                                delta: { reference: invested, relative: true, position: "bottom" }
-                            } ],
-                        },
-                        prices: [
-                            {
-                                x: Object.keys(prices).map(date => new Date(parseInt(date))),
-                                y: Object.values(prices),
-                                type: 'scatter',
-                                mode: 'lines',
-                                marker: { color: 'white' },
-                                // fill: 'tozeroy',
-                                name: `${ticker} Prices (CAD)`,
-                                hoverinfo: "x+y"
-                            },
-                            {
-                                x: transactions.map(tx => Date.parse(tx.date)),
-                                y: transactions.map(tx => tx.price),
-                                type: 'scatter',
-                                mode: 'markers',
-                                marker: {
-                                    color:
-                                        transactions.map(tx => tx.type === 'buy' ? 'green' : 'red'),
-                                },
-                                // fill: 'tozeroy',
-                                name: 'Transactions',
-                                text: transactions.map(tx => `${tx.type} $${tx.price} (${tx.quantity})`),
-                                hoverinfo: "text",
-                            },
-                        ],
-                    };
-
-                    new_layouts[ currency ][ ticker ] = {
-                        ...layout
+            });
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split("\n");
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) {
+                        addTicker(JSON.parse(line));
                     }
                 }
             }
-            setPerfData(new_perf_data);
-            setLayouts(new_layouts); // Assuming each item has a layout property
+        };
+
+        const addTicker = ({ currency, ticker, performance: result }) => {
+            const invested = result[ 'performance' ][ 'total_invested' ];
+            const final = result[ 'performance' ][ 'final_value' ];
+            const prices = result[ 'prices' ];
+            const markers = result[ 'markers' ];
+            const ticker_data = {
+                info: {
+                    invested: [ {
+                        type: "indicator",
+                        mode: "number",
+                        value: invested,
+                        number: { prefix: "$", suffix: " CAD" },
+                        // delta: { reference: data.info.cash_invested, relative: true, position: "bottom" }
+                    } ],
+                    final: [ {
+                        type: "indicator",
+                        mode: "number+delta",
+                        value: final,
+                        number: { prefix: "$", suffix: " CAD" },
+                        delta: { reference: invested, relative: true, position: "bottom" }
+                    } ],
+                },
+                prices: [
+                    {
+                        x: prices.index.map(date => new Date(date)),
+                        y: prices.values,
+                        type: 'scatter',
+                        mode: 'lines',
+                        marker: { color: 'white' },
+                        // fill: 'tozeroy',
+                        name: `${ticker} Prices (CAD)`,
+                        hoverinfo: "x+y"
+                    },
+                    {
+                        x: markers.map(m => new Date(m.date)),
+                        y: markers.map(m => m.price),
+                        type: 'scatter',
+                        mode: 'markers',
+                        marker: {
+                            color:
+                                markers.map(m => m.type === 'buy' ? 'green' : 'red'),
+                        },
+                        // fill: 'tozeroy',
+                        name: 'Transactions',
+                        text: markers.map(m => `${m.type} $${m.price} (${m.quantity})`),
+                        hoverinfo: "text",
+                    },
+                ],
+            };
+
+            setPerfData(prev => ({ ...prev, [ currency ]: { ...prev[ currency ], [ ticker ]: ticker_data } }));
+            setLayouts(prev => ({ ...prev, [ currency ]: { ...prev[ currency ], [ ticker ]: { ...layout, uirevision: ticker } } }));
             setRevision(prev => prev + 1); // Trigger re-render
         };
 
@@ -92,7 +101,14 @@ function IndividualPerfWidget() {
 
         return () => {
         }
-    }, []);
+    }, [ view ]);
+
+    const onRelayout = (event) => {
+        const range = relayout_range(event);
+        if (range !== undefined) {
+            setView(range);
+        }
+    };
 
 
     return (
@@ -130,6 +146,7 @@ function IndividualPerfWidget() {
                                         <Plot
                                             data={ perfData[ currency ][ ticker ].prices }
                                             layout={ layouts[ currency ][ ticker ] }
+                                            onRelayout={ onRelayout }
                                             useResizeHandler={ true }
                                             config={ { responsive: true, displaylogo: false } }
                                             style={ { width: "100%", height: "100%" } }
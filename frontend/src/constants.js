@@ -62,4 +62,43 @@ export const layout = {
 };
 
 export const info_layout = { paper_bgcolor: "transparent", plot_bgcolor: "transparent", font: { color: "white" } };
-export const info_txt_layout = { paper_bgcolor: "transparent", plot_bgcolor: "transparent", font: { color: "white" }, margin: { t: 40, l: 40, r: 40, b: 40 } };
\ No newline at end of file
+export const info_txt_layout = { paper_bgcolor: "transparent", plot_bgcolor: "transparent", font: { color: "white" }, margin: { t: 40, l: 40, r: 40, b: 40 } };
+
+// Number of points requested per chart; longer series are downsampled by the server
+export const chart_points = 1000;
+
+// Portfolio shown by the dashboard, chosen with ?portfolio=<id> (the backend's
+// default portfolio otherwise)
+export const portfolio_id = new URLSearchParams(window.location.search).get("portfolio") || "default";
+
+// Returns the x-axis range [ start, end ] set by zooming, the range selector or the
+// range slider, null when the axis is reset to the whole series, and undefined for
+// any other layout change.
+export function relayout_range(event) {
+    if (event[ 'xaxis.autorange' ]) {
+        return null;
+    }
+    if (event[ 'xaxis.range' ]) {
+        return event[ 'xaxis.range' ];
+    }
+    if (event[ 'xaxis.range[0]' ] !== undefined) {
+        return [ event[ 'xaxis.range[0]' ], event[ 'xaxis.range[1]' ] ];
+    }
+    return undefined;
+}
+
+// Bar size requested for an x-axis range: session bars when zoomed into a few
+// weeks or months, daily closes otherwise (null is the whole series)
+export function range_interval(range) {
+    if (!range) {
+        return "1d";
+    }
+    const days = (new Date(range[ 1 ]) - new Date(range[ 0 ])) / 86400000;
+    if (days <= 21) {
+        return "15m";
+    }
+    if (days <= 120) {
+        return "1h";
+    }
+    return "1d";
+}
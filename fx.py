@@ -0,0 +1,95 @@
+"""
+Currency conversion rates.
+
+Instead of calling ``CurrencyConverter.convert`` for every holding on every
+day, rates are materialized once as a dense daily series per currency pair and
+looked up with whole date arrays.
+"""
+import numpy as np
+import pandas as pd
+from currency_converter import CurrencyConverter
+
+from cache import LRUCache
+from metrics import timed
+
+currencyConverter = CurrencyConverter(
+    fallback_on_missing_rate=True,
+    fallback_on_missing_rate_method="last_known",
+    fallback_on_wrong_date=True,
+)
+
+
+class FxRateTable:
+    """
+    Dense daily conversion rates per (currency, target) pair.
+
+    Each pair's series covers the widest date range requested so far and is
+    extended on demand; the least recently used pairs are evicted once more
+    than ``maxsize`` are held.
+    """
+
+    def __init__(self, converter=currencyConverter, maxsize=32):
+        self.converter = converter
+        self._series = LRUCache(maxsize)
+
+    def _convert_days(self, currency, target, start, end):
+        days = pd.date_range(start, end, freq="D")
+        return pd.Series(
+            [self.converter.convert(1, currency, target, date=day.date()) for day in days],
+            index=days,
+            dtype=float,
+        )
+
+    def series(self, currency, start, end, target="CAD"):
+        """
+        Returns the daily rate converting ``currency`` to ``target`` for every
+        date from ``start`` to ``end`` (inclusive).
+        """
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        if currency == target:
+            return pd.Series(1.0, index=pd.date_range(start, end, freq="D"))
+
+        key = (currency, target)
+        rates = self._series.get(key)
+        if rates is None:
+            rates = self._convert_days(currency, target, start, end)
+        else:
+            parts = [rates]
+            if start < rates.index[0]:
+                parts.insert(0, self._convert_days(currency, target, start, rates.index[0] - pd.Timedelta(days=1)))
+            if end > rates.index[-1]:
+                parts.append(self._convert_days(currency, target, rates.index[-1] + pd.Timedelta(days=1), end))
+            rates = pd.concat(parts) if len(parts) > 1 else rates
+        self._series.set(key, rates)
+        return rates.loc[start:end]
+
+    @timed("fx")
+    def rates(self, currency, dates, target="CAD"):
+        """
+        Returns the rates converting ``currency`` to ``target`` on each of ``dates``.
+
+        Args:
+            currency (str): The currency to convert from (e.g., 'USD').
+            dates: Array-like of dates.
+            target (str): The currency to convert to.
+
+        Returns:
+            np.ndarray: One rate per date.
+        """
+        dates = pd.DatetimeIndex(dates).normalize()
+        if len(dates) == 0:
+            return np.empty(0)
+        if currency == target:
+            return np.ones(len(dates))
+        series = self.series(currency, dates.min(), dates.max(), target)
+        return series.reindex(dates).to_numpy()
+
+    def rate(self, currency, date, target="CAD"):
+        """
+        Returns the rate converting ``currency`` to ``target`` on ``date``.
+        """
+        return float(self.rates(currency, [date], target)[0])
+
+
+fx_table = FxRateTable()
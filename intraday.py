@@ -0,0 +1,356 @@
+"""
+Intraday price bars.
+
+Bars are fetched at the coarsest interval the provider serves that divides the
+one asked for, kept to the regular sessions of the ticker's exchange (weekdays,
+between the open and the close in the exchange's own timezone; holidays simply
+have no bars) and resampled to coarser bars on the server, so a "4h" chart is
+built from "1h" bars and a "45m" one from "15m" bars.
+
+The fetched bars of every (ticker, interval) are held over the widest range of
+days requested so far and extended on demand, like the daily closes of the
+price store, and every resolution resampled from them is kept until they
+change. Zooming into a chart therefore resamples bars already held instead of
+downloading them again.
+"""
+import os
+import re
+import threading
+import time
+from datetime import date, time as dtime, timedelta
+
+import pandas as pd
+
+from cache import LRUCache
+from market_data import OHLCV_COLUMNS, get_provider
+from metrics import market_data_calls_total, stage
+
+# Seconds after which the bars of the current trading day are fetched again
+INTRADAY_TTL = float(os.environ.get("INTRADAY_TTL", 5 * 60))
+
+# Regular sessions by ticker suffix, as (timezone, open, close); other tickers,
+# including the indices, trade on the US exchanges
+SESSIONS = {
+    ".NS": ("Asia/Kolkata", dtime(9, 15), dtime(15, 30)),
+    ".BO": ("Asia/Kolkata", dtime(9, 15), dtime(15, 30)),
+    ".TO": ("America/Toronto", dtime(9, 30), dtime(16, 0)),
+    ".V": ("America/Toronto", dtime(9, 30), dtime(16, 0)),
+}
+US_SESSION = ("America/New_York", dtime(9, 30), dtime(16, 0))
+
+# Intraday intervals served by the provider, in minutes, and the number of days
+# back it serves them for
+NATIVE_INTERVALS = {"1m": 1, "2m": 2, "5m": 5, "15m": 15, "30m": 30, "1h": 60}
+LOOKBACK_DAYS = {"1m": 7, "2m": 60, "5m": 60, "15m": 60, "30m": 60, "1h": 730}
+
+AGGREGATIONS = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+
+def session(ticker):
+    """
+    Returns the regular session of the exchange ``ticker`` is listed on, as
+    (timezone, open time, close time).
+    """
+    for suffix, hours in SESSIONS.items():
+        if ticker.endswith(suffix):
+            return hours
+    return US_SESSION
+
+
+def interval_minutes(interval):
+    """
+    Returns the length of an intraday interval ("15m", "4h", ...) in minutes,
+    or None for any other value.
+    """
+    match = re.fullmatch(r"(\d+)([mh])", str(interval or ""))
+    if match is None or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * (60 if match.group(2) == "h" else 1)
+
+
+def parse_interval(value):
+    """
+    Returns the bar size requested by a client: an intraday interval shorter
+    than a day, written in hours when it is a whole number of them, or "1d"
+    (daily closes) for anything else.
+    """
+    minutes = interval_minutes(value)
+    if minutes is None or minutes >= 24 * 60:
+        return "1d"
+    return f"{minutes // 60}h" if minutes % 60 == 0 else f"{minutes}m"
+
+
+def source_interval(interval):
+    """
+    Returns the interval served by the provider that ``interval`` is resampled
+    from: the longest one dividing it.
+    """
+    minutes = interval_minutes(interval)
+    return max(
+        (native for native, length in NATIVE_INTERVALS.items() if minutes % length == 0),
+        key=NATIVE_INTERVALS.get,
+    )
+
+
+def session_bars(data, ticker):
+    """
+    Returns the bars of ``data`` falling within the regular sessions of
+    ``ticker``, indexed in the exchange's timezone (a naive index is taken as UTC).
+    """
+    tz, open_time, close_time = session(ticker)
+    if data.index.tz is None:
+        data = data.tz_localize("UTC")
+    data = data.tz_convert(tz)
+    data = data[data.index.dayofweek < 5]
+    # Bars are labelled by their start, so one starting at the close is after hours
+    return data.between_time(open_time, close_time, inclusive="left")
+
+
+def resample_bars(bars, interval, ticker):
+    """
+    Aggregates session bars of ``ticker`` into bars of ``interval``, counted
+    from the open of each session so no bar straddles two sessions.
+
+    Args:
+        bars (pd.DataFrame): OHLCV bars as returned by ``session_bars``.
+        interval (str): The intraday interval to resample to.
+        ticker (str): The ticker the bars are of.
+
+    Returns:
+        pd.DataFrame: The resampled OHLCV bars, labelled by their start.
+    """
+    if bars.empty:
+        return bars
+    tz, open_time, _ = session(ticker)
+    step = pd.Timedelta(minutes=interval_minutes(interval))
+    opening = pd.Timedelta(hours=open_time.hour, minutes=open_time.minute)
+    # Binned on wall-clock times, so the bins stay on the open across DST changes
+    wall = bars.index.tz_localize(None)
+    days = wall.normalize()
+    labels = days + opening + ((wall - days - opening) // step) * step
+    columns = {column: how for column, how in AGGREGATIONS.items() if column in bars.columns}
+    resampled = bars.groupby(labels.tz_localize(tz)).agg(columns)
+    resampled.index.name = bars.index.name
+    return resampled.dropna(subset=["Close"])
+
+
+def splice_closes(daily, closes):
+    """
+    Returns the daily closes ``daily`` with the days covered by the intraday
+    ``closes`` replaced by them, indexed in naive UTC like ``epoch_ms()`` dates,
+    so a chart zoomed into a few days shows their bars within the whole history.
+    """
+    if closes.empty:
+        return daily
+    local_days = closes.index.tz_localize(None).normalize()
+    outside = (daily.index < local_days[0]) | (daily.index > local_days[-1])
+    closes = closes.copy()
+    closes.index = closes.index.tz_convert("UTC").tz_localize(None)
+    return pd.concat([daily[outside], closes]).sort_index().rename(daily.name)
+
+
+def _day(value):
+    ts = pd.Timestamp(value)
+    if ts.tz is not None:
+        ts = ts.tz_localize(None)
+    return ts.date()
+
+
+def _day_end(value):
+    """
+    Returns the first day after ``value`` when it falls within a day, or the
+    day itself at midnight, so [start, end) covers every bar before ``value``.
+    """
+    ts = pd.Timestamp(value)
+    if ts.tz is not None:
+        ts = ts.tz_localize(None)
+    return ts.date() if ts == ts.normalize() else ts.date() + timedelta(days=1)
+
+
+def _in_days(bars, ticker, start, end):
+    """
+    Returns the mask of the bars of ``ticker`` on the days of [start, end).
+    """
+    tz = session(ticker)[0]
+    first = pd.Timestamp(start).tz_localize(tz)
+    last = pd.Timestamp(end).tz_localize(tz)
+    return (bars.index >= first) & (bars.index < last)
+
+
+def _empty_bars(ticker):
+    return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], tz=session(ticker)[0]), dtype=float)
+
+
+class IntradayStore:
+    """
+    In-memory cache of intraday bars.
+
+    Every (ticker, source interval) entry remembers the range of days it holds
+    and when it last fetched the current day, so a warm request costs at most
+    one small fetch of the latest bars every INTRADAY_TTL seconds; the least
+    recently used entries are evicted once more than ``maxsize`` are held.
+    """
+
+    def __init__(self, maxsize=256):
+        self._bars = LRUCache(maxsize)
+        self._resampled = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def _missing_ranges(self, entry, start, end, today, now):
+        """
+        Returns the (kind, start, end) day ranges to fetch for [start, end).
+        """
+        if entry is None:
+            return [("new", start, end)]
+        ranges = []
+        if start < entry["start"]:
+            ranges.append(("older", start, entry["start"]))
+        # The bars of the day the entry was last fetched on were still coming
+        # in, so from there on they are fetched again once that day is over or
+        # they are older than INTRADAY_TTL
+        checked = entry["checked_day"]
+        if (
+            entry["end"] > checked
+            and end > checked
+            and (today > checked or now - entry["checked_at"] > INTRADAY_TTL)
+        ):
+            ranges.append(("recent", max(checked, entry["start"]), max(end, entry["end"])))
+        elif end > entry["end"]:
+            ranges.append(("newer", entry["end"], end))
+        return ranges
+
+    def _store(self, key, bars, kind, start, end, today, now):
+        ticker = key[0]
+        entry = self._bars.get(key)
+        if entry is None:
+            merged = bars
+            entry = {"start": start, "end": end, "version": 0}
+        else:
+            kept = entry["bars"]
+            kept = kept[~_in_days(kept, ticker, start, end)]
+            merged = pd.concat([kept, bars]).sort_index() if not kept.empty else bars
+            entry = dict(
+                entry,
+                start=min(entry["start"], start),
+                end=max(entry["end"], end),
+                version=entry["version"] + 1,
+            )
+        merged = merged[~merged.index.duplicated(keep="last")]
+        # Older days say nothing of the latest bars, and newer ones fetched on
+        # the same day leave the bars fetched earlier that day as old as they were
+        if kind in ("new", "recent") or (kind == "newer" and entry["checked_day"] != today):
+            entry["checked_day"], entry["checked_at"] = today, now
+        entry["bars"] = merged
+        self._bars.set(key, entry)
+
+    def refresh(self, tickers, start, end, interval):
+        """
+        Makes sure the store holds the bars of ``tickers`` for the days of
+        [start, end) at the source interval of ``interval``, going back no
+        further than the provider serves them.
+
+        The missing ranges of all tickers are merged per kind (new tickers,
+        older days, recent bars), so a refresh costs at most one batched
+        provider call per kind regardless of the number of tickers.
+        """
+        source = source_interval(interval)
+        today = date.today()
+        now = time.monotonic()
+        start = max(_day(start), today - timedelta(days=LOOKBACK_DAYS[source] - 1))
+        end = min(_day_end(end), today + timedelta(days=1))
+        if start >= end:
+            return
+        with self._lock:
+            batches = {}
+            for ticker in dict.fromkeys(tickers):
+                entry = self._bars.get((ticker, source))
+                for kind, fetch_start, fetch_end in self._missing_ranges(entry, start, end, today, now):
+                    batch = batches.setdefault(kind, [fetch_start, fetch_end, []])
+                    batch[0] = min(batch[0], fetch_start)
+                    batch[1] = max(batch[1], fetch_end)
+                    batch[2].append(ticker)
+
+        for kind, (fetch_start, fetch_end, batch_tickers) in batches.items():
+            with stage("fetch", kind="intraday"):
+                try:
+                    histories = get_provider().batch_history(
+                        batch_tickers, fetch_start, fetch_end, interval=source
+                    )
+                except Exception:
+                    market_data_calls_total.inc(kind="intraday", result="error")
+                    raise
+            market_data_calls_total.inc(kind="intraday", result="ok")
+            with self._lock:
+                for ticker in batch_tickers:
+                    # Tickers whose download failed are left to the next request
+                    if ticker not in histories:
+                        continue
+                    hist = histories[ticker]
+                    if hist is None or hist.empty:
+                        bars = _empty_bars(ticker)
+                    else:
+                        bars = session_bars(hist[[c for c in OHLCV_COLUMNS if c in hist.columns]], ticker)
+                    self._store((ticker, source), bars, kind, fetch_start, fetch_end, today, now)
+
+    def _bars_at(self, ticker, interval):
+        """
+        Returns all bars held for ``ticker`` at ``interval``, resampling them
+        from the source interval the first time they are asked for.
+        """
+        source = source_interval(interval)
+        entry = self._bars.get((ticker, source))
+        if entry is None:
+            return _empty_bars(ticker)
+        if interval == source:
+            return entry["bars"]
+        resampled = self._resampled.get((ticker, interval))
+        if resampled is None or resampled[0] != entry["version"]:
+            with stage("resample"):
+                resampled = (entry["version"], resample_bars(entry["bars"], interval, ticker))
+            self._resampled.set((ticker, interval), resampled)
+        return resampled[1]
+
+    def get_bars_many(self, tickers, start, end, interval):
+        """
+        Returns the session bars of several tickers for the days of [start, end)
+        at ``interval``, fetching any missing bars first.
+
+        Args:
+            tickers (list): The ticker symbols.
+            start: First day of the range (inclusive).
+            end: End of the range (exclusive; a time within a day includes it).
+            interval (str): An intraday interval, e.g. '15m', '1h' or '4h'.
+
+        Returns:
+            dict: OHLCV bars in the exchange's timezone by ticker, empty for the
+            days before the provider's lookback.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        self.refresh(tickers, start, end, interval)
+        first, last = _day(start), _day_end(end)
+        bars = {}
+        for ticker in tickers:
+            held = self._bars_at(ticker, interval)
+            bars[ticker] = held[_in_days(held, ticker, first, last)]
+        return bars
+
+    def get_bars(self, ticker, start, end, interval):
+        """
+        Returns the session bars of ``ticker`` for the days of [start, end) at
+        ``interval``; see ``get_bars_many``.
+        """
+        return self.get_bars_many([ticker], start, end, interval)[ticker]
+
+    def get_closes(self, ticker, start, end, interval):
+        """
+        Returns the closes of the session bars of ``ticker`` for the days of
+        [start, end) at ``interval`` as a Series named "Close".
+        """
+        return self.get_bars(ticker, start, end, interval)["Close"].astype(float)
+
+    def clear(self):
+        self._bars.clear()
+        self._resampled.clear()
+
+
+intraday_store = IntradayStore()
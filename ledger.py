@@ -0,0 +1,221 @@
+"""
+Columnar transaction ledger.
+
+A portfolio ({currency: {ticker: [transactions]}}) is parsed once into typed
+arrays (dates as int64 nanoseconds, ticker, currency and side codes, quantities
+and prices) sorted by date and indexed by ticker, instead of every function
+re-parsing the date strings of the nested dicts one at a time. Selecting the
+transactions of a ticker or a window of days slices the arrays, and the
+transactions are only turned back into rows where a DataFrame or the original
+dicts are needed.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+# Columns of the transactions as a DataFrame (see Ledger.frame)
+TRANSACTION_COLUMNS = ["date", "ticker", "type", "quantity", "price", "currency"]
+
+# Transaction types by side code; any other type has code 0 and is ignored by
+# the performance figures, as by the simulation
+SIDES = {"buy": 1, "sell": -1}
+
+
+class Ledger:
+    """
+    The transactions of a portfolio as parallel arrays in chronological order
+    (same-day transactions in portfolio order).
+
+    Attributes:
+        tickers (list): The portfolio's tickers, in portfolio order; the
+            ``ticker_codes`` of the transactions index into it.
+        currencies (dict): The currency of every ticker, in portfolio order,
+            including the tickers without transactions.
+        days (np.ndarray): The normalized dates, as int64 nanoseconds.
+        ticker_codes (np.ndarray): The ticker of each transaction.
+        sides (np.ndarray): 1 for a buy, -1 for a sell, 0 for another type.
+        types (np.ndarray): The type of each transaction as written.
+        quantities (np.ndarray): The quantities (int64 when all are whole).
+        prices (np.ndarray): The prices, in the ticker's currency.
+        sources (np.ndarray): The original transaction dicts.
+        sequence (np.ndarray): The position of each transaction in the portfolio.
+    """
+
+    def __init__(self, tickers, currencies, days, ticker_codes, sides, types, quantities, prices, sources, sequence):
+        self.tickers = tickers
+        self.currencies = currencies
+        self.days = days
+        self.ticker_codes = ticker_codes
+        self.sides = sides
+        self.types = types
+        self.quantities = quantities
+        self.prices = prices
+        self.sources = sources
+        self.sequence = sequence
+        self._by_ticker = None
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def start_date(self):
+        """
+        The date of the first transaction (normalized), or None without any.
+        """
+        return pd.Timestamp(self.days[0]) if len(self.days) else None
+
+    def take(self, rows):
+        """
+        Returns the ledger of the transactions at positions ``rows`` (an array
+        of positions in order, or a slice).
+        """
+        return Ledger(
+            self.tickers,
+            self.currencies,
+            self.days[rows],
+            self.ticker_codes[rows],
+            self.sides[rows],
+            self.types[rows],
+            self.quantities[rows],
+            self.prices[rows],
+            self.sources[rows],
+            self.sequence[rows],
+        )
+
+    def for_ticker(self, ticker):
+        """
+        Returns the ledger of the transactions of ``ticker``.
+        """
+        if self._by_ticker is None:
+            # Positions grouped by ticker, in date order within each ticker
+            order = np.argsort(self.ticker_codes, kind="stable")
+            bounds = np.searchsorted(self.ticker_codes[order], np.arange(len(self.tickers) + 1))
+            self._by_ticker = (order, bounds)
+        order, bounds = self._by_ticker
+        code = self.tickers.index(ticker)
+        return self.take(order[bounds[code]:bounds[code + 1]])
+
+    def between(self, first, last):
+        """
+        Returns the ledger of the transactions dated from ``first`` to ``last``
+        (inclusive, compared as normalized dates).
+        """
+        lo = np.searchsorted(self.days, pd.Timestamp(first).normalize().value, side="left")
+        hi = np.searchsorted(self.days, pd.Timestamp(last).normalize().value, side="right")
+        return self.take(slice(lo, hi))
+
+    def totals(self):
+        """
+        Returns the money spent on the buys, the net quantity held and the money
+        received from the sells, in the transactions' currency.
+        """
+        buys = self.sides == 1
+        sells = self.sides == -1
+        amounts = self.quantities * self.prices
+        shares = self.quantities[buys].sum() - self.quantities[sells].sum()
+        return float(amounts[buys].sum()), shares.item(), float(amounts[sells].sum())
+
+    def frame(self):
+        """
+        Returns the transactions as a DataFrame with the TRANSACTION_COLUMNS
+        (date normalized), as used by the simulation.
+        """
+        tickers = np.asarray(self.tickers, dtype=object)
+        currencies = np.asarray([self.currencies[ticker] for ticker in self.tickers], dtype=object)
+        return pd.DataFrame(
+            {
+                "date": self.days.view("datetime64[ns]"),
+                "ticker": tickers[self.ticker_codes],
+                "type": self.types,
+                "quantity": self.quantities,
+                "price": self.prices,
+                "currency": currencies[self.ticker_codes],
+            },
+            columns=TRANSACTION_COLUMNS,
+        )
+
+    def records(self):
+        """
+        Returns the original transaction dicts, in portfolio order.
+        """
+        return list(self.sources[np.argsort(self.sequence, kind="stable")])
+
+
+def _parse_days(dates):
+    """
+    Returns the normalized dates of the transactions as int64 nanoseconds,
+    dropping any timezone (the wall time is kept).
+    """
+    try:
+        with warnings.catch_warnings():
+            # Mixed offsets give an object Series (an error in later pandas)
+            warnings.simplefilter("ignore", FutureWarning)
+            parsed = pd.to_datetime(pd.Series(dates, dtype=object), format="ISO8601")
+        if parsed.dtype == object:
+            raise ValueError("Dates with different timezones")
+        if parsed.dt.tz is not None:
+            parsed = parsed.dt.tz_localize(None)
+        days = parsed.dt.normalize()
+    except (ValueError, TypeError):
+        # Dates not in one ISO 8601 form (or with different offsets) are parsed
+        # one at a time, as they are written
+        days = pd.Series(
+            [pd.to_datetime(date).tz_localize(None).normalize() for date in dates],
+            dtype="datetime64[ns]",
+        )
+    return days.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+@timed("parse")
+def parse_portfolio(portfolio):
+    """
+    Parses the transactions of a portfolio into a Ledger.
+
+    Args:
+        portfolio (dict): Transactions by currency and ticker.
+
+    Returns:
+        Ledger: The transactions, in chronological order. Tickers listed
+        without any transaction are left out.
+    """
+    currencies = {
+        ticker: currency
+        for currency in portfolio.keys()
+        for ticker, txns in portfolio[currency].items()
+        if txns
+    }
+    tickers = list(currencies)
+    codes = {ticker: code for code, ticker in enumerate(tickers)}
+    sources = []
+    ticker_codes = []
+    for currency in portfolio.keys():
+        for ticker, txns in portfolio[currency].items():
+            if not txns:
+                continue
+            sources += txns
+            ticker_codes += [codes[ticker]] * len(txns)
+
+    source_array = np.empty(len(sources), dtype=object)
+    source_array[:] = sources
+    days = _parse_days([txn["date"] for txn in sources])
+    types = np.asarray([txn["type"] for txn in sources], dtype=object)
+    sides = np.zeros(len(sources), dtype=np.int8)
+    for side, code in SIDES.items():
+        sides[types == side] = code
+    order = np.argsort(days, kind="stable")
+    ledger = Ledger(
+        tickers,
+        currencies,
+        days,
+        np.asarray(ticker_codes, dtype=np.int32),
+        sides,
+        types,
+        np.asarray([txn["quantity"] for txn in sources]),
+        np.asarray([txn["price"] for txn in sources], dtype=float),
+        source_array,
+        np.arange(len(sources)),
+    )
+    return ledger.take(order)
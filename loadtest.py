@@ -0,0 +1,131 @@
+"""
+Local load test of the backend against offline market data.
+
+Starts the backend in-process on the fixture provider, with a simulated
+provider latency, and fires concurrent dashboard requests at it to compare
+serving modes:
+
+    python loadtest.py --server single dev waitress --clients 16 --requests 200 --cold
+
+"single" is the development server handling one request at a time, "dev" is
+Flask's threaded development server as started by ``backend.py`` and
+"waitress" is the production server of ``serve.py``. Without --fixtures,
+synthetic fixtures are generated for the tickers of the backend's portfolio.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ENDPOINTS = {
+    "comparison": ("POST", "/comparison", {"comparison": "^IXIC"}),
+    "indiv_performance": ("GET", "/indiv_performance", None),
+}
+COMPARISON_INDICES = ["^IXIC", "^GSPC", "^DJI", "^GSPTSE", "^FTSE"]
+
+
+def start_server(kind, app, port, threads):
+    """
+    Starts ``app`` on ``port`` in a background thread and returns a function
+    stopping it.
+    """
+    if kind == "waitress":
+        from waitress.server import create_server
+
+        server = create_server(app, host="127.0.0.1", port=port, threads=threads)
+        threading.Thread(target=server.run, daemon=True).start()
+        return server.close
+
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", port, app, threaded=(kind == "dev"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def run_load(base_url, endpoint, clients, total_requests):
+    """
+    Sends ``total_requests`` requests to ``endpoint`` from ``clients``
+    concurrent clients and returns the latencies and the total wall time.
+    """
+    method, path, body = ENDPOINTS[endpoint]
+
+    def one_request(_):
+        start = time.perf_counter()
+        response = requests.request(method, base_url + path, json=body, timeout=300)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(pool.map(one_request, range(total_requests)))
+    return latencies, time.perf_counter() - start
+
+
+def report(kind, endpoint, latencies, elapsed):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(
+        f"{kind:>8} {endpoint:<18} {len(latencies) / elapsed:8.1f} req/s"
+        f"   p50 {quantiles[49] * 1000:8.1f} ms"
+        f"   p95 {quantiles[94] * 1000:8.1f} ms"
+        f"   p99 {quantiles[98] * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend on offline market data.")
+    parser.add_argument("--server", nargs="+", default=["single", "waitress"], choices=["single", "dev", "waitress"])
+    parser.add_argument("--endpoint", nargs="+", default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument("--fixtures", help="Fixture directory (synthetic fixtures when omitted).")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated provider latency in seconds.")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients.")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and server.")
+    parser.add_argument("--threads", type=int, default=16, help="Waitress worker threads.")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument(
+        "--cold", action="store_true", help="Disable the info and quote caches, so every request waits on the provider."
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["PRICE_STORE_PATH"] = os.path.join(workdir, "prices.sqlite")
+    os.environ["PORTFOLIO_STORE_PATH"] = os.path.join(workdir, "portfolios.sqlite")
+    os.environ["SERIES_STORE_PATH"] = os.path.join(workdir, "series.sqlite")
+    if args.cold:
+        os.environ["MARKET_DATA_INFO_TTL"] = os.environ["MARKET_DATA_QUOTE_TTL"] = "0"
+
+    import backend
+    import market_data
+
+    fixtures = args.fixtures
+    if fixtures is None:
+        fixtures = os.path.join(workdir, "fixtures")
+        tickers = [ticker for currency in backend.portfolio.values() for ticker in currency]
+        market_data.write_synthetic_fixtures(fixtures, tickers + COMPARISON_INDICES, "2024-01-01", time.strftime("%Y-%m-%d"))
+    market_data.set_provider(market_data.FixtureProvider(fixtures, latency=args.latency))
+
+    print(
+        f"{args.clients} clients, {args.requests} requests, {args.latency * 1000:.0f} ms provider latency"
+        + (", caches disabled" if args.cold else "")
+    )
+    for offset, kind in enumerate(args.server):
+        port = args.port + offset
+        stop = start_server(kind, backend.app, port, args.threads)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            for endpoint in args.endpoint:
+                run_load(base_url, endpoint, 1, 1)  # warm up the price store
+                latencies, elapsed = run_load(base_url, endpoint, args.clients, args.requests)
+                report(kind, endpoint, latencies, elapsed)
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Market-data providers.
+
+Every price history, quote and company-info lookup in report.py goes through
+the provider returned by ``get_provider()``. The default provider talks to
+Yahoo Finance through yfinance; the fixture provider replays data saved on
+disk so the service can run, be benchmarked and be load tested offline.
+
+The provider is selected per process with the MARKET_DATA_PROVIDER environment
+variable ("yfinance" or "fixture", with the fixture directory given by
+MARKET_DATA_FIXTURES and an optional simulated latency in
+MARKET_DATA_FIXTURE_LATENCY), or explicitly with ``set_provider()``.
+
+Per-ticker calls that cannot be batched are run on a bounded thread pool
+(MARKET_DATA_MAX_WORKERS threads, MARKET_DATA_TIMEOUT seconds per call).
+
+Company information and quotes should be read through ``get_info()`` and
+``get_quote()``, which cache them for MARKET_DATA_INFO_TTL and
+MARKET_DATA_QUOTE_TTL seconds respectively.
+"""
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from cache import LRUCache
+from metrics import market_data_calls_total, stage
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+MAX_WORKERS = int(os.environ.get("MARKET_DATA_MAX_WORKERS", 8))
+FETCH_TIMEOUT = float(os.environ.get("MARKET_DATA_TIMEOUT", 30))
+INFO_TTL = float(os.environ.get("MARKET_DATA_INFO_TTL", 24 * 60 * 60))
+QUOTE_TTL = float(os.environ.get("MARKET_DATA_QUOTE_TTL", 15))
+CACHE_SIZE = int(os.environ.get("MARKET_DATA_CACHE_SIZE", 1024))
+
+_info_cache = LRUCache(maxsize=CACHE_SIZE, ttl=INFO_TTL)
+_quote_cache = LRUCache(maxsize=CACHE_SIZE, ttl=QUOTE_TTL)
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="market-data")
+
+
+def submit_concurrently(fetch, keys):
+    """
+    Starts ``fetch(key)`` for every key on the shared market-data thread pool
+    without waiting for the results, so other work can overlap with the calls.
+
+    Returns:
+        dict: The pending futures mapped to their key, to pass to ``gather()``.
+    """
+    # Each call runs in a copy of the caller's context, so its stage timings
+    # count towards the request that started it
+    return {
+        _executor.submit(contextvars.copy_context().run, fetch, key): key
+        for key in dict.fromkeys(keys)
+    }
+
+
+def gather(futures, timeout=FETCH_TIMEOUT):
+    """
+    Waits for the futures returned by ``submit_concurrently()``.
+
+    Args:
+        futures (dict): Pending futures mapped to their key.
+        timeout (float): Seconds to wait for the calls; calls still running
+            afterwards are reported as failed.
+
+    Returns:
+        tuple: A dict of key -> result for the calls that succeeded, and a dict
+        of key -> exception for the ones that failed or timed out.
+    """
+    done, not_done = wait(futures, timeout=timeout)
+    results, errors = {}, {}
+    for future in done:
+        key = futures[future]
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            errors[key] = e
+    for future in not_done:
+        future.cancel()
+        errors[futures[future]] = TimeoutError(f"Timed out after {timeout}s")
+    return results, errors
+
+
+def iter_completed(futures, timeout=FETCH_TIMEOUT):
+    """
+    Yields the futures returned by ``submit_concurrently()`` as they complete,
+    so each result can be used without waiting for the slowest call.
+
+    Args:
+        futures (dict): Pending futures mapped to their key.
+        timeout (float): Seconds to wait for the calls; calls still running
+            afterwards are reported as failed.
+
+    Yields:
+        tuple: (key, result, error), where exactly one of result and error is
+        set (result is None when the call failed).
+    """
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    except FuturesTimeoutError:
+        for future in pending:
+            future.cancel()
+            yield futures[future], None, TimeoutError(f"Timed out after {timeout}s")
+
+
+def fetch_concurrently(fetch, keys, timeout=FETCH_TIMEOUT):
+    """
+    Calls ``fetch(key)`` for every key on the shared market-data thread pool
+    and waits for the results.
+
+    Args:
+        fetch (callable): Function doing one I/O-bound call.
+        keys (iterable): Arguments to call ``fetch`` with (e.g., tickers).
+        timeout (float): Seconds to wait for the calls.
+
+    Returns:
+        tuple: The results and errors dicts described in ``gather()``.
+    """
+    return gather(submit_concurrently(fetch, keys), timeout)
+
+
+class MarketDataProvider:
+    """
+    Interface implemented by every market-data backend.
+    """
+
+    def history(self, ticker, start, end, interval="1d"):
+        """
+        Returns the OHLCV bars of ``ticker`` for [start, end).
+
+        Args:
+            ticker (str): The ticker symbol (e.g., 'AAPL').
+            start: First date of the range (inclusive).
+            end: Last date of the range (exclusive).
+            interval (str): Bar size, e.g. '1d' or '1h'.
+
+        Returns:
+            pd.DataFrame: Bars indexed by timestamp, with the columns in OHLCV_COLUMNS.
+        """
+        raise NotImplementedError
+
+    def batch_history(self, tickers, start, end, interval="1d"):
+        """
+        Returns the bars of several tickers as a dict of ticker -> DataFrame.
+        Backends able to download several tickers at once override this; the
+        default fetches the tickers concurrently, leaving out the ones that fail.
+        """
+        results, errors = fetch_concurrently(
+            lambda ticker: self.history(ticker, start, end, interval), tickers
+        )
+        for ticker, e in errors.items():
+            print(f"Error fetching {ticker} history: {e}")
+        return results
+
+    def quote(self, ticker):
+        """
+        Returns the latest traded price of ``ticker``.
+        """
+        raise NotImplementedError
+
+    def info(self, ticker):
+        """
+        Returns the company information of ``ticker`` as a dict (longName,
+        exchange, sector, marketCap, longBusinessSummary, ...).
+        """
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    """
+    Live market data from Yahoo Finance.
+    """
+
+    def history(self, ticker, start, end, interval="1d"):
+        return yf.Ticker(ticker).history(start=start, end=end, interval=interval)
+
+    def batch_history(self, tickers, start, end, interval="1d"):
+        tickers = list(tickers)
+        if len(tickers) < 2:
+            return super().batch_history(tickers, start, end, interval)
+        data = yf.download(
+            tickers,
+            start,
+            end,
+            interval=interval,
+            group_by="ticker",
+            auto_adjust=True,
+            progress=False,
+        )
+        result = {}
+        for ticker in tickers:
+            if ticker in data.columns.get_level_values(0):
+                result[ticker] = data[ticker].dropna(how="all")
+            else:
+                result[ticker] = pd.DataFrame(columns=OHLCV_COLUMNS)
+        return result
+
+    def quote(self, ticker):
+        return yf.Ticker(ticker).fast_info["lastPrice"]
+
+    def info(self, ticker):
+        return yf.Ticker(ticker).info
+
+
+class FixtureProvider(MarketDataProvider):
+    """
+    Market data replayed from files on disk.
+
+    The fixture directory is laid out as::
+
+        <directory>/history/<interval>/<ticker>.csv   # OHLCV bars, timestamp index
+        <directory>/info/<ticker>.json                # company information
+
+    Quotes are the "currentPrice" of the info file, or the last daily close
+    when the info file does not have one.
+
+    ``latency`` adds a delay in seconds to every call, to replay the data with
+    the response times of a remote provider (e.g. under load tests).
+    """
+
+    def __init__(self, directory, latency=0.0):
+        self.directory = directory
+        self.latency = latency
+        self._history = {}
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _history_path(self, ticker, interval):
+        return os.path.join(self.directory, "history", interval, f"{ticker}.csv")
+
+    def _info_path(self, ticker):
+        return os.path.join(self.directory, "info", f"{ticker}.json")
+
+    def _load_history(self, ticker, interval):
+        key = (ticker, interval)
+        if key not in self._history:
+            path = self._history_path(ticker, interval)
+            if os.path.exists(path):
+                with open(path) as f:
+                    header = f.readline()
+                tz = header[1:].strip() if header.startswith("#") else None
+                data = pd.read_csv(path, index_col=0, comment="#")
+                data.index = pd.to_datetime(data.index, utc=True)
+                if tz:
+                    data.index = data.index.tz_convert(tz)
+            else:
+                data = pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], tz="UTC"))
+            self._history[key] = data
+        return self._history[key]
+
+    def history(self, ticker, start, end, interval="1d"):
+        self._wait()
+        data = self._load_history(ticker, interval)
+        if data.empty:
+            return data.copy()
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if start.tz is None:
+            start = start.tz_localize(data.index.tz)
+        if end.tz is None:
+            end = end.tz_localize(data.index.tz)
+        return data[(data.index >= start) & (data.index < end)].copy()
+
+    def quote(self, ticker):
+        info = self.info(ticker)  # waits for the simulated latency
+        if "currentPrice" in info:
+            return info["currentPrice"]
+        closes = self._load_history(ticker, "1d")["Close"]
+        if closes.empty:
+            raise KeyError(f"No quote available for {ticker}")
+        return float(closes.iloc[-1])
+
+    def info(self, ticker):
+        self._wait()
+        path = self._info_path(ticker)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+
+def write_fixture(directory, ticker, history=None, interval="1d", info=None):
+    """
+    Saves bars and/or company information of ``ticker`` in the layout read by
+    FixtureProvider. The timezone of the bars is kept in a comment header.
+    """
+    if history is not None:
+        path = os.path.join(directory, "history", interval, f"{ticker}.csv")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        history = history[[column for column in OHLCV_COLUMNS if column in history.columns]]
+        with open(path, "w", newline="") as f:
+            if history.index.tz is not None:
+                f.write(f"# {history.index.tz}\n")
+            history.to_csv(f)
+    if info is not None:
+        path = os.path.join(directory, "info", f"{ticker}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(info, f, default=str)
+
+
+def record_fixtures(directory, tickers, start, end, intervals=("1d",), source=None):
+    """
+    Snapshots the history and company information of ``tickers`` from
+    ``source`` (the live provider by default) into a fixture directory.
+    """
+    source = source or YFinanceProvider()
+    for ticker in tickers:
+        for interval in intervals:
+            write_fixture(directory, ticker, source.history(ticker, start, end, interval), interval)
+        write_fixture(directory, ticker, info=source.info(ticker))
+
+
+def write_synthetic_fixtures(directory, tickers, start, end, seed=0):
+    """
+    Writes random-walk daily and hourly bars and minimal company information
+    for ``tickers`` in the layout read by FixtureProvider, for load tests and
+    benchmarks that must not depend on real market data.
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, end, tz="America/New_York")
+    hours = days.repeat(7) + pd.to_timedelta(np.tile(9.5 + np.arange(7), len(days)), unit="h")
+    for ticker in tickers:
+        hourly_close = 50 * np.exp(np.cumsum(rng.normal(0, 0.005, len(hours))))
+        hourly = pd.DataFrame(
+            {
+                "Open": hourly_close,
+                "High": hourly_close * 1.002,
+                "Low": hourly_close * 0.998,
+                "Close": hourly_close,
+                "Volume": rng.integers(1_000, 100_000, len(hours)),
+            },
+            index=hours,
+        )
+        daily = hourly.groupby(hourly.index.normalize()).agg(
+            {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+        )
+        info = {
+            "longName": f"{ticker} Inc.",
+            "exchange": "NMS",
+            "sector": "Technology",
+            "marketCap": int(rng.integers(10**8, 10**12)),
+            "longBusinessSummary": f"{ticker} is a synthetic company used for offline testing.",
+            "currentPrice": float(hourly_close[-1]),
+        }
+        write_fixture(directory, ticker, daily, "1d")
+        write_fixture(directory, ticker, hourly, "1h", info=info)
+
+
+_provider = None
+
+
+def set_provider(provider):
+    """
+    Selects the market-data provider used by the whole process.
+    """
+    global _provider
+    _provider = provider
+    _info_cache.clear()
+    _quote_cache.clear()
+
+
+def get_provider():
+    """
+    Returns the process-wide market-data provider, creating it from the
+    MARKET_DATA_PROVIDER / MARKET_DATA_FIXTURES environment variables on first use.
+    """
+    global _provider
+    if _provider is None:
+        name = os.environ.get("MARKET_DATA_PROVIDER", "yfinance")
+        if name == "yfinance":
+            _provider = YFinanceProvider()
+        elif name == "fixture":
+            _provider = FixtureProvider(
+                os.environ["MARKET_DATA_FIXTURES"],
+                latency=float(os.environ.get("MARKET_DATA_FIXTURE_LATENCY", 0)),
+            )
+        else:
+            raise ValueError(f"Unknown market data provider: {name}")
+    return _provider
+
+
+def _call(kind, ticker, fetch):
+    # Times and counts one provider call for ``ticker``
+    with stage("fetch", kind=kind, ticker=ticker):
+        try:
+            result = fetch(ticker)
+        except Exception:
+            market_data_calls_total.inc(kind=kind, result="error")
+            raise
+    market_data_calls_total.inc(kind=kind, result="ok")
+    return result
+
+
+def get_info(ticker):
+    """
+    Returns the company information of ``ticker``, cached for INFO_TTL seconds.
+    """
+    info = _info_cache.get(ticker)
+    if info is None:
+        info = _call("info", ticker, get_provider().info)
+        _info_cache.set(ticker, info)
+    return info
+
+
+def get_quote(ticker):
+    """
+    Returns the latest traded price of ``ticker``, cached for QUOTE_TTL seconds.
+    """
+    quote = _quote_cache.get(ticker)
+    if quote is None:
+        quote = _call("quote", ticker, get_provider().quote)
+        _quote_cache.set(ticker, quote)
+    return quote
+
+
+def prime_info(infos):
+    """
+    Adds company information fetched elsewhere, e.g. by the parent of a worker
+    process, to the cache read by ``get_info()``.
+    """
+    for ticker, info in infos.items():
+        _info_cache.set(ticker, info)
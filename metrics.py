@@ -0,0 +1,184 @@
+"""
+Timing instrumentation of the analytics hot paths.
+
+The stages of a request (market-data fetches, transaction parsing, FX
+conversion, simulation, serialization) are timed with ``stage()``, which feeds
+a histogram per stage and, while a request is being timed, the list of timings
+returned in its Server-Timing header. Counters track cache hits and
+market-data calls. ``render()`` exposes everything in the Prometheus text
+format for the backend's ``/metrics`` route.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+# Timings of the current request, or None when it is not being timed
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        name + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """
+    A monotonically increasing count per label set.
+    """
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Observed durations per label set, counted in cumulative buckets.
+    """
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, count, total = self._values.get(key, ([0] * len(self.buckets), 0, 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, count + 1, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, count, total) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "portfolio_stage_seconds", "Time spent per stage of the portfolio analytics."
+)
+request_seconds = Histogram("http_request_seconds", "Time spent handling requests, by endpoint.")
+requests_total = Counter("http_requests_total", "Requests handled, by endpoint and status.")
+cache_requests_total = Counter(
+    "result_cache_requests_total", "Result cache lookups, by payload and result (hit or miss)."
+)
+market_data_calls_total = Counter(
+    "market_data_calls_total", "Calls to the market-data provider, by kind and result."
+)
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Times the enclosed block as stage ``name`` of the analytics, with optional
+    labels such as the ticker.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=name, **labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def timed(name):
+    """
+    Decorator timing every call of the function as stage ``name``.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_request_timing():
+    """
+    Starts collecting the stage timings of the current request (in place of
+    those of the previous request handled by the thread), including those of
+    calls it makes on the market-data pool, and returns the list they are
+    collected in.
+    """
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing(timings, total=None):
+    """
+    Returns the Server-Timing header value for ``timings`` ((stage, seconds)
+    pairs), adding up the repeated stages, plus the request's ``total`` seconds.
+    """
+    durations = {}
+    counts = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+        counts[name] = counts.get(name, 0) + 1
+    entries = [
+        f'{name};dur={seconds * 1000:.1f};desc="{counts[name]} calls"'
+        for name, seconds in durations.items()
+    ]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def render():
+    """
+    Returns all metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
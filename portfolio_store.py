@@ -0,0 +1,389 @@
+"""
+Persistent store of portfolios and their transactions.
+
+Portfolios live in a SQLite database, one row per transaction indexed by
+portfolio and ticker, and are read back in the nested form the analytics take
+({currency: {ticker: [transactions]}}). Bulk imports (CSV, JSON or
+newline-delimited JSON broker exports) are consumed as a stream of rows,
+validated and staged in batches of IMPORT_BATCH_SIZE, then added to the
+portfolio in one SQLite transaction, so an export of years of trades is
+loaded in a few statements and a file with a bad row leaves the portfolio
+unchanged.
+"""
+import csv
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from itertools import islice
+
+import pandas as pd
+
+from cache import LRUCache
+
+PORTFOLIO_STORE_PATH = os.environ.get(
+    "PORTFOLIO_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "portfolios.sqlite"),
+)
+IMPORT_BATCH_SIZE = int(os.environ.get("PORTFOLIO_IMPORT_BATCH_SIZE", 5000))
+
+# Currency of the tickers imported without one, by suffix (US listings otherwise)
+CURRENCY_SUFFIXES = {".NS": "INR", ".BO": "INR", ".TO": "CAD", ".V": "CAD"}
+
+# Column names of broker exports, mapped to the transaction fields
+COLUMN_ALIASES = {
+    "date": "date",
+    "datetime": "date",
+    "trade date": "date",
+    "ticker": "ticker",
+    "symbol": "ticker",
+    "type": "type",
+    "side": "type",
+    "action": "type",
+    "quantity": "quantity",
+    "qty": "quantity",
+    "shares": "quantity",
+    "price": "price",
+    "currency": "currency",
+}
+TRANSACTION_TYPES = {"buy": "buy", "bought": "buy", "sell": "sell", "sold": "sell"}
+
+
+def transaction_row(row):
+    """
+    Validates one imported transaction and returns it as a row of the store.
+
+    Args:
+        row (dict): date, ticker, type ("buy" or "sell"), quantity, price and,
+            optionally, currency (inferred from the ticker otherwise).
+
+    Returns:
+        tuple: (currency, ticker, type, date, quantity, price), the date in
+        ISO 8601 form.
+
+    Raises:
+        ValueError: If a field is missing or invalid.
+    """
+    missing = [field for field in ("date", "ticker", "type", "quantity", "price") if row.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    ticker = str(row["ticker"]).strip()
+    txn_type = TRANSACTION_TYPES.get(str(row["type"]).strip().lower())
+    if txn_type is None:
+        raise ValueError(f"unknown type {row['type']!r}")
+    try:
+        date = pd.Timestamp(row["date"])
+    except (ValueError, TypeError):
+        raise ValueError(f"invalid date {row['date']!r}")
+    quantity = float(row["quantity"])
+    price = float(row["price"])
+    if not (quantity > 0 and price >= 0):
+        raise ValueError("quantity must be positive and price not negative")
+    currency = row.get("currency")
+    if currency:
+        currency = str(currency).strip().upper()
+    else:
+        currency = next(
+            (code for suffix, code in CURRENCY_SUFFIXES.items() if ticker.endswith(suffix)), "USD"
+        )
+    return (
+        currency,
+        ticker,
+        txn_type,
+        date.isoformat(sep=" "),
+        int(quantity) if quantity.is_integer() else quantity,
+        price,
+    )
+
+
+def portfolio_rows(portfolio):
+    """
+    Yields the transactions of a portfolio in the nested form as flat rows.
+    """
+    for currency, tickers in portfolio.items():
+        for ticker, txns in tickers.items():
+            for txn in txns:
+                yield dict(txn, currency=currency, ticker=ticker)
+
+
+def csv_rows(lines):
+    """
+    Yields the transactions of a CSV export read from ``lines`` (any iterable
+    of text lines, e.g. a stream), mapping the usual column names of broker
+    exports (symbol, side, qty, ...) to the transaction fields.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    fields = [COLUMN_ALIASES.get(name.strip().lower()) for name in header]
+    for values in reader:
+        if values:
+            yield {field: value for field, value in zip(fields, values) if field is not None}
+
+
+def ndjson_rows(lines):
+    """
+    Yields the transactions of newline-delimited JSON, one object per line.
+    """
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def json_rows(data):
+    """
+    Yields the transactions of a JSON document: a list of transactions, a
+    single transaction or a portfolio in the nested form.
+    """
+    if isinstance(data, list):
+        yield from data
+    elif isinstance(data, dict) and "ticker" in data:
+        yield data
+    elif isinstance(data, dict):
+        yield from portfolio_rows(data)
+    else:
+        raise ValueError("expected a transaction, a list of them or a portfolio")
+
+
+class StoredPortfolio(dict):
+    """
+    A portfolio read from the store, in the nested form, together with its id
+    and the revision it was read at. The revision changes on every write, so
+    ``key`` identifies the transactions without serializing or hashing them.
+    """
+
+    def __init__(self, portfolio_id, revision, transactions=()):
+        super().__init__(transactions)
+        self.id = portfolio_id
+        self.revision = revision
+
+    @property
+    def key(self):
+        return (self.id, self.revision)
+
+
+class PortfolioStore:
+    """
+    SQLite-backed store of portfolios.
+
+    Portfolios read from the database are kept in memory until their
+    transactions change, so serving a portfolio costs one query per change
+    rather than one per request. Every write gives the portfolio a new
+    revision (a random token, so a portfolio deleted and created again under
+    the same id does not reuse one).
+    """
+
+    def __init__(self, path=PORTFOLIO_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._portfolios = LRUCache(maxsize=64)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS portfolios (id TEXT PRIMARY KEY, revision TEXT NOT NULL)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(portfolios)")]
+            if "revision" not in columns:
+                # Databases created before portfolios had revisions
+                self._conn.execute("ALTER TABLE portfolios ADD COLUMN revision TEXT NOT NULL DEFAULT ''")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS transactions ("
+                " id INTEGER PRIMARY KEY, portfolio TEXT NOT NULL, currency TEXT NOT NULL,"
+                " ticker TEXT NOT NULL, type TEXT NOT NULL, date TEXT NOT NULL,"
+                " quantity NUMERIC NOT NULL, price REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS transactions_by_ticker"
+                " ON transactions (portfolio, ticker, date)"
+            )
+            # Rows of the imports in progress, private to this connection
+            self._conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS staged_transactions ("
+                " import_id TEXT NOT NULL, number INTEGER NOT NULL, currency TEXT NOT NULL,"
+                " ticker TEXT NOT NULL, type TEXT NOT NULL, date TEXT NOT NULL,"
+                " quantity NUMERIC NOT NULL, price REAL NOT NULL,"
+                " PRIMARY KEY (import_id, number))"
+            )
+
+    def _exists(self, portfolio_id):
+        return self._revision(portfolio_id) is not None
+
+    def _revision(self, portfolio_id):
+        row = self._conn.execute("SELECT revision FROM portfolios WHERE id = ?", (portfolio_id,)).fetchone()
+        return row[0] if row else None
+
+    def _bump_revision(self, portfolio_id):
+        self._conn.execute(
+            "UPDATE portfolios SET revision = ? WHERE id = ?", (uuid.uuid4().hex, portfolio_id)
+        )
+
+    def create(self, portfolio_id=None):
+        """
+        Creates an empty portfolio and returns its id (a random one by default).
+
+        Raises:
+            ValueError: If a portfolio with that id already exists.
+        """
+        portfolio_id = portfolio_id or uuid.uuid4().hex
+        with self._lock, self._conn:
+            if self._exists(portfolio_id):
+                raise ValueError(f"Portfolio {portfolio_id} already exists")
+            self._conn.execute(
+                "INSERT INTO portfolios (id, revision) VALUES (?, ?)", (portfolio_id, uuid.uuid4().hex)
+            )
+        return portfolio_id
+
+    def delete(self, portfolio_id):
+        """
+        Deletes a portfolio and its transactions; returns whether it existed.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM transactions WHERE portfolio = ?", (portfolio_id,))
+            deleted = self._conn.execute("DELETE FROM portfolios WHERE id = ?", (portfolio_id,)).rowcount
+            self._portfolios.pop(portfolio_id)
+        return deleted > 0
+
+    def counts(self):
+        """
+        Returns the number of transactions of every portfolio, by id.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.id, COUNT(t.id) FROM portfolios p"
+                " LEFT JOIN transactions t ON t.portfolio = p.id GROUP BY p.id ORDER BY p.id"
+            ).fetchall()
+        return dict(rows)
+
+    def add_transactions(self, portfolio_id, rows):
+        """
+        Validates and adds transactions to a portfolio, in batches of
+        IMPORT_BATCH_SIZE rows; either all of them are added or none.
+
+        The rows are read and validated without holding the store's lock, so a
+        slow upload does not block the other requests. Each batch is staged in
+        a temporary table, and the staged rows are moved into the portfolio in
+        one statement once the whole import is valid.
+
+        Args:
+            portfolio_id (str): The portfolio.
+            rows: An iterable (e.g. a generator over a stream) of transaction
+                dicts, as taken by ``transaction_row``.
+
+        Returns:
+            int: The number of transactions added.
+
+        Raises:
+            KeyError: If the portfolio does not exist.
+            ValueError: If a row is invalid, or its ticker is already held in
+                another currency, with its (1-based) number.
+        """
+        with self._lock:
+            if not self._exists(portfolio_id):
+                raise KeyError(portfolio_id)
+        import_id = uuid.uuid4().hex
+        # First currency and row of every imported ticker
+        imported = {}
+        added = 0
+        rows = iter(rows)
+        try:
+            while True:
+                batch = []
+                for row in islice(rows, IMPORT_BATCH_SIZE):
+                    number = added + len(batch) + 1
+                    try:
+                        txn = transaction_row(row)
+                    except (ValueError, TypeError, AttributeError) as e:
+                        raise ValueError(f"Row {number}: {e}") from None
+                    currency, ticker = txn[:2]
+                    held, _ = imported.setdefault(ticker, (currency, number))
+                    if currency != held:
+                        raise ValueError(f"Row {number}: {ticker} is held in {held}, not {currency}")
+                    batch.append((import_id, number, *txn))
+                if not batch:
+                    break
+                with self._lock, self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO staged_transactions"
+                        " (import_id, number, currency, ticker, type, date, quantity, price)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        batch,
+                    )
+                added += len(batch)
+
+            with self._lock, self._conn:
+                if not self._exists(portfolio_id):
+                    raise KeyError(portfolio_id)
+                # A ticker is valued in a single currency, so its rows must
+                # all agree with the one already stored
+                for ticker, held in self._conn.execute(
+                    "SELECT DISTINCT ticker, currency FROM transactions WHERE portfolio = ?",
+                    (portfolio_id,),
+                ):
+                    currency, number = imported.get(ticker, (held, None))
+                    if currency != held:
+                        raise ValueError(f"Row {number}: {ticker} is held in {held}, not {currency}")
+                self._conn.execute(
+                    "INSERT INTO transactions"
+                    " (portfolio, currency, ticker, type, date, quantity, price)"
+                    " SELECT ?, currency, ticker, type, date, quantity, price"
+                    " FROM staged_transactions WHERE import_id = ? ORDER BY number",
+                    (portfolio_id, import_id),
+                )
+                if added:
+                    self._bump_revision(portfolio_id)
+                self._portfolios.pop(portfolio_id)
+        finally:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM staged_transactions WHERE import_id = ?", (import_id,))
+        return added
+
+    def get(self, portfolio_id):
+        """
+        Returns a portfolio as a StoredPortfolio in the nested form ({currency:
+        {ticker: [{type, date, quantity, price}]}}, transactions in the order
+        they were added), or None if it does not exist. The returned dict is
+        shared and must not be modified.
+        """
+        portfolio = self._portfolios.get(portfolio_id)
+        if portfolio is not None:
+            return portfolio
+        # Read and cached under the lock, so a concurrent import cannot leave
+        # an outdated portfolio in the cache
+        with self._lock:
+            revision = self._revision(portfolio_id)
+            if revision is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT currency, ticker, type, date, quantity, price FROM transactions"
+                " WHERE portfolio = ? ORDER BY id",
+                (portfolio_id,),
+            ).fetchall()
+            portfolio = StoredPortfolio(portfolio_id, revision)
+            for currency, ticker, txn_type, date, quantity, price in rows:
+                portfolio.setdefault(currency, {}).setdefault(ticker, []).append(
+                    {"type": txn_type, "date": date, "quantity": quantity, "price": price}
+                )
+            self._portfolios.set(portfolio_id, portfolio)
+        return portfolio
+
+    def ticker_transactions(self, portfolio_id, ticker):
+        """
+        Returns the transactions of one ticker of a portfolio in date order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT currency, type, date, quantity, price FROM transactions"
+                " WHERE portfolio = ? AND ticker = ? ORDER BY date, id",
+                (portfolio_id, ticker),
+            ).fetchall()
+        return [
+            {"currency": currency, "type": txn_type, "date": date, "quantity": quantity, "price": price}
+            for currency, txn_type, date, quantity, price in rows
+        ]
+
+
+portfolio_store = PortfolioStore()
@@ -0,0 +1,284 @@
+"""
+Local on-disk store of daily closing prices.
+
+Closes that have already been downloaded are kept in a SQLite database so that
+repeated requests only fetch the bars missing since the last one stored for a
+ticker, instead of re-downloading the whole history every time.
+"""
+import os
+import sqlite3
+import threading
+from datetime import date
+
+import pandas as pd
+
+from market_data import get_provider
+from metrics import market_data_calls_total, stage, timed
+
+PRICE_STORE_PATH = os.environ.get(
+    "PRICE_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "prices.sqlite"),
+)
+
+
+def _to_date(value):
+    """
+    Converts a date-like value (str, datetime, Timestamp) to a naive calendar date.
+    """
+    ts = pd.Timestamp(value)
+    if ts.tz is not None:
+        ts = ts.tz_localize(None)
+    return ts.date()
+
+
+def _daily_closes(hist):
+    """
+    Returns the "Close" column of a downloaded daily history indexed by the
+    exchange-local trading date.
+    """
+    closes = hist["Close"]
+    if isinstance(closes, pd.DataFrame):
+        closes = closes.iloc[:, 0]
+    closes = closes.dropna()
+    if closes.index.tz is not None:
+        closes.index = closes.index.tz_localize(None)
+    closes.index = closes.index.normalize()
+    return closes[~closes.index.duplicated(keep="last")]
+
+
+class PriceStore:
+    """
+    SQLite-backed cache of daily closes.
+
+    For every ticker the store remembers the date range it holds and the day it
+    last checked the provider, so a warm request costs at most one small
+    incremental fetch per ticker per day.
+    """
+
+    def __init__(self, path=PRICE_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS closes ("
+                " ticker TEXT NOT NULL, date TEXT NOT NULL, close REAL NOT NULL,"
+                " PRIMARY KEY (ticker, date)) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS coverage ("
+                " ticker TEXT PRIMARY KEY, start TEXT NOT NULL, end TEXT NOT NULL,"
+                " checked TEXT NOT NULL)"
+            )
+
+    def _write(self, ticker, closes):
+        rows = [
+            (ticker, day.strftime("%Y-%m-%d"), float(close))
+            for day, close in closes.items()
+        ]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO closes (ticker, date, close) VALUES (?, ?, ?)", rows
+        )
+
+    def _coverage(self, ticker):
+        row = self._conn.execute(
+            "SELECT start, end, checked FROM coverage WHERE ticker = ?", (ticker,)
+        ).fetchone()
+        if row is None:
+            return None
+        return tuple(date.fromisoformat(value) for value in row)
+
+    def _last_stored(self, ticker):
+        row = self._conn.execute(
+            "SELECT MAX(date) FROM closes WHERE ticker = ?", (ticker,)
+        ).fetchone()
+        return date.fromisoformat(row[0]) if row[0] else None
+
+    def _missing_ranges(self, ticker, start, end, today):
+        """
+        Returns the (kind, start, end) ranges that must be downloaded so the
+        store holds the closes of ``ticker`` for [start, end).
+        """
+        coverage = self._coverage(ticker)
+        if coverage is None:
+            return [("new", start, end)]
+
+        cov_start, cov_end, checked = coverage
+        ranges = []
+        if start < cov_start:
+            ranges.append(("head", start, cov_start))
+        # The bar of the day the store was last checked may have been partial,
+        # so the tail is refetched from the last stored bar on.
+        if end > cov_end or (checked < today and end > checked):
+            tail_start = min(self._last_stored(ticker) or cov_end, cov_end)
+            ranges.append(("tail", tail_start, max(end, cov_end)))
+        return ranges
+
+    def _store(self, ticker, closes, kind, start, end, today):
+        self._write(ticker, closes)
+        coverage = self._coverage(ticker)
+        if coverage is None:
+            self._conn.execute(
+                "INSERT INTO coverage VALUES (?, ?, ?, ?)",
+                (ticker, start.isoformat(), end.isoformat(), today.isoformat()),
+            )
+            return
+        cov_start, cov_end, checked = coverage
+        if kind == "tail":
+            checked = today
+        self._conn.execute(
+            "UPDATE coverage SET start = ?, end = ?, checked = ? WHERE ticker = ?",
+            (
+                min(start, cov_start).isoformat(),
+                max(end, cov_end).isoformat(),
+                checked.isoformat(),
+                ticker,
+            ),
+        )
+
+    def refresh(self, tickers, start, end):
+        """
+        Makes sure the store holds the closes of ``tickers`` for [start, end),
+        downloading only the parts that are missing or may have changed.
+
+        The missing ranges of all tickers are merged per kind (new tickers,
+        older history, recent bars), so a refresh costs at most one batched
+        provider call per kind regardless of the number of tickers. A ticker
+        whose download fails keeps its coverage, so the next refresh fetches it
+        again.
+        """
+        start, end = _to_date(start), _to_date(end)
+        today = date.today()
+        with self._lock:
+            batches = {}
+            for ticker in dict.fromkeys(tickers):
+                for kind, fetch_start, fetch_end in self._missing_ranges(ticker, start, end, today):
+                    batch = batches.setdefault(kind, [fetch_start, fetch_end, []])
+                    batch[0] = min(batch[0], fetch_start)
+                    batch[1] = max(batch[1], fetch_end)
+                    batch[2].append(ticker)
+
+        for kind, (fetch_start, fetch_end, batch_tickers) in batches.items():
+            with stage("fetch", kind="history"):
+                try:
+                    histories = get_provider().batch_history(
+                        batch_tickers, fetch_start, fetch_end, interval="1d"
+                    )
+                except Exception:
+                    market_data_calls_total.inc(kind="history", result="error")
+                    raise
+            market_data_calls_total.inc(kind="history", result="ok")
+            with self._lock, self._conn:
+                for ticker in batch_tickers:
+                    # Tickers whose download failed are left to the next request
+                    if ticker not in histories:
+                        continue
+                    hist = histories[ticker]
+                    if hist is None or hist.empty:
+                        closes = pd.Series(dtype=float)
+                    else:
+                        closes = _daily_closes(hist)
+                    self._store(ticker, closes, kind, fetch_start, fetch_end, today)
+
+    def checked(self, tickers):
+        """
+        Returns the day the provider was last asked for the recent closes of
+        each of ``tickers``, or None for a ticker never fetched. The closes
+        stored for the days before it are final.
+        """
+        result = {}
+        with self._lock:
+            for ticker in tickers:
+                coverage = self._coverage(ticker)
+                result[ticker] = coverage[2] if coverage is not None else None
+        return result
+
+    @timed("store")
+    def get_closes_frame(self, tickers, start, end):
+        """
+        Returns the daily closes of several tickers for [start, end) as a
+        DataFrame with one column per ticker, fetching any missing bars first.
+
+        Args:
+            tickers (list): The ticker symbols (e.g., ['AAPL', '^IXIC']).
+            start: First date of the range (inclusive).
+            end: Last date of the range (exclusive).
+
+        Returns:
+            pd.DataFrame: Closing prices indexed by trading date; a ticker's
+            column is NaN on dates it did not trade.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        self.refresh(tickers, start, end)
+        placeholders = ", ".join("?" * len(tickers))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT date, ticker, close FROM closes WHERE ticker IN ({placeholders})"
+                " AND date >= ? AND date < ? ORDER BY date",
+                (*tickers, _to_date(start).isoformat(), _to_date(end).isoformat()),
+            ).fetchall()
+        frame = pd.DataFrame(rows, columns=["date", "ticker", "close"])
+        frame = frame.pivot(index="date", columns="ticker", values="close")
+        frame.index = pd.DatetimeIndex(frame.index)
+        frame.columns.name = None
+        return frame.reindex(columns=tickers)
+
+    @timed("store")
+    def get_closes_asof(self, tickers, dates, start=None):
+        """
+        Returns the last stored close of each ticker on or before each of
+        ``dates``, without fetching; call ``refresh`` first.
+
+        The closes up to the last date are read in one query and carried
+        forward onto the dates, so the cost does not grow with their number.
+
+        Args:
+            tickers (list): The ticker symbols.
+            dates: Array-like of dates.
+            start: Closes before this date are ignored.
+
+        Returns:
+            pd.DataFrame: One row per date and one column per ticker, NaN where
+            no close is stored.
+        """
+        tickers = list(dict.fromkeys(tickers))
+        dates = pd.DatetimeIndex(dates)
+        if len(dates) == 0 or not tickers:
+            return pd.DataFrame(float("nan"), index=dates, columns=tickers)
+        lower = _to_date(start).isoformat() if start is not None else ""
+        placeholders = ", ".join("?" * len(tickers))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT date, ticker, close FROM closes WHERE ticker IN ({placeholders})"
+                " AND date >= ? AND date <= ? ORDER BY date",
+                (*tickers, lower, dates.max().strftime("%Y-%m-%d")),
+            ).fetchall()
+        frame = pd.DataFrame(rows, columns=["date", "ticker", "close"])
+        frame = frame.pivot(index="date", columns="ticker", values="close")
+        frame.index = pd.DatetimeIndex(frame.index)
+        frame.columns.name = None
+        frame = frame.reindex(columns=tickers).astype(float)
+        # Each column is carried forward separately, so a ticker's gaps are
+        # filled with its own last close
+        known = frame.reindex(frame.index.union(dates.unique())).ffill()
+        return known.reindex(dates)
+
+    def get_closes(self, ticker, start, end):
+        """
+        Returns the daily closes of ``ticker`` for [start, end) as a Series
+        indexed by trading date, fetching any missing bars first.
+
+        Args:
+            ticker (str): The ticker symbol (e.g., 'AAPL').
+            start: First date of the range (inclusive).
+            end: Last date of the range (exclusive).
+
+        Returns:
+            pd.Series: Closing prices, empty if the provider has no data.
+        """
+        return self.get_closes_frame([ticker], start, end)[ticker].dropna().rename("Close")
+
+
+price_store = PriceStore()
@@ -1,69 +1,90 @@
-import math
-import yfinance as yf
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import matplotlib.dates as mdates
-import pytz
 import pandas as pd
 import matplotlib.gridspec as gridspec
 import textwrap
-import numpy as np
-import textwrap
-from currency_converter import CurrencyConverter
-
-currencyConverter = CurrencyConverter(
-    fallback_on_missing_rate=True,
-    fallback_on_missing_rate_method="last_known",
-    fallback_on_wrong_date=True,
+from concurrent.futures import ThreadPoolExecutor
+from analytics import roi_percentage, transaction_markers
+from columnar import encode_frame, encode_series, encode_values, epoch_ms
+from downsample import downsample_indices
+from cache import LRUCache
+from fx import fx_table
+from intraday import intraday_store, splice_closes
+from ledger import parse_portfolio
+from market_data import (
+    INFO_TTL,
+    gather,
+    get_info,
+    get_quote,
+    iter_completed,
+    submit_concurrently,
 )
+from metrics import stage
+from price_store import price_store
+from report_pages import collect_ticker_pages, figure_pdf, submit_ticker_pages, ticker_page_pool, write_pdf
+from result_cache import ResultCache, portfolio_hash, portfolio_key
+from rollforward import SERIES_COLUMNS, benchmark_series, roll_forward, roll_forward_benchmark, simulate_window
+
+# Computed analytics shared by the endpoints and the report, one entry per
+# portfolio and window plus one per comparison index (see get_portfolio_analytics)
+analytics_cache = ResultCache(maxsize=64, ttl=INFO_TTL)
 
-# try:
-#     USD_TO_CAD = currencyConverter.convert(
-#         100, "USD", "CAD", date=datetime.now() - timedelta(days=5)
-#     )
-# except Exception as e:
-#     print(f"Error fetching USD to CAD conversion rate: {e}")
-#     USD_TO_CAD = 1.43
-# print(f"USD to CAD conversion rate: {USD_TO_CAD}")
+# Parsed transactions by portfolio (see get_ledger)
+ledger_cache = LRUCache(maxsize=16)
+
+# Names of the comparison indices and of the report's per-currency sections
+BENCHMARK_NAMES = {"^IXIC": "NASDAQ", "^GSPC": "S&P 500", "^DJI": "Dow Jones"}
+SECTION_TITLES = {"USD": "American Equities", "CAD": "Canadian Equities", "INR": "Indian Equities"}
+
+
+def get_ledger(portfolio):
+    """
+    Returns the transactions of the portfolio parsed into a Ledger (see
+    ledger.py), shared by every function of the report and parsed again only
+    when the transactions change.
+    """
+    key = portfolio_key(portfolio)
+    ledger = ledger_cache.get(key)
+    if ledger is None:
+        ledger = parse_portfolio(portfolio)
+        ledger_cache.set(key, ledger)
+    return ledger
 
 
 def get_start_date(portfolio):
     """
     Returns the earliest date from all transactions in the portfolio.
     """
-    earliest_date = None
-    for currency in portfolio.keys():
-        for ticker, txns in portfolio[currency].items():
-            for txn in txns:
-                txn_date = pd.to_datetime(txn["date"]).tz_localize(None).normalize()
-                if earliest_date is None or txn_date < earliest_date:
-                    earliest_date = txn_date
-    return earliest_date
+    return get_ledger(portfolio).start_date
+
+
+def get_window(start_date, end_date, start=None, end=None):
+    """
+    Returns the (first, last) dates of the requested window, clamped to the
+    portfolio's date range [start_date, end_date].
+    """
+    window_end = min(pd.Timestamp(end), pd.Timestamp(end_date)) if end is not None else pd.Timestamp(end_date)
+    window_start = max(pd.Timestamp(start), pd.Timestamp(start_date)) if start is not None else pd.Timestamp(start_date)
+    return min(window_start, window_end).normalize(), window_end
 
 
 def calc_ticker_performance(transactions, current_price, currency=None):
+    """
+    Returns the money invested in a ticker, its final value (holdings at
+    ``current_price`` plus the proceeds of the sales) and the ROI, in CAD.
 
-    total_invested = 0
-    current_shares = 0
-    return_value = 0
-    for txn in transactions:  # basic
-        if txn["type"] == "buy":
-            total_invested += txn["quantity"] * txn["price"]
-            current_shares += txn["quantity"]
-        elif txn["type"] == "sell":
-            return_value += txn["quantity"] * txn["price"]
-            current_shares -= txn["quantity"]
+    Args:
+        transactions (Ledger): The ticker's transactions (Ledger.for_ticker).
+        current_price (float): The ticker's latest price.
+        currency (str, optional): The ticker's currency, converted to CAD at today's rate.
+    """
+    total_invested, current_shares, return_value = transactions.totals()
 
     current_value = current_shares * current_price + return_value
-    current_value = (
-        currencyConverter.convert(current_value, currency, "CAD")
-        if currency
-        else current_value
-    )
-
-    total_invested = (
-        currencyConverter.convert(total_invested, currency, "CAD") if currency else total_invested
-    )
+    rate = fx_table.rate(currency, datetime.today()) if currency else 1.0
+    current_value = current_value * rate
+    total_invested = total_invested * rate
 
     growth = ((current_value - total_invested) / total_invested) * 100
     # result = f"{ticker} Stock - Total Invested: {total_invested:.1f}CAD, Final Value: {current_value:.1f}CAD, ROI: {growth:.1f}%"
@@ -74,686 +95,540 @@ def calc_ticker_performance(transactions, current_price, currency=None):
     }
 
 
-def get_individual_performance(ticker, start_date, end_date, interval, transactions=None, current_price=None, currency=None):
+def get_individual_performance(ticker, start_date, end_date, interval, transactions=None, current_price=None, currency=None, prices=None, series_format="json", points=None, view=None):
     """
     Downloads historical stock price data and plots it, optionally overlaying buy and sell transactions,
     and the last price directly on the plot.
-    """
-    data = yf.download(ticker, start_date, end_date, interval=interval)
 
-    # if data.index.tz is None:
-    #     data.index = data.index.tz_localize("UTC").tz_convert("America/New_York")
-    # else:
-    #     data.index = data.index.tz_convert("America/New_York")
+    ``interval`` is "1d" for daily closes, or an intraday interval (e.g. "15m"
+    or "4h") for session bars over the viewport, or the whole range without
+    one, as far back as the provider serves them (see intraday.py); the
+    daily closes fill the rest of the range.
 
-    # business_days_data = data[data.index.dayofweek < 5]
+    With ``series_format="columnar"`` the prices are encoded as
+    {"index": [epoch ms...], "values": [...]} instead of a ``to_json()`` string,
+    and ``points`` and ``view`` (start, end) downsample them for a chart of that
+    many points.
 
-    # market_open = pd.Timestamp("09:30:00", tz="America/New_York").time()
-    # market_close = pd.Timestamp("16:00:00", tz="America/New_York").time()
-    # market_hours_data = business_days_data.between_time(market_open, market_close)
+    ``transactions`` is the ticker's Ledger (see get_ledger); those dated within
+    the charted days are listed as written in the portfolio.
 
-    prices = data["Close"][ticker]
+    The listed transactions are also returned as "markers", aggregated per bar
+    and side with the bar's date in epoch milliseconds (see
+    analytics.transaction_markers).
+    """
+    if prices is None:
+        prices = price_store.get_closes(ticker, start_date, end_date)
+    if interval != "1d":
+        # Bars of the interval over the viewport, within the daily closes of
+        # the rest of the range
+        first, last = get_window(start_date, end_date, *(view or (None, None)))
+        bars = intraday_store.get_closes(ticker, first, last, interval)
+        prices = splice_closes(prices, bars)
+
+    listed = []
+    if transactions is not None:
+        # Only the transactions inside the charted dates are shown
+        listed = transactions.between(start_date, end_date).records()
+
+    # The buys and sells are placed on their bars at full resolution, so the
+    # client can draw them without matching dates itself
+    markers = transaction_markers(listed, prices.index)
+    marker_dates = epoch_ms(prices.index[[marker["position"] for marker in markers]])
+
+    if points is not None or view is not None:
+        prices = prices.iloc[downsample_indices(prices.index, [prices], points, view)]
 
     result = {
-        'prices': prices.to_json(),
-        'transactions': [],
+        'prices': encode_series(prices) if series_format == "columnar" else prices.to_json(),
+        'transactions': listed,
+        'markers': [
+            {
+                "type": marker["type"],
+                "date": date,
+                "price": marker["price"],
+                "quantity": marker["quantity"],
+            }
+            for marker, date in zip(markers, marker_dates)
+        ],
     }
 
-    if transactions:
-        result['transactions'] = transactions
-
     perf = calc_ticker_performance(transactions, current_price, currency)
     result['performance'] = perf
 
     return result
 
 
-def get_portfolio_performances(portfolio):
-    start_date = get_start_date(portfolio)
-    end_date = datetime.today() + timedelta(days=1)
+def iter_portfolio_performances(portfolio, series_format="json", points=None, view=None, start=None, end=None, interval="1d"):
+    """
+    Yields (currency, ticker, performance) for every ticker of the portfolio as
+    soon as its quote arrives, so a slow ticker does not hold up the others.
+    The arguments are those of ``get_portfolio_performances``.
+    """
+    ledger = get_ledger(portfolio)
+    if ledger.start_date is None:
+        # A portfolio without transactions has no tickers
+        return
+    start_date, end_date = get_window(
+        ledger.start_date, datetime.today() + timedelta(days=1), start, end
+    )
+    currencies = ledger.currencies
+    # Quotes are fetched concurrently while the price history is loaded
+    pending_quotes = submit_concurrently(get_quote, currencies)
+    # Closes up to the last day of the window, or today if it ends later
+    closes_end = min(end_date, pd.Timestamp(datetime.today()).normalize()) + timedelta(days=1)
+    closes = price_store.get_closes_frame(list(currencies), start_date, closes_end)
+    if interval != "1d":
+        # The intraday bars of all tickers are fetched in one batch up front
+        intraday_store.refresh(
+            list(currencies), *get_window(start_date, end_date, *(view or (None, None))), interval
+        )
+    for ticker, quote, error in iter_completed(pending_quotes):
+        currency = currencies[ticker]
+        prices = closes[ticker].dropna()
+        if error is None:
+            current_price = quote
+        else:
+            # Fall back to the last close when the quote is unavailable
+            print(f"Error fetching quote for {ticker}: {error}")
+            current_price = prices.iloc[-1] if not prices.empty else 0.0
+        with stage("performance", ticker=ticker):
+            performance = get_individual_performance(ticker, start_date, end_date, interval=interval, transactions=ledger.for_ticker(ticker), current_price=current_price, currency=currency, prices=prices, series_format=series_format, points=points, view=view)
+        yield currency, ticker, performance
+
+
+def get_portfolio_performances(portfolio, series_format="json", points=None, view=None, start=None, end=None, interval="1d"):
+    """
+    Returns the prices, transactions and performance of every ticker of the
+    portfolio, by currency. ``start`` and ``end`` restrict the prices and the
+    listed transactions to a window of days; the performance always covers all
+    transactions. ``interval`` is the bar size of the prices, as in
+    ``get_individual_performance``. Tickers without any transaction are left
+    out.
+    """
+    performances = {
+        (currency, ticker): performance
+        for currency, ticker, performance in iter_portfolio_performances(
+            portfolio, series_format, points, view, start, end, interval
+        )
+    }
     result = {}
     for currency in portfolio.keys():
         result[currency] = {}
-        for ticker, txns in portfolio[currency].items():
-            stock = yf.Ticker(ticker)
-            current_price = stock.info['currentPrice']
-            result[currency][ticker] = get_individual_performance(ticker, start_date, end_date, interval="1d", transactions=txns, current_price=current_price, currency=currency)
+        for ticker in portfolio[currency].keys():
+            performance = performances.get((currency, ticker))
+            if performance is not None:
+                result[currency][ticker] = performance
 
     return result
 
 
-def get_comparison_data(portfolio, comparison="^IXIC"):
-    start_date = get_start_date(portfolio)
+def compute_portfolio_analytics(portfolio, comparisons, start=None, end=None):
+    """
+    Computes the analytics of a portfolio shown by the dashboard and the PDF
+    report, but the benchmarks (see compute_benchmark and
+    get_portfolio_analytics). The closes of the ``comparisons`` indices are
+    fetched in the same batch as the tickers'.
+    """
+    ledger = get_ledger(portfolio)
+    start_date = ledger.start_date
     end_date = datetime.today() + timedelta(days=1)
-    # Process all transactions
-    transactions = []
-    for currency in portfolio.keys():
-        for ticker, txns in portfolio[currency].items():
-            for txn in txns:
-                # Normalize the date (without timezone)
-                date = pd.to_datetime(txn["date"]).tz_localize(None).normalize()
-                transactions.append(
-                    {
-                        "date": date,
-                        "ticker": ticker,
-                        "type": txn["type"],
-                        "quantity": txn["quantity"],
-                        "price": txn["price"],
-                        "currency": currency,
-                    }
-                )
-    # Sort chronologically
-    transactions.sort(key=lambda x: x["date"])
 
     # Identify tickers
-    cad_tickers = list(portfolio["CAD"].keys())
-    all_tickers = []
-    for currency in portfolio.keys():
-        all_tickers += list(portfolio[currency].keys())
-
-    # ------------------------------
-    # Fetch historical prices for portfolio tickers
-    # ------------------------------
-    historical_prices = {}
-    date_range = pd.date_range(start=start_date, end=end_date, freq="D")
-    for currency in portfolio.keys():
-        for ticker in portfolio[currency].keys():
-            stock = yf.Ticker(ticker)
-            hist = stock.history(start=start_date, end=end_date, interval="1d")["Close"]
-            if hist.empty:
-                print(f"No data for {ticker}")
-                historical_prices[ticker] = pd.Series(0.0, index=date_range)
-                continue
-            # If tz-naive, localize to UTC; otherwise, convert to UTC
-            if hist.index.tz is None:
-                hist.index = hist.index.tz_localize("UTC")
-            else:
-                hist.index = hist.index.tz_convert("UTC")
-            # Remove time information and normalize the index
-            hist.index = hist.index.tz_localize(None).normalize()
-            hist_reindexed = hist.reindex(date_range, method="ffill")
-            historical_prices[ticker] = hist_reindexed
-
-    # ------------------------------
-    # Fetch NASDAQ historical prices
-    # ------------------------------
-    nasdaq_stock = yf.Ticker(comparison)  # ^IXIC
-    nasdaq_hist = nasdaq_stock.history(start=start_date, end=end_date, interval="1d")[
-        "Close"
-    ]
-    if nasdaq_hist.empty:
-        print("No data for NASDAQ")
-        nasdaq_hist = pd.Series(0.0, index=date_range)
-    else:
-        if nasdaq_hist.index.tz is None:
-            nasdaq_hist.index = nasdaq_hist.index.tz_localize("UTC")
-        else:
-            nasdaq_hist.index = nasdaq_hist.index.tz_convert("UTC")
-        nasdaq_hist.index = nasdaq_hist.index.tz_localize(None).normalize()
-        nasdaq_hist = nasdaq_hist.reindex(date_range, method="ffill")
-
-    # ------------------------------
-    # Calculate portfolio time series
-    # ------------------------------
-    current_holdings = {ticker: 0 for ticker in all_tickers}
-    current_cash = 0.0  # Cash on hand (CAD)
-    current_cash_invested = 0.0  # Total money invested into the portfolio
-
-    # Create timeseries to track portfolio metrics
-    cash_invested_ts = pd.Series(0.0, index=date_range)
-    portfolio_value_ts = pd.Series(0.0, index=date_range)
-    equity_ts = pd.Series(0.0, index=date_range)
-    cash_ts = pd.Series(0.0, index=date_range)
-
-    txn_index = 0
-    for i, date in enumerate(date_range):
-        # Process all transactions for the current date
-        while txn_index < len(transactions) and transactions[txn_index]["date"] == date:
-            txn = transactions[txn_index]
-            ticker = txn["ticker"]
-            txn_type = txn["type"]
-            quantity = txn["quantity"]
-            price = txn["price"]
-            currency = txn["currency"]
-
-            # Convert price to CAD if needed
-            price_cad = (
-                currencyConverter.convert(price, currency, "CAD", date=txn["date"])
-                if currency != "CAD"
-                else price
-            )
-            txn_value = quantity * price_cad
-
-            if txn_type == "buy":
-                current_holdings[ticker] += quantity
-                if current_cash >= txn_value:
-                    current_cash -= txn_value
-                else:
-                    # Additional funds are invested if cash is insufficient
-                    needed = txn_value - current_cash
-                    current_cash_invested += needed
-                    current_cash = 0
-            elif txn_type == "sell":
-                current_holdings[ticker] -= quantity
-                current_cash += txn_value
-
-            txn_index += 1
-
-        # Calculate portfolio equity from current holdings
-        equity = 0.0
-        for currency in portfolio.keys():
-            for ticker in portfolio[currency].keys():
-                if current_holdings[ticker] == 0:
-                    continue
-                price = historical_prices[ticker].iloc[i]
-                price_cad = (
-                    currencyConverter.convert(price, currency, "CAD", date=txn["date"])
-                    if currency != "CAD"
-                    else price
-                )
-                equity += current_holdings[ticker] * price_cad
-
-        portfolio_value = equity + current_cash
-        cash_invested_ts[date] = current_cash_invested
-        portfolio_value_ts[date] = portfolio_value
-        equity_ts[date] = equity
-        cash_ts[date] = current_cash
-
-    # ------------------------------
-    # Simulate NASDAQ-equivalent portfolio
-    # ------------------------------
-    # For the NASDAQ portfolio, assume that whenever additional money is invested in your portfolio,
-    # you invest that same cash amount into NASDAQ at that day’s price.
-    nasdaq_shares = 0.0
-    nasdaq_value_ts = pd.Series(0.0, index=date_range)
-    # Calculate the day-to-day increment in cash invested
-    cash_invested_diff = cash_invested_ts.diff().fillna(cash_invested_ts.iloc[0])
-
-    for i, date in enumerate(date_range):
-        additional_investment = cash_invested_diff[date]
-        # If additional cash is invested, buy NASDAQ shares at the closing price for that day.
-        if additional_investment > 0 and nasdaq_hist[date] != 0:
-            nasdaq_shares += additional_investment / nasdaq_hist[date]
-        # The NASDAQ-equivalent portfolio value is the total shares held times the current NASDAQ price.
-        nasdaq_value_ts[date] = nasdaq_shares * nasdaq_hist[date]
-
-    nasdaq_pnl = nasdaq_value_ts.diff().fillna(0) - cash_invested_ts.diff().fillna(0)
-    n_prev_value = nasdaq_value_ts.shift(1)
-    nasdaq_pnl_percentage = (nasdaq_pnl / n_prev_value.replace(0, np.nan)).fillna(
-        0
-    ) * 100
-    nasdaq_pct = pd.Series(nasdaq_pnl_percentage, index=portfolio_value_ts.index)
-
-    daily_pnl = portfolio_value_ts.diff().fillna(0) - cash_invested_ts.diff().fillna(0)
-    prev_value = portfolio_value_ts.shift(1)
-    daily_pnl_percentage = (daily_pnl / prev_value.replace(0, np.nan)).fillna(0) * 100
-    daily_pnl_percentage = pd.Series(
-        daily_pnl_percentage, index=portfolio_value_ts.index
+    currencies = ledger.currencies
+    all_tickers = list(currencies)
+
+    # Company details are fetched concurrently while the series are rolled
+    # forward from the last stored checkpoint
+    pending_details = submit_concurrently(get_stock_details, all_tickers)
+    txn_frame = ledger.frame()
+    window_start, window_end = get_window(start_date, end_date, start, end)
+    price_store.refresh(
+        all_tickers + list(comparisons),
+        start_date,
+        min(window_end, pd.Timestamp(datetime.today()).normalize()) + timedelta(days=1),
     )
+    if start is None and end is None:
+        series, state = roll_forward(checkpoint_id(portfolio), txn_frame, currencies, start_date, end_date)
+    else:
+        series, state = simulate_window(txn_frame, currencies, start_date, window_start, window_end)
 
-    # Final summary text for Section 1
-    final_cash_invested = int(cash_invested_ts.iloc[-1])
-    final_portfolio_value = int(portfolio_value_ts.iloc[-1])
-    final_nasdaq_value = int(nasdaq_value_ts.iloc[-1])
-    roi_portfolio = (
-        ((final_portfolio_value - final_cash_invested) / final_cash_invested * 100)
-        if final_cash_invested != 0
-        else 0
-    )
-    roi_nasdaq = (
-        ((final_nasdaq_value - final_cash_invested) / final_cash_invested * 100)
-        if final_cash_invested != 0
-        else 0
-    )
-    # final_text = f"Portfolio - Invested: {final_cash_invested}CAD, Final Value: {final_portfolio_value}CAD, ROI: {roi_portfolio:.2f}%, NASDAQ: {roi_nasdaq:.2f}%"
+    final_cash_invested = int(series["cash_invested"].iloc[-1])
+    final_portfolio_value = int(series["portfolio_value"].iloc[-1])
 
     holdings = []
     labels = []
-    for currency in portfolio.keys():
-        for ticker in portfolio[currency].keys():
-            quantity = current_holdings[ticker]
-            if quantity > 0:
-                price = historical_prices[ticker].iloc[-1]
-                if currency != "CAD":
-                    value = quantity * currencyConverter.convert(price, currency, "CAD", date=txn["date"])
-                else:
-                    value = quantity * price
-                holdings.append(value)
-                labels.append(f"{ticker}\n({quantity} shares)")
-    holdings.append(current_cash)
-    labels.append(f"Cash\n({current_cash:.2f} CAD)")
+    for ticker, currency in currencies.items():
+        quantity = state["holdings"][ticker]
+        if quantity > 0:
+            value = quantity * state["last_close"][ticker] * fx_table.rate(currency, state["date"])
+            holdings.append(value)
+            labels.append(f"{ticker}\n({quantity} shares)")
+    holdings.append(state["cash"])
+    labels.append(f"Cash\n({state['cash']:.2f} CAD)")
     filtered = [(l, v) for l, v in zip(labels, holdings) if v > 0]
     if filtered:
         pie_labels, pie_sizes = zip(*filtered)
     else:
         pie_labels, pie_sizes = ([], [])
 
-    summaries = []
-    for currency in portfolio.keys():
-        for ticker in portfolio[currency].keys():
-            summaries.append(get_stock_details(ticker))
+    return {
+        "currencies": currencies,
+        "series": series,
+        "state": state,
+        "portfolio_value": final_portfolio_value,
+        "cash_invested": final_cash_invested,
+        "roi_portfolio": roi_percentage(final_portfolio_value, final_cash_invested),
+        "composition": {
+            "labels": pie_labels,
+            "sizes": pie_sizes,
+        },
+        "summaries": get_stock_details_many(all_tickers, pending_details),
+    }
+
+
+def checkpoint_id(portfolio):
+    """
+    Returns the id the roll-forward checkpoints of a portfolio are stored
+    under: its id in the portfolio store, or its content hash for any other.
+    """
+    return getattr(portfolio, "id", None) or portfolio_hash(portfolio)
+
+
+def compute_benchmark(portfolio, analytics, comp_ticker, windowed=False):
+    """
+    Computes the portfolio investing the same cash as ``portfolio`` into the
+    ``comp_ticker`` index over the days of its ``analytics`` (as returned by
+    compute_portfolio_analytics): whenever additional money is invested in the
+    portfolio, the same amount is invested into the index at that day's price.
+    Over the whole history (not ``windowed``), only the days since the last
+    checkpoint of the index's shares are computed (see rollforward.py).
+    """
+    ledger = get_ledger(portfolio)
+    cash_invested = analytics["series"]["cash_invested"]
+    if windowed:
+        comp_value_ts, comp_pnl = benchmark_series(
+            comp_ticker, ledger.frame(), cash_invested, ledger.start_date
+        )
+    else:
+        comp_value_ts, comp_pnl = roll_forward_benchmark(
+            checkpoint_id(portfolio), comp_ticker, ledger.frame(), ledger.currencies, cash_invested
+        )
+    final_comp_value = int(comp_value_ts.iloc[-1])
+    return {
+        "value": comp_value_ts,
+        "pnl": comp_pnl,
+        "comp_value": final_comp_value,
+        "roi_comp": roi_percentage(final_comp_value, analytics["cash_invested"]),
+    }
 
+
+def empty_analytics(comparisons):
+    """
+    Returns the analytics of a portfolio without transactions, in the form of
+    get_portfolio_analytics: empty series and nothing invested or held.
+    """
+    series = pd.DataFrame(columns=SERIES_COLUMNS, index=pd.DatetimeIndex([]), dtype=float)
+    return {
+        "currencies": {},
+        "series": series,
+        "state": {
+            "date": pd.Timestamp(datetime.today()).normalize(),
+            "holdings": pd.Series(dtype=int),
+            "cash": 0.0,
+            "invested": 0.0,
+            "portfolio_value": 0.0,
+            "last_close": pd.Series(dtype=float),
+        },
+        "portfolio_value": 0,
+        "cash_invested": 0,
+        "roi_portfolio": 0,
+        "benchmarks": {
+            comp_ticker: {
+                "value": pd.Series(index=series.index, dtype=float),
+                "pnl": pd.Series(index=series.index, dtype=float),
+                "comp_value": 0,
+                "roi_comp": 0,
+            }
+            for comp_ticker in comparisons
+        },
+        "composition": {"labels": [], "sizes": []},
+        "summaries": [],
+    }
+
+
+def get_portfolio_analytics(portfolio, comparisons=("^IXIC",), start=None, end=None):
+    """
+    Returns the computed analytics of a portfolio, the single source of the
+    dashboard endpoints and the PDF report.
+
+    The analytics are cached by portfolio (see result_cache.portfolio_key),
+    window and market-data day, and the benchmark of every comparison index
+    separately, so a report of a portfolio just viewed on the dashboard (or the
+    other way around) neither downloads nor computes anything again, whichever
+    indices either asked for. The returned dict must not be modified; its
+    values are shared. A portfolio without transactions has empty series (see
+    empty_analytics).
+
+    Args:
+        portfolio (dict): Transactions by currency and ticker.
+        comparisons (list): The comparison index tickers.
+        start, end (optional): The window of days, as for get_comparison_data;
+            a window covering the whole history is the same as no window.
+
+    Returns:
+        dict: currencies (ticker -> currency), series (cash_invested,
+        portfolio_value, equity, cash and pnl), state (holdings, cash,
+        last_close, ... at the last day), the final portfolio_value,
+        cash_invested and roi_portfolio, benchmarks (value, pnl, comp_value and
+        roi_comp by index), composition (pie labels and sizes) and summaries
+        (company details, in portfolio order).
+    """
+    comparisons = list(comparisons)
+    start_date = get_start_date(portfolio)
+    if start_date is None:
+        return empty_analytics(comparisons)
+    if start is not None and pd.Timestamp(start) <= start_date:
+        start = None
+    if end is not None and pd.Timestamp(end) >= pd.Timestamp(datetime.today() + timedelta(days=1)).normalize():
+        end = None
+    window = {"start": start, "end": end}
+    analytics = analytics_cache.get_or_compute(
+        "analytics",
+        portfolio,
+        window,
+        lambda: compute_portfolio_analytics(portfolio, comparisons, start, end),
+    )
+    benchmarks = {
+        comp_ticker: analytics_cache.get_or_compute(
+            "benchmark",
+            portfolio,
+            dict(window, comparison=comp_ticker),
+            lambda comp_ticker=comp_ticker: compute_benchmark(
+                portfolio, analytics, comp_ticker, windowed=start is not None or end is not None
+            ),
+        )
+        for comp_ticker in comparisons
+    }
+    return dict(analytics, benchmarks=benchmarks)
+
+
+def get_comparison_data(portfolio, comparison="^IXIC", series_format="json", points=None, view=None, start=None, end=None):
+    """
+    Computes the portfolio value, cash invested and daily PnL series and compares
+    them with portfolios investing the same cash into a comparison index.
+
+    ``comparison`` is either one index ticker, or a list of tickers in which case
+    the portfolio series are returned once together with a "benchmarks" entry
+    per index. Only the days since the last stored checkpoint are simulated
+    (see rollforward.py); the series come from get_portfolio_analytics, which
+    they share with generate_report.
+
+    With ``series_format="columnar"`` the series are returned in a "series"
+    entry sharing one epoch-millisecond index (see columnar.py), and the
+    benchmarks always in the "benchmarks" entry.
+
+    ``points`` and ``view`` (start, end) reduce the series to what a chart of
+    that many points needs, at full resolution inside the viewport (see
+    downsample.py); the summary values are always computed on the full series.
+
+    ``start`` and ``end`` restrict the series to a window of days: only the
+    window is fetched and simulated, starting from the holdings and cash left by
+    the earlier transactions, and the summary values are those at ``end``.
+    """
+    comparisons = [comparison] if isinstance(comparison, str) else list(comparison)
+    analytics = get_portfolio_analytics(portfolio, comparisons, start, end)
+    series = analytics["series"]
+    cash_invested_ts = series["cash_invested"]
+    portfolio_value_ts = series["portfolio_value"]
+    daily_pnl_percentage = series["pnl"]
+    final_cash_invested = analytics["cash_invested"]
+    final_portfolio_value = analytics["portfolio_value"]
+    roi_portfolio = analytics["roi_portfolio"]
+    benchmarks = {
+        comp_ticker: dict(benchmark) for comp_ticker, benchmark in analytics["benchmarks"].items()
+    }
+
+    # Only the rows a chart of ``points`` points needs are sent, at full
+    # resolution inside the viewport
+    if points is not None or view is not None:
+        keep = downsample_indices(
+            series.index,
+            [portfolio_value_ts, cash_invested_ts, daily_pnl_percentage]
+            + [benchmark[name] for benchmark in benchmarks.values() for name in ("value", "pnl")],
+            points,
+            view,
+        )
+        series = series.iloc[keep]
+        portfolio_value_ts = portfolio_value_ts.iloc[keep]
+        cash_invested_ts = cash_invested_ts.iloc[keep]
+        daily_pnl_percentage = daily_pnl_percentage.iloc[keep]
+        for benchmark in benchmarks.values():
+            benchmark["value"] = benchmark["value"].iloc[keep]
+            benchmark["pnl"] = benchmark["pnl"].iloc[keep]
+
+    composition = analytics["composition"]
+    summaries = analytics["summaries"]
+
+    if series_format == "columnar":
+        return {
+            "info": {
+                "portfolio_value": final_portfolio_value,
+                "cash_invested": final_cash_invested,
+                "roi_portfolio": roi_portfolio,
+            },
+            "series": encode_frame(
+                {
+                    "portfolio_value": portfolio_value_ts,
+                    "cash_invested": cash_invested_ts,
+                    "pnl": daily_pnl_percentage,
+                },
+                series.index,
+            ),
+            "benchmarks": {
+                comp_ticker: {
+                    "comp_value": benchmark["comp_value"],
+                    "roi_comp": benchmark["roi_comp"],
+                    "value": encode_values(benchmark["value"]),
+                    "pnl": encode_values(benchmark["pnl"]),
+                }
+                for comp_ticker, benchmark in benchmarks.items()
+            },
+            "composition": composition,
+            "summaries": summaries,
+        }
+
+    if isinstance(comparison, str):
+        benchmark = benchmarks[comparison]
+        return {
+            "info": {
+                "portfolio_value": final_portfolio_value,
+                "cash_invested": final_cash_invested,
+                "comp_value": benchmark["comp_value"],
+                "roi_portfolio": roi_portfolio,
+                "roi_comp": benchmark["roi_comp"],
+            },
+            "investment_comp": pd.concat(
+                [
+                    portfolio_value_ts,
+                    cash_invested_ts,
+                    benchmark["value"],
+                ],
+                axis=1,
+                ignore_index=True,
+            ).to_json(),
+            "pnl_data": pd.concat(
+                [daily_pnl_percentage, benchmark["pnl"]], axis=1, ignore_index=True
+            ).to_json(),
+            "composition": composition,
+            "summaries": summaries,
+        }
+
+    # Several comparison indices: the portfolio series are returned once and
+    # each index only adds its equivalent-portfolio series.
     return {
         "info": {
             "portfolio_value": final_portfolio_value,
             "cash_invested": final_cash_invested,
-            "comp_value": final_nasdaq_value,
             "roi_portfolio": roi_portfolio,
-            "roi_comp": roi_nasdaq,
         },
         "investment_comp": pd.concat(
-            [
-                portfolio_value_ts,
-                cash_invested_ts,
-                nasdaq_value_ts,
-            ],
-            axis=1,
+            [portfolio_value_ts, cash_invested_ts], axis=1, ignore_index=True
         ).to_json(),
-        "pnl_data": pd.concat([daily_pnl_percentage, nasdaq_pct], axis=1).to_json(),
-        "composition": {
-            "labels": pie_labels,
-            "sizes": pie_sizes,
+        "pnl_data": pd.concat([daily_pnl_percentage], axis=1, ignore_index=True).to_json(),
+        "benchmarks": {
+            comp_ticker: {
+                "comp_value": benchmark["comp_value"],
+                "roi_comp": benchmark["roi_comp"],
+                "value": benchmark["value"].to_json(),
+                "pnl": benchmark["pnl"].to_json(),
+            }
+            for comp_ticker, benchmark in benchmarks.items()
         },
+        "composition": composition,
         "summaries": summaries,
     }
 
 
-def generate_report(portfolio, start_date, end_date, w, file):
-    # Process all transactions
-    transactions = []
-    for currency in ["USD", "CAD"]:
-        for ticker, txns in portfolio[currency].items():
-            for txn in txns:
-                # Normalize the date (without timezone)
-                date = pd.to_datetime(txn["date"]).tz_localize(None).normalize()
-                transactions.append(
-                    {
-                        "date": date,
-                        "ticker": ticker,
-                        "type": txn["type"],
-                        "quantity": txn["quantity"],
-                        "price": txn["price"],
-                        "currency": currency,
-                    }
-                )
-    # Sort chronologically
-    transactions.sort(key=lambda x: x["date"])
+def generate_report(portfolio, start_date, end_date, w, file, comparison="^IXIC", hourly_data=None):
+    """
+    Renders the PDF report of a portfolio to ``{file}.pdf``.
 
-    # Identify tickers
-    usd_tickers = list(portfolio["USD"].keys())
-    cad_tickers = list(portfolio["CAD"].keys())
-    all_tickers = usd_tickers + cad_tickers
-
-    # ------------------------------
-    # Fetch historical prices for portfolio tickers
-    # ------------------------------
-    historical_prices = {}
-    date_range = pd.date_range(start=start_date, end=end_date, freq="D")
-    for ticker in all_tickers:
-        stock = yf.Ticker(ticker)
-        hist = stock.history(start=start_date, end=end_date, interval="1d")["Close"]
-        if hist.empty:
-            print(f"No data for {ticker}")
-            historical_prices[ticker] = pd.Series(0.0, index=date_range)
-            continue
-        # If tz-naive, localize to UTC; otherwise, convert to UTC
-        if hist.index.tz is None:
-            hist.index = hist.index.tz_localize("UTC")
-        else:
-            hist.index = hist.index.tz_convert("UTC")
-        # Remove time information and normalize the index
-        hist.index = hist.index.tz_localize(None).normalize()
-        hist_reindexed = hist.reindex(date_range, method="ffill")
-        historical_prices[ticker] = hist_reindexed
-
-    # ------------------------------
-    # Fetch NASDAQ historical prices
-    # ------------------------------
-    nasdaq_stock = yf.Ticker("^IXIC")  # ^IXIC
-    nasdaq_hist = nasdaq_stock.history(start=start_date, end=end_date, interval="1d")[
-        "Close"
-    ]
-    if nasdaq_hist.empty:
-        print("No data for NASDAQ")
-        nasdaq_hist = pd.Series(0.0, index=date_range)
+    The series, holdings and company details are those of
+    get_portfolio_analytics, so they are shared with (and cached for) the
+    dashboard endpoints; the hourly session bars plotted for every ticker come
+    from the intraday store, shared with the dashboard's intraday charts.
+
+    Args:
+        portfolio (dict): Transactions by currency and ticker.
+        start_date, end_date: The days covered by the charts.
+        w (float): The width of the pages, in inches.
+        file (str): The output path, without the ".pdf" extension.
+        comparison (str): The comparison index ticker.
+        hourly_data (dict, optional): The hourly bars of the tickers, by ticker,
+            when they were already fetched (see batch_report.py).
+    """
+    all_tickers = [ticker for currency in portfolio.keys() for ticker in portfolio[currency].keys()]
+
+    # The hourly bars plotted for every ticker are fetched in one batch on a
+    # thread of their own, since the batch itself may use the market-data pool,
+    # while the analytics are computed (or found in the cache)
+    if hourly_data is None:
+        with ThreadPoolExecutor(max_workers=1) as hourly_fetch:
+            pending_hourly = hourly_fetch.submit(
+                intraday_store.get_bars_many, all_tickers, start_date, end_date, "1h"
+            )
+            analytics = get_portfolio_analytics(portfolio, [comparison], start_date, end_date)
+            hourly_data = pending_hourly.result()
     else:
-        if nasdaq_hist.index.tz is None:
-            nasdaq_hist.index = nasdaq_hist.index.tz_localize("UTC")
-        else:
-            nasdaq_hist.index = nasdaq_hist.index.tz_convert("UTC")
-        nasdaq_hist.index = nasdaq_hist.index.tz_localize(None).normalize()
-        nasdaq_hist = nasdaq_hist.reindex(date_range, method="ffill")
-
-    # ------------------------------
-    # Calculate portfolio time series
-    # ------------------------------
-    current_holdings = {ticker: 0 for ticker in all_tickers}
-    current_cash = 0.0  # Cash on hand (CAD)
-    current_cash_invested = 0.0  # Total money invested into the portfolio
-
-    # Create timeseries to track portfolio metrics
-    cash_invested_ts = pd.Series(0.0, index=date_range)
-    portfolio_value_ts = pd.Series(0.0, index=date_range)
-    equity_ts = pd.Series(0.0, index=date_range)
-    cash_ts = pd.Series(0.0, index=date_range)
-
-    txn_index = 0
-    for i, date in enumerate(date_range):
-        # Process all transactions for the current date
-        while txn_index < len(transactions) and transactions[txn_index]["date"] == date:
-            txn = transactions[txn_index]
-            ticker = txn["ticker"]
-            txn_type = txn["type"]
-            quantity = txn["quantity"]
-            price = txn["price"]
-            currency = txn["currency"]
-
-            # Convert price to CAD if needed
-            price_cad = price * USD_TO_CAD if currency == "USD" else price
-            txn_value = quantity * price_cad
-
-            if txn_type == "buy":
-                current_holdings[ticker] += quantity
-                if current_cash >= txn_value:
-                    current_cash -= txn_value
-                else:
-                    # Additional funds are invested if cash is insufficient
-                    needed = txn_value - current_cash
-                    current_cash_invested += needed
-                    current_cash = 0
-            elif txn_type == "sell":
-                current_holdings[ticker] -= quantity
-                current_cash += txn_value
-
-            txn_index += 1
-
-        # Calculate portfolio equity from current holdings
-        equity = 0.0
-        for ticker in all_tickers:
-            if current_holdings[ticker] == 0:
-                continue
-            price = historical_prices[ticker].iloc[i]
-            price_cad = price * USD_TO_CAD if ticker in usd_tickers else price
-            equity += current_holdings[ticker] * price_cad
-
-        portfolio_value = equity + current_cash
-        cash_invested_ts[date] = current_cash_invested
-        portfolio_value_ts[date] = portfolio_value
-        equity_ts[date] = equity
-        cash_ts[date] = current_cash
-
-    # ------------------------------
-    # Simulate NASDAQ-equivalent portfolio
-    # ------------------------------
-    # For the NASDAQ portfolio, assume that whenever additional money is invested in your portfolio,
-    # you invest that same cash amount into NASDAQ at that day’s price.
-    nasdaq_shares = 0.0
-    nasdaq_value_ts = pd.Series(0.0, index=date_range)
-    # Calculate the day-to-day increment in cash invested
-    cash_invested_diff = cash_invested_ts.diff().fillna(cash_invested_ts.iloc[0])
-
-    for i, date in enumerate(date_range):
-        additional_investment = cash_invested_diff[date]
-        # If additional cash is invested, buy NASDAQ shares at the closing price for that day.
-        if additional_investment > 0 and nasdaq_hist[date] != 0:
-            nasdaq_shares += additional_investment / nasdaq_hist[date]
-        # The NASDAQ-equivalent portfolio value is the total shares held times the current NASDAQ price.
-        nasdaq_value_ts[date] = nasdaq_shares * nasdaq_hist[date]
-
-    nasdaq_pnl = nasdaq_value_ts.diff().fillna(0) - cash_invested_ts.diff().fillna(0)
-    n_prev_value = nasdaq_value_ts.shift(1)
-    nasdaq_pnl_percentage = (nasdaq_pnl / n_prev_value.replace(0, np.nan)).fillna(
-        0
-    ) * 100
-    nasdaq_pct = pd.Series(nasdaq_pnl_percentage, index=portfolio_value_ts.index)
-
-    daily_pnl = portfolio_value_ts.diff().fillna(0) - cash_invested_ts.diff().fillna(0)
-    prev_value = portfolio_value_ts.shift(1)
-    daily_pnl_percentage = (daily_pnl / prev_value.replace(0, np.nan)).fillna(0) * 100
-    daily_pnl_percentage = pd.Series(
-        daily_pnl_percentage, index=portfolio_value_ts.index
-    )
+        analytics = get_portfolio_analytics(portfolio, [comparison], start_date, end_date)
+
+    series = analytics["series"]
+    state = analytics["state"]
+    portfolio_value_ts = series["portfolio_value"]
+    cash_invested_ts = series["cash_invested"]
+    daily_pnl_percentage = series["pnl"]
+    benchmark = analytics["benchmarks"][comparison]
+    comp_value_ts = benchmark["value"]
+    comp_pct = benchmark["pnl"]
+    comp_name = BENCHMARK_NAMES.get(comparison, comparison)
 
     # Final summary text for Section 1
-    final_cash_invested = int(cash_invested_ts.iloc[-1])
-    final_portfolio_value = int(portfolio_value_ts.iloc[-1])
-    final_nasdaq_value = int(nasdaq_value_ts.iloc[-1])
-    roi_portfolio = (
-        ((final_portfolio_value - final_cash_invested) / final_cash_invested * 100)
-        if final_cash_invested != 0
-        else 0
-    )
-    roi_nasdaq = (
-        ((final_nasdaq_value - final_cash_invested) / final_cash_invested * 100)
-        if final_cash_invested != 0
-        else 0
-    )
-    final_text = f"Portfolio - Invested: {final_cash_invested}CAD, Final Value: {final_portfolio_value}CAD, ROI: {roi_portfolio:.2f}%, NASDAQ: {roi_nasdaq:.2f}%"
-
-    # holdings
-    holdings = []
-    labels = []
-    for ticker in all_tickers:
-        quantity = current_holdings[ticker]
-        if quantity > 0:
-            price = historical_prices[ticker].iloc[-1]
-            if ticker in usd_tickers:
-                value = quantity * price * USD_TO_CAD
-            else:
-                value = quantity * price
-            holdings.append(value)
-            labels.append(f"{ticker}\n({quantity} shares)")
-    holdings.append(current_cash)
-    labels.append(f"Cash\n({current_cash:.2f} CAD)")
-    filtered = [(l, v) for l, v in zip(labels, holdings) if v > 0]
-    if filtered:
-        pie_labels, pie_sizes = zip(*filtered)
-    else:
-        pie_labels, pie_sizes = ([], [])
+    final_cash_invested = analytics["cash_invested"]
+    final_portfolio_value = analytics["portfolio_value"]
+    final_comp_value = benchmark["comp_value"]
+    final_text = f"Portfolio - Invested: {final_cash_invested}CAD, Final Value: {final_portfolio_value}CAD, ROI: {analytics['roi_portfolio']:.2f}%, {comp_name}: {benchmark['roi_comp']:.2f}%"
 
-    # Prepare pie chart data
+    pie_labels = analytics["composition"]["labels"]
+    pie_sizes = analytics["composition"]["sizes"]
 
     # Calculate ticker performance from its transactions
 
-    def calculate_ticker_performance(ticker, transactions):
-        total_invested = 0
-        current_shares = 0
-        return_value = 0
-        current_price = historical_prices[ticker].iloc[
-            -1
-        ]  # *USD_TO_CAD if ticker in usd_tickers else historical_prices[ticker].iloc[-1]
-        for txn in transactions:  # basic
-            if txn["type"] == "buy":
-                total_invested += txn["quantity"] * txn["price"]
-                current_shares += txn["quantity"]
-            elif txn["type"] == "sell":
-                return_value += txn["quantity"] * txn["price"]
-                current_shares -= txn["quantity"]
-
-        current_value = current_shares * current_price + return_value
-        current_value = (
-            current_value * USD_TO_CAD if ticker in usd_tickers else current_value
-        )
+    ledger = get_ledger(portfolio)
 
-        total_invested = (
-            total_invested * USD_TO_CAD if ticker in usd_tickers else total_invested
-        )
+    def calculate_ticker_performance(ticker, currency):
+        perf = calc_ticker_performance(ledger.for_ticker(ticker), state["last_close"][ticker], currency)
+        return f"{ticker} Stock - Total Invested: {perf['total_invested']:.1f}CAD, Final Value: {perf['final_value']:.1f}CAD, ROI: {perf['ROI']:.1f}%"
 
-        growth = ((current_value - total_invested) / total_invested) * 100
-        result = f"{ticker} Stock - Total Invested: {total_invested:.1f}CAD, Final Value: {current_value:.1f}CAD, ROI: {growth:.1f}%"
-        return result
-
-    def plot_stock_price(ticker, interval, transactions=None, ax=None):
-        """
-        Downloads historical stock price data and plots it, optionally overlaying buy and sell transactions,
-        and the last price directly on the plot.
-        """
-        data = yf.download(ticker, start_date, end_date, interval=interval)
-        # if data.empty:
-        #     if ax is not None:
-        #         ax.text(0.5, 0.5, f"No data fetched for {ticker}", ha='center', va='center')
-        #     else:
-        #         print(f"No data fetched for {ticker} at {interval} intervals for the last {period}.")
-        #     return
-
-        if data.index.tz is None:
-            data.index = data.index.tz_localize("UTC").tz_convert("America/New_York")
-        else:
-            data.index = data.index.tz_convert("America/New_York")
-
-        business_days_data = data[data.index.dayofweek < 5]
-        # if business_days_data.empty:
-        #     if ax is not None:
-        #         ax.text(0.5, 0.5, "No business day data available", ha='center', va='center')
-        #     else:
-        #         print("No business day data available within the downloaded period.")
-        #     return
-
-        market_open = pd.Timestamp("09:30:00", tz="America/New_York").time()
-        market_close = pd.Timestamp("16:00:00", tz="America/New_York").time()
-        market_hours_data = business_days_data.between_time(market_open, market_close)
-        # if market_hours_data.empty:
-        #     if ax is not None:
-        #         ax.text(0.5, 0.5, "No market hours data available", ha='center', va='center')
-        #     else:
-        #         print("No market hours data available within the downloaded period.")
-        #     return
-
-        prices = market_hours_data["Close"]
-        # if prices.empty:
-        #     if ax is not None:
-        #         ax.text(0.5, 0.5, "No closing prices available", ha='center', va='center')
-        #     else:
-        #         print("No closing prices available within the filtered data.")
-        #     return
-        # if ax is None:
-        #     ax = plt.gca()
-        x_axis = range(len(prices))
-        ax.plot(x_axis, prices, label=f"{ticker} Stock Price", color="blue")
-        last_price = float(prices.iloc[-1].iloc[0])
-        last_index = len(prices) - 1
-        ax.scatter(last_index, last_price, color="magenta", marker="*", s=100)
-        ax.annotate(
-            f"Last: ${last_price:.2f}",
-            (last_index, last_price),
-            textcoords="offset points",
-            xytext=(5, 5),
-            ha="left",
-        )
-        num_ticks = min(10, len(prices) // 2)
-        if len(prices) > 1:
-            step = max(len(prices) // num_ticks, 1)
-            selected_indices = list(range(0, len(prices), step))
-            selected_dates = prices.index[selected_indices]
-            date_labels = [date.strftime("%Y-%m-%d %H:%M") for date in selected_dates]
-            ax.set_xticks(selected_indices)
-            ax.set_xticklabels(date_labels, rotation=45, ha="right")
-        elif len(prices) == 1:
-            ax.set_xticks([0])
-            ax.set_xticklabels(
-                [prices.index[0].strftime("%Y-%m-%d %H:%M")], rotation=45, ha="right"
-            )
+    # Pages ##############################################################################
 
-        if transactions:
-            aggregated_buys = {}
-            aggregated_sells = {}
-            et_timezone = pytz.timezone("America/New_York")
-            for transaction in transactions:
-                try:
-                    transaction_time_utc = datetime.strptime(
-                        transaction["date"], "%Y-%m-%d %H:%M:%S"
-                    )
-                    transaction_time_et = pytz.utc.localize(
-                        transaction_time_utc
-                    ).astimezone(et_timezone)
-                except ValueError:
-                    try:
-                        transaction_time_utc = datetime.strptime(
-                            transaction["date"], "%Y-%m-%d %H:%M"
-                        )
-                        transaction_time_et = pytz.utc.localize(
-                            transaction_time_utc
-                        ).astimezone(et_timezone)
-                    except ValueError as e:
-                        print(
-                            f"Error parsing date for {ticker} transaction: {transaction['date']}. Error: {e}"
-                        )
-                        continue
-
-                nearest_index = None
-                min_difference = timedelta.max
-                for i, ts in enumerate(prices.index):
-                    difference = abs(transaction_time_et - ts)
-                    if difference < min_difference:
-                        min_difference = difference
-                        nearest_index = i
-                    elif difference > min_difference:
-                        break
-                if nearest_index is not None:
-                    plot_index = nearest_index
-                    if transaction["type"] == "buy":
-                        if plot_index not in aggregated_buys:
-                            aggregated_buys[plot_index] = {
-                                "price": transaction["price"],
-                                "quantity": 0,
-                            }
-                        aggregated_buys[plot_index]["quantity"] += transaction[
-                            "quantity"
-                        ]
-                    elif transaction["type"] == "sell":
-                        if plot_index not in aggregated_sells:
-                            aggregated_sells[plot_index] = {
-                                "price": transaction["price"],
-                                "quantity": 0,
-                            }
-                        aggregated_sells[plot_index]["quantity"] += transaction[
-                            "quantity"
-                        ]
-            for index, data_dict in aggregated_buys.items():
-                price_at_index = float(prices.iloc[index].iloc[0])
-                buy_price = data_dict["price"]
-                ax.scatter(index, buy_price, color="lime", marker="o", s=80)
-                ax.annotate(
-                    f'Buy: ${data_dict["price"]:.2f} ({data_dict["quantity"]})',
-                    (index, buy_price),
-                    textcoords="offset points",
-                    xytext=(5, -10),
-                    ha="left",
-                    bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"),
-                )
-
-            for index, data_dict in aggregated_sells.items():
-                price_at_index = float(prices.iloc[index].iloc[0])
-                sell_price = data_dict["price"]
-                ax.scatter(index, sell_price, color="orangered", marker="o", s=80)
-                ax.annotate(
-                    f'Sell: ${data_dict["price"]:.2f} ({data_dict["quantity"]})',
-                    (index, sell_price),
-                    textcoords="offset points",
-                    xytext=(5, 10),
-                    ha="left",
-                    bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"),
-                )
-        ax.set_xlabel("Time (Business Days, Market Hours ET)")
-        ax.set_ylabel("Price($)")
-        perf = calculate_ticker_performance(ticker, transactions)
-        ax.set_title(perf)
-        ax.legend()
-        ax.grid(True)
-
-    # Main Figure Layout using GridSpec ###################################################
-
-    # Determine dynamic grid rows for portfolio subplots:
-    usd_count = len(portfolio["USD"])
-    usd_rows = math.ceil(usd_count / 2) if usd_count > 0 else 1
-    cad_count = len(portfolio["CAD"])
-    cad_rows = math.ceil(cad_count / 2) if cad_count > 0 else 1
-
-    # Total rows = fixed sections 1+ (2 rows for Section 1) + 1 row for Pie Chart + usd_rows + cad_rows
-    total_rows = 40 + 10 * (usd_rows + cad_rows)
-
-    fig = plt.figure(constrained_layout=True, figsize=(w, 38))
-    gs = gridspec.GridSpec(nrows=total_rows, ncols=12, figure=fig)
+    # The per-ticker pages are drawn in worker processes while the summary page
+    # is drawn here; every page is a PDF of its own until they are merged
+    jobs = []
+    for currency in portfolio.keys():
+        section = SECTION_TITLES.get(currency, f"{currency} Equities")
+        for ticker, txns in portfolio[currency].items():
+            data = hourly_data.get(ticker)
+            if data is None:
+                data = pd.DataFrame({"Close": []}, index=pd.DatetimeIndex([]))
+            title = calculate_ticker_performance(ticker, currency)
+            jobs.append((ticker, data, txns, title, section, w))
+    pool = ticker_page_pool(len(jobs))
+    ticker_pages = submit_ticker_pages(pool, jobs)
+
+    # Summary page: Section 1 and the holdings
+    fig = plt.figure(constrained_layout=True, figsize=(w, 20))
+    gs = gridspec.GridSpec(nrows=32, ncols=12, figure=fig)
 
     # ax = fig.add_subplot(gs[0, :])
     # ax.axis('off')
@@ -762,7 +637,7 @@ def generate_report(portfolio, start_date, end_date, w, file):
     axp.set_title(
         x=0.5, y=0.5, label="Portfolio Analysis", ha="center", va="center", fontsize=40
     )
-    abstract = "This report presents an in-depth analysis of the return on investment (ROI) for a the portfolio of equities traded on both American and Canadian stock exchanges. Investment values are standardized in Canadian dollars (CAD) to maintain consistency, with all U.S. dollar figures converted using a fixed conversion fee of 1.43 to account for currency stability."
+    abstract = f"This report presents an in-depth analysis of the return on investment (ROI) for a the portfolio of equities traded in {', '.join(portfolio.keys())}. Investment values are standardized in Canadian dollars (CAD) to maintain consistency, with all other currencies converted at the exchange rate of the day of each transaction and price."
     wa = textwrap.fill(abstract, width=200)
     axp.text(0.025, 0.1, wa, fontsize=16)
     intro = "Given below are the plots for the variation in total portfolio value with time, and the daily profit and loss generated by the portfolio"
@@ -774,7 +649,7 @@ def generate_report(portfolio, start_date, end_date, w, file):
         portfolio_value_ts.index, portfolio_value_ts, label="Portfolio Value (CAD)"
     )
     ax1.plot(cash_invested_ts.index, cash_invested_ts, label="Cash Invested (CAD)")
-    ax1.plot(nasdaq_value_ts.index, nasdaq_value_ts, label="NASDAQ Value (CAD)")
+    ax1.plot(comp_value_ts.index, comp_value_ts, label=f"{comp_name} Value (CAD)")
     ax1.annotate(
         f"${final_cash_invested}", (cash_invested_ts.index[-1], final_cash_invested)
     )
@@ -783,7 +658,7 @@ def generate_report(portfolio, start_date, end_date, w, file):
         (portfolio_value_ts.index[-1], final_portfolio_value),
     )
     ax1.annotate(
-        f"${final_nasdaq_value}", (nasdaq_value_ts.index[-1], final_nasdaq_value)
+        f"${final_comp_value}", (comp_value_ts.index[-1], final_comp_value)
     )
     ax1.set_title(final_text)
     ax1.set_xlabel("Date")
@@ -810,7 +685,7 @@ def generate_report(portfolio, start_date, end_date, w, file):
     # ax2.grid(True)
 
     portfolio_colors = ["limegreen" if x >= 0 else "red" for x in daily_pnl_percentage]
-    nasdaq_colors = ["darkgreen" if x >= 0 else "darkred" for x in nasdaq_pct]
+    comp_colors = ["darkgreen" if x >= 0 else "darkred" for x in comp_pct]
 
     # Create percentage PnL comparison plot
     ax5 = fig.add_subplot(gs[8:18, 6:11])  # Adjust grid position as needed
@@ -827,13 +702,13 @@ def generate_report(portfolio, start_date, end_date, w, file):
         linewidth=0.05,
     )
 
-    # Plot NASDAQ bars (dark green/dark red)
+    # Plot comparison bars (dark green/dark red)
     ax5.bar(
-        nasdaq_pct.index + pd.Timedelta(days=width / 2),
-        nasdaq_pct,
+        comp_pct.index + pd.Timedelta(days=width / 2),
+        comp_pct,
         width=width,
-        label="NASDAQ Daily % PnL",
-        color=nasdaq_colors,
+        label=f"{comp_name} Daily % PnL",
+        color=comp_colors,
         edgecolor="black",
         linewidth=0.05,
     )
@@ -845,7 +720,7 @@ def generate_report(portfolio, start_date, end_date, w, file):
     ax5.set_ylabel("Daily PnL %")
     ax5.axhline(0, color="black", linewidth=0.8)  # Zero line
     ax5.grid(True, linestyle="--", alpha=0.7)
-    ax5.set_title("Daily PnL Comparison (Portfolio vs NASDAQ)")
+    ax5.set_title(f"Daily PnL Comparison (Portfolio vs {comp_name})")
 
     # Create custom legend
     legend_elements = [
@@ -854,9 +729,9 @@ def generate_report(portfolio, start_date, end_date, w, file):
         ),
         plt.Rectangle((0, 0), 1, 1, fc="red", ec="black", label="Portfolio Loss %"),
         plt.Rectangle(
-            (0, 0), 1, 1, fc="darkgreen", ec="black", label="NASDAQ Profit %"
+            (0, 0), 1, 1, fc="darkgreen", ec="black", label=f"{comp_name} Profit %"
         ),
-        plt.Rectangle((0, 0), 1, 1, fc="darkred", ec="black", label="NASDAQ Loss %"),
+        plt.Rectangle((0, 0), 1, 1, fc="darkred", ec="black", label=f"{comp_name} Loss %"),
     ]
     ax5.legend(handles=legend_elements, loc="upper left")
 
@@ -870,8 +745,7 @@ def generate_report(portfolio, start_date, end_date, w, file):
         s="The portfolio's current holding is composed of the following equities:",
         fontsize=16,
     )
-    for ticker in all_tickers:
-        t = get_stock_details(ticker)
+    for t in analytics["summaries"]:
         ax3.text(0.1, i, s=t, fontsize=13)
         i -= 0.12
     ax3.text(
@@ -904,67 +778,11 @@ def generate_report(portfolio, start_date, end_date, w, file):
         )
         ax4.set_title("Pie Chart")
 
-    axa = fig.add_subplot(gs[32:35, 1:11])
-    axa.axis("off")
-    axa.set_title(
-        x=0, y=0.5, label="American Equities", ha="center", va="center", fontsize=20
-    )
-
-    # Section 3: USD Portfolio plots grid
-    if usd_count > 0:
-        gs_usd = gridspec.GridSpecFromSubplotSpec(
-            usd_rows, 2, subplot_spec=gs[35 : 35 + 10 * usd_rows, 1:11]
-        )
-        usd_index = 0
-        for ticker, txns in portfolio["USD"].items():
-            row = usd_index // 2
-            col = usd_index % 2
-            ax = fig.add_subplot(gs_usd[row, col])
-            # perf_text = calculate_ticker_performance(ticker, txns)
-            # ax.text(0,0, s = perf_text, ha='center', va='bottom', fontsize=10)
-            plot_stock_price(
-                ticker, interval="1h", transactions=txns, ax=ax
-            )  #### Wrong
-            usd_index += 1
-    else:
-        # If no USD holdings, display a message in the allocated area.
-        ax = fig.add_subplot(gs[35, 35 + 10 * usd_rows, 1:11])
-        ax.text(0.5, 0.6, "No USD holdings", ha="center", va="center", fontsize=14)
-        ax.axis("off")
-
-    axc = fig.add_subplot(gs[35 + 10 * usd_rows : 38 + 10 * usd_rows, 1:11])
-    axc.axis("off")
-    axc.set_title(
-        x=0, y=0.5, label="Canadian Equities", ha="center", va="center", fontsize=20
-    )
-
-    # Section 4: CAD Portfolio plots grid
-    if cad_count > 0:
-        start_row = 38 + 10 * usd_rows
-        gs_cad = gridspec.GridSpecFromSubplotSpec(
-            cad_rows, 2, subplot_spec=gs[start_row : start_row + 10 * cad_rows, 1:11]
-        )
-        cad_index = 0
-        for ticker, txns in portfolio["CAD"].items():
-            row = cad_index // 2
-            col = cad_index % 2
-            ax = fig.add_subplot(gs_cad[row, col])
-            plot_stock_price(ticker, interval="1h", transactions=txns, ax=ax)
-            perf_text = calculate_ticker_performance(ticker, txns)
-            # ax.text(0.5, -0.15, perf_text, ha='center', va='top', transform=ax.transAxes,
-            #         fontsize=10, bbox=dict(facecolor='white', alpha=0.7, edgecolor='gray'))
-            cad_index += 1
-    else:
-        # If no CAD holdings, display a message in the allocated area.
-        ax = fig.add_subplot(gs[32 + 10 * usd_rows :, :])
-        ax.text(0.5, 0.5, "No CAD holdings", ha="center", va="center", fontsize=14)
-        ax.axis("off")
-
-    axc = fig.add_subplot(gs[-2:, 1:11])
-    axc.axis("off")
+    pages = [figure_pdf(fig)]
+    plt.close(fig)
+    pages += collect_ticker_pages(pool, jobs, ticker_pages)
 
-    plt.savefig(f"{file}.pdf", bbox_inches="tight")
-    # plt.show()
+    write_pdf(pages, f"{file}.pdf")
 
 
 def truncate_summary(summary, limit=80):
@@ -997,8 +815,7 @@ def get_stock_details(ticker_symbol):
     Returns:
         str: A formatted paragraph containing the stock details.
     """
-    ticker = yf.Ticker(ticker_symbol)
-    info = ticker.info
+    info = get_info(ticker_symbol)
 
     company_name = info.get("longName", "N/A")
     exchange = info.get("exchange", "N/A")
@@ -1037,6 +854,30 @@ def get_stock_details(ticker_symbol):
     return wrapped_paragraph
 
 
+def get_stock_details_many(ticker_symbols, pending=None):
+    """
+    Retrieves the stock details of several tickers concurrently.
+
+    Args:
+        ticker_symbols (list): The stock ticker symbols.
+        pending (dict): Futures already started with
+            ``submit_concurrently(get_stock_details, ticker_symbols)``, if any.
+
+    Returns:
+        list: The formatted paragraphs, in the order of ``ticker_symbols``. A ticker whose
+        details could not be fetched gets a short placeholder paragraph.
+    """
+    if pending is None:
+        pending = submit_concurrently(get_stock_details, ticker_symbols)
+    details, errors = gather(pending)
+    for ticker_symbol, e in errors.items():
+        print(f"Error fetching details for {ticker_symbol}: {e}")
+    return [
+        details.get(ticker_symbol, f" - {ticker_symbol} : No details available.")
+        for ticker_symbol in ticker_symbols
+    ]
+
+
 if __name__ == "__main__":
 
     portfolio = {
@@ -0,0 +1,169 @@
+"""
+Rendering of the PDF report's pages.
+
+matplotlib is not thread-safe, so the per-ticker pages of a report are drawn in
+separate processes, each to its own single-page PDF, and the pages are then
+assembled into one document. The pages are drawn on ``matplotlib.figure.Figure``
+objects rather than through pyplot, so a worker keeps no global figure state
+between pages, and the data they plot is fetched up front by the caller.
+"""
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from pypdf import PdfReader, PdfWriter
+
+from analytics import transaction_markers
+from intraday import session, session_bars
+
+# Processes drawing the per-ticker pages; 1 draws them in the calling process.
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", os.cpu_count() or 1))
+
+
+def plot_stock_price(ax, ticker, data, transactions, title):
+    """
+    Plots the hourly prices of a ticker during the sessions of its exchange,
+    overlaying its buy and sell transactions and the last price directly on the plot.
+
+    Args:
+        ax (matplotlib.axes.Axes): The axes to draw on.
+        ticker (str): The stock ticker symbol.
+        data (pd.DataFrame): The ticker's hourly bars, with a "Close" column.
+        transactions (list): The ticker's transactions, as in the portfolio.
+        title (str): The title of the plot.
+    """
+    prices = session_bars(data, ticker)["Close"]
+    x_axis = range(len(prices))
+    ax.plot(x_axis, prices, label=f"{ticker} Stock Price", color="blue")
+    if len(prices) == 0:
+        ax.text(
+            0.5, 0.5, f"No data fetched for {ticker}", ha="center", va="center", transform=ax.transAxes
+        )
+    else:
+        last_price = float(prices.iloc[-1])
+        last_index = len(prices) - 1
+        ax.scatter(last_index, last_price, color="magenta", marker="*", s=100)
+        ax.annotate(
+            f"Last: ${last_price:.2f}",
+            (last_index, last_price),
+            textcoords="offset points",
+            xytext=(5, 5),
+            ha="left",
+        )
+    num_ticks = min(10, len(prices) // 2)
+    if len(prices) > 1:
+        step = max(len(prices) // num_ticks, 1)
+        selected_indices = list(range(0, len(prices), step))
+        selected_dates = prices.index[selected_indices]
+        date_labels = [date.strftime("%Y-%m-%d %H:%M") for date in selected_dates]
+        ax.set_xticks(selected_indices)
+        ax.set_xticklabels(date_labels, rotation=45, ha="right")
+    elif len(prices) == 1:
+        ax.set_xticks([0])
+        ax.set_xticklabels(
+            [prices.index[0].strftime("%Y-%m-%d %H:%M")], rotation=45, ha="right"
+        )
+
+    # Every buy and sell is marked on its nearest bar, several on the same bar
+    # being shown as one with their total quantity
+    for marker in transaction_markers(transactions, prices.index):
+        buy = marker["type"] == "buy"
+        position, price = marker["position"], marker["price"]
+        ax.scatter(position, price, color="lime" if buy else "orangered", marker="o", s=80)
+        ax.annotate(
+            f'{"Buy" if buy else "Sell"}: ${price:.2f} ({marker["quantity"]})',
+            (position, price),
+            textcoords="offset points",
+            xytext=(5, -10 if buy else 10),
+            ha="left",
+            bbox=dict(facecolor="white", alpha=0.7, edgecolor="none"),
+        )
+    ax.set_xlabel(f"Time (Market Hours, {session(ticker)[0]})")
+    ax.set_ylabel("Price($)")
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True)
+
+
+def figure_pdf(fig):
+    """
+    Returns ``fig`` saved as a single-page PDF, as bytes.
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="pdf", bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def render_ticker_page(ticker, data, transactions, title, section, w):
+    """
+    Draws the page of one ticker of the report.
+
+    Args:
+        ticker (str): The stock ticker symbol.
+        data (pd.DataFrame): The ticker's hourly bars.
+        transactions (list): The ticker's transactions, as in the portfolio.
+        title (str): The performance summary shown above the plot.
+        section (str): The heading of the page, e.g. "American Equities".
+        w (float): The width of the page, in inches.
+
+    Returns:
+        bytes: The page as a single-page PDF.
+    """
+    fig = Figure(constrained_layout=True, figsize=(w, w * 0.45))
+    fig.suptitle(section, x=0.02, ha="left", fontsize=20)
+    ax = fig.add_subplot()
+    plot_stock_price(ax, ticker, data, transactions, title)
+    return figure_pdf(fig)
+
+
+def ticker_page_pool(jobs):
+    """
+    Returns a process pool for drawing ``jobs`` ticker pages, or None to draw
+    them in the calling process (REPORT_WORKERS=1, or a single page).
+    """
+    workers = min(REPORT_WORKERS, jobs)
+    if workers <= 1:
+        return None
+    # Workers are started fresh rather than forked from a process running
+    # server and market-data threads, as in batch_report.py
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def submit_ticker_pages(pool, jobs):
+    """
+    Starts drawing the ticker pages of ``jobs`` (the arguments of
+    ``render_ticker_page``) on ``pool``, returning the pending pages, or None
+    without a pool.
+    """
+    if pool is None:
+        return None
+    return [pool.submit(render_ticker_page, *job) for job in jobs]
+
+
+def collect_ticker_pages(pool, jobs, pending):
+    """
+    Returns the ticker pages of ``jobs`` in order: the ``pending`` pages of
+    ``submit_ticker_pages`` once drawn (closing ``pool``), or the pages drawn
+    in the calling process without a pool.
+    """
+    if pool is None:
+        return [render_ticker_page(*job) for job in jobs]
+    with pool:
+        return [page.result() for page in pending]
+
+
+def write_pdf(pages, path):
+    """
+    Assembles single-page PDFs, in order, into one document at ``path``.
+
+    Args:
+        pages (list): The pages, as PDF bytes (a page may itself span several pages).
+        path (str): The output file.
+    """
+    writer = PdfWriter()
+    for page in pages:
+        writer.append(PdfReader(io.BytesIO(page)))
+    with open(path, "wb") as f:
+        writer.write(f)
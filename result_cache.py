@@ -0,0 +1,91 @@
+"""
+Cache of serialized endpoint payloads.
+
+Payloads are keyed by the portfolio's transactions (the id and revision of a
+portfolio read from the portfolio store, or a content hash of any other), the
+request parameters and the market-data "as of" date, so adding or changing a
+transaction, or a new trading day whose bars the price store will fetch,
+automatically leads to a new entry.
+"""
+import hashlib
+import json
+import threading
+from datetime import date
+
+from cache import LRUCache
+from metrics import cache_requests_total
+
+
+def portfolio_hash(portfolio):
+    """
+    Returns a content hash of the portfolio's transactions.
+    """
+    encoded = json.dumps(portfolio, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def portfolio_key(portfolio):
+    """
+    Identifies the transactions of a portfolio: by id and revision for a
+    portfolio read from the portfolio store (see StoredPortfolio), which costs
+    nothing however many transactions it holds, or by content hash otherwise.
+    """
+    key = getattr(portfolio, "key", None)
+    return key if key is not None else portfolio_hash(portfolio)
+
+
+def market_data_as_of():
+    """
+    Returns the date the market data used by the computations is current as of.
+    The price store fetches new bars at most once a day, so results computed on
+    the same day see the same prices.
+    """
+    return date.today().isoformat()
+
+
+class ResultCache:
+    """
+    LRU cache of serialized payloads; ``ttl`` bounds the age of entries that
+    also depend on short-lived data such as quotes.
+    """
+
+    def __init__(self, maxsize=64, ttl=None):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def key(self, name, portfolio, params=None):
+        return (
+            name,
+            portfolio_key(portfolio),
+            json.dumps(params, sort_keys=True, default=str),
+            market_data_as_of(),
+        )
+
+    def get_or_compute(self, name, portfolio, params, compute):
+        """
+        Returns the cached payload for the request, calling ``compute()`` on a
+        miss. Concurrent misses for the same request
+        compute the payload only once.
+        """
+        key = self.key(name, portfolio, params)
+        payload = self._cache.get(key)
+        if payload is not None:
+            cache_requests_total.inc(payload=name, result="hit")
+            return payload
+        with self._locks_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            payload = self._cache.get(key)
+            if payload is None:
+                cache_requests_total.inc(payload=name, result="miss")
+                payload = compute()
+                self._cache.set(key, payload)
+            else:
+                cache_requests_total.inc(payload=name, result="hit")
+        with self._locks_lock:
+            self._locks.pop(key, None)
+        return payload
+
+    def clear(self):
+        self._cache.clear()
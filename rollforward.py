@@ -0,0 +1,533 @@
+"""
+Incremental daily roll-forward of the portfolio comparison series.
+
+Once the closes of a day are final, nothing computed up to that day changes
+unless a transaction dated on or before it is added or edited. The simulation
+state at the last final day (holdings, cash, cash invested and last closes) is
+therefore stored together with the series computed so far, and later requests
+only simulate the days after it: the cost of a request grows with the days
+since the last one, not with the age of the portfolio.
+
+The portfolio checkpoints hold the portfolio alone. The portfolio investing the
+same cash into a comparison index only depends on the cash invested series and
+the index's closes, so it is derived per index from the portfolio's series (see
+benchmark_series), and any set of indices shares one portfolio checkpoint. Each
+index keeps a checkpoint of its own with the shares bought and the cash
+invested so far (see roll_forward_benchmark), so it is rolled forward too.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from analytics import benchmark_shares, pnl_percentage_series, portfolio_time_series
+from fx import fx_table
+from ledger import TRANSACTION_COLUMNS
+from metrics import timed
+from price_store import price_store
+
+SERIES_STORE_PATH = os.environ.get(
+    "SERIES_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "series.sqlite"),
+)
+
+SERIES_COLUMNS = ["cash_invested", "portfolio_value", "equity", "cash", "pnl"]
+
+
+class SeriesStore:
+    """
+    SQLite-backed store of the last checkpoint of every portfolio's series.
+    """
+
+    def __init__(self, path=SERIES_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                " key TEXT PRIMARY KEY, checkpoint BLOB NOT NULL)"
+            )
+
+    def load(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT checkpoint FROM checkpoints WHERE key = ?", (key,)
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def save(self, key, checkpoint):
+        blob = pickle.dumps(checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, checkpoint) VALUES (?, ?)",
+                (key, blob),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM checkpoints")
+
+
+series_store = SeriesStore()
+
+
+def series_key(portfolio_id, currencies):
+    """
+    Identifies the series of a portfolio by its id and its tickers (with their
+    currencies), so portfolios holding the same tickers keep checkpoints of
+    their own.
+    """
+    encoded = repr((portfolio_id, sorted(currencies.items()))).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def transactions_hash(transactions):
+    """
+    Returns a content hash of the transactions, in order.
+    """
+    hashes = pd.util.hash_pandas_object(transactions[TRANSACTION_COLUMNS], index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def _initial_state(start_date, tickers):
+    return {
+        "date": pd.Timestamp(start_date).normalize() - pd.Timedelta(days=1),
+        "holdings": pd.Series(0, index=tickers),
+        "cash": 0.0,
+        "invested": 0.0,
+        "portfolio_value": 0.0,
+        "last_close": pd.Series(np.nan, index=tickers),
+    }
+
+
+def _empty_checkpoint(start_date, tickers):
+    return {
+        "state": _initial_state(start_date, tickers),
+        "transactions": transactions_hash(pd.DataFrame(columns=TRANSACTION_COLUMNS)),
+        "series": pd.DataFrame(columns=SERIES_COLUMNS, dtype=float),
+    }
+
+
+def _with_values(transactions):
+    """
+    Returns the transactions with a "value" column: quantity * price in CAD at
+    the rate of the transaction's date.
+    """
+    transactions = transactions.copy()
+    txn_rates = np.ones(len(transactions))
+    for currency, rows in transactions.groupby("currency").indices.items():
+        txn_rates[rows] = fx_table.rates(currency, transactions["date"].iloc[rows])
+    transactions["value"] = transactions["quantity"] * transactions["price"] * txn_rates
+    return transactions
+
+
+def _invested_by_day(transactions):
+    """
+    Returns the cash invested in the portfolio after the last transaction of
+    each day with transactions, by day.
+    """
+    transactions = _with_values(transactions)
+    txn_days = pd.DatetimeIndex(transactions["date"].unique())
+    tickers = list(dict.fromkeys(transactions["ticker"]))
+    flows, _ = portfolio_time_series(
+        transactions,
+        pd.DataFrame(0.0, index=txn_days, columns=tickers),
+        pd.DataFrame(1.0, index=txn_days, columns=tickers),
+    )
+    return flows["cash_invested"]
+
+
+@timed("simulate")
+def _simulate(transactions, currencies, closes, dates, state):
+    """
+    Simulates the portfolio over ``dates``, starting from the state at the day
+    before them.
+
+    Returns:
+        tuple: The series (SERIES_COLUMNS) and the state at the last date.
+    """
+    tickers = list(currencies)
+
+    # Prices on each date: the last close on or before it, carried forward from
+    # the closes known at the start
+    seed = pd.DataFrame([state["last_close"]], index=[state["date"]])
+    known = pd.concat([seed, closes[closes.index > state["date"]]])
+    prices = known.reindex(known.index.union(dates)).ffill().reindex(dates).astype(float)
+
+    # Transactions are converted to CAD at the rate of their date, and holdings
+    # at the rate of the day they are valued
+    transactions = _with_values(transactions)
+    currency_rates = {
+        currency: fx_table.rates(currency, dates) for currency in set(currencies.values())
+    }
+    fx_rates = pd.DataFrame(
+        {ticker: currency_rates[currencies[ticker]] for ticker in tickers}, index=dates
+    )
+
+    series, holdings = portfolio_time_series(
+        transactions, prices[tickers], fx_rates, initial=state
+    )
+    # The day before the first date leads the PnL series, so the first day's PnL
+    # is relative to the state (0 for an empty portfolio, as for a first day)
+    cash_invested = pd.concat(
+        [pd.Series([state["invested"]], index=[state["date"]]), series["cash_invested"]]
+    )
+    value = pd.concat(
+        [pd.Series([state["portfolio_value"]], index=[state["date"]]), series["portfolio_value"]]
+    )
+    series["pnl"] = pnl_percentage_series(value, cash_invested).iloc[1:]
+
+    state = {
+        "date": dates[-1],
+        "holdings": holdings,
+        "cash": float(series["cash"].iloc[-1]),
+        "invested": float(series["cash_invested"].iloc[-1]),
+        "portfolio_value": float(series["portfolio_value"].iloc[-1]),
+        "last_close": prices.iloc[-1],
+    }
+    return series[SERIES_COLUMNS], state
+
+
+def _final_date(transactions, currencies, state, end_date, today):
+    """
+    Returns the last date whose closes are final: the day before the price store
+    last asked the provider for the recent closes of each ticker held at the
+    state or traded after it (the other tickers do not change the series), and
+    before ``end_date`` and ``today``. A ticker that has stopped trading does
+    not hold it back, since its closes are final once the provider was asked;
+    one never fetched leaves nothing final after the state.
+    """
+    final = min(pd.Timestamp(today), pd.Timestamp(end_date).normalize()) - pd.Timedelta(days=1)
+    traded = set(transactions.loc[transactions["date"] > state["date"], "ticker"])
+    checked = price_store.checked(list(currencies))
+    for ticker in currencies:
+        if state["holdings"][ticker] == 0 and ticker not in traded:
+            continue
+        if checked[ticker] is None:
+            return state["date"]
+        final = min(final, pd.Timestamp(checked[ticker]) - pd.Timedelta(days=1))
+    return final
+
+
+def _value_missing_at_zero(closes, state):
+    """
+    Returns the state with the last close of tickers that have no closes at all
+    set to 0, so they are valued at 0.
+    """
+    state = dict(state, last_close=state["last_close"].copy())
+    for ticker in closes.columns:
+        if closes[ticker].isna().all() and pd.isna(state["last_close"][ticker]):
+            print(f"No data for {ticker}")
+            state["last_close"][ticker] = 0.0
+    return state
+
+
+def _append(frame, new_rows):
+    return new_rows if frame.empty else pd.concat([frame, new_rows])
+
+
+def roll_forward(portfolio_id, transactions, currencies, start_date, end_date, store=None):
+    """
+    Returns the series of a portfolio for every day from ``start_date`` to
+    ``end_date``, simulating only the days after the last stored checkpoint and
+    moving the checkpoint forward to the last day whose closes are final.
+
+    The checkpoint is discarded, and the series recomputed from the start, when
+    the transactions it folded in no longer match those dated on or before it.
+
+    Args:
+        portfolio_id (str): Identifies the portfolio the checkpoint belongs to.
+        transactions (pd.DataFrame): The portfolio's transactions in chronological
+            order, with the columns date (normalized), ticker, type, quantity,
+            price and currency.
+        currencies (dict): The currency of every portfolio ticker.
+        start_date: The first date of the series (the first transaction's date).
+        end_date: The last date of the series.
+        store (SeriesStore, optional): Where checkpoints are kept.
+
+    Returns:
+        tuple: The series (cash_invested, portfolio_value, equity, cash and pnl)
+        and the state at ``end_date`` (holdings, cash, last_close, ...).
+    """
+    store = store or series_store
+    tickers = list(currencies)
+    key = series_key(portfolio_id, currencies)
+
+    checkpoint = store.load(key)
+    if checkpoint is not None:
+        folded = transactions[transactions["date"] <= checkpoint["state"]["date"]]
+        if transactions_hash(folded) != checkpoint["transactions"]:
+            checkpoint = None
+    if checkpoint is None:
+        checkpoint = _empty_checkpoint(start_date, tickers)
+    state = checkpoint["state"]
+
+    closes = price_store.get_closes_frame(tickers, state["date"] + pd.Timedelta(days=1), end_date)
+    # A ticker without any closes is valued at 0
+    final_date = _final_date(transactions, currencies, state, end_date, date.today())
+    state = _value_missing_at_zero(closes, state)
+
+    if final_date > state["date"]:
+        dates = pd.date_range(state["date"] + pd.Timedelta(days=1), final_date, freq="D")
+        new_series, state = _simulate(
+            transactions[
+                (transactions["date"] > state["date"]) & (transactions["date"] <= final_date)
+            ],
+            currencies,
+            closes,
+            dates,
+            state,
+        )
+        checkpoint = {
+            "state": state,
+            "transactions": transactions_hash(transactions[transactions["date"] <= final_date]),
+            "series": _append(checkpoint["series"], new_series),
+        }
+        store.save(key, checkpoint)
+
+    # Days whose closes may still change are simulated on every request
+    series = checkpoint["series"]
+    dates = pd.date_range(state["date"] + pd.Timedelta(days=1), end_date, freq="D")
+    if len(dates):
+        tail_series, state = _simulate(
+            transactions[transactions["date"] > state["date"]],
+            currencies,
+            closes,
+            dates,
+            state,
+        )
+        series = _append(series, tail_series)
+    return series, state
+
+
+def seed_state(transactions, currencies, first_date, window_start, closes):
+    """
+    Returns the simulation state at the end of the day before ``window_start``
+    from the transactions before it, without simulating the days in between.
+
+    Holdings, cash and cash invested only depend on the transactions, and the
+    values on the closes of the day before the window.
+
+    Args:
+        transactions (pd.DataFrame): The portfolio's transactions (see roll_forward).
+        currencies (dict): The currency of every portfolio ticker.
+        first_date: The first date of the portfolio (its first transaction's date).
+        window_start: The first date of the window.
+        closes (pd.DataFrame): The closes in the window, to tell which tickers
+            have no closes at all (valued at 0).
+
+    Returns:
+        dict: The state, as returned by the simulation of the day before the window.
+    """
+    tickers = list(currencies)
+    window_start = pd.Timestamp(window_start).normalize()
+    state = _initial_state(window_start, tickers)
+    earlier = _with_values(transactions[transactions["date"] < window_start])
+    if earlier.empty:
+        return _value_missing_at_zero(closes, state)
+    day = state["date"]
+
+    closes_asof = price_store.get_closes_asof(tickers, [day], start=first_date)
+    last_close = _value_missing_at_zero(closes, {"last_close": closes_asof.loc[day]})["last_close"]
+
+    fx_rates = pd.DataFrame(
+        [[fx_table.rate(currencies[ticker], day) for ticker in tickers]],
+        index=[day],
+        columns=tickers,
+    )
+    series, holdings = portfolio_time_series(
+        earlier, pd.DataFrame([last_close[tickers]], index=[day]), fx_rates
+    )
+    return dict(
+        state,
+        holdings=holdings,
+        cash=float(series["cash"].iloc[-1]),
+        invested=float(series["cash_invested"].iloc[-1]),
+        portfolio_value=float(series["portfolio_value"].iloc[-1]),
+        last_close=last_close,
+    )
+
+
+def _fetch_end(last_date):
+    # As for the whole series, closes are used up to today even if the series
+    # ends later
+    return min(pd.Timestamp(last_date).normalize(), pd.Timestamp(date.today())) + pd.Timedelta(days=1)
+
+
+def simulate_window(transactions, currencies, first_date, window_start, window_end):
+    """
+    Returns the series of a portfolio for the days from ``window_start`` to
+    ``window_end`` (inclusive) only, seeded with the state left by the
+    transactions before the window (see seed_state), so short windows cost
+    proportionally less than the whole history.
+
+    Returns:
+        tuple: As roll_forward, for the window.
+    """
+    tickers = list(currencies)
+    window_start = pd.Timestamp(window_start).normalize()
+    window_end = pd.Timestamp(window_end).normalize()
+    fetch_end = _fetch_end(window_end)
+    price_store.refresh(tickers, first_date, fetch_end)
+    closes = price_store.get_closes_frame(tickers, window_start, fetch_end)
+    state = seed_state(transactions, currencies, first_date, window_start, closes)
+    dates = pd.date_range(window_start, window_end, freq="D")
+    return _simulate(
+        transactions[transactions["date"] >= window_start],
+        currencies,
+        closes,
+        dates,
+        state,
+    )
+
+
+@timed("simulate")
+def benchmark_series(comp_ticker, transactions, cash_invested, first_date):
+    """
+    Simulates the portfolio investing the same cash into a comparison index:
+    whenever more money is invested in the portfolio, the same amount buys
+    index shares at that day's close.
+
+    Only the cash invested series and the index's closes are needed, so the
+    series of any index is derived from the portfolio's (whole or windowed)
+    series without simulating the portfolio again.
+
+    Args:
+        comp_ticker (str): The comparison index ticker.
+        transactions (pd.DataFrame): The portfolio's transactions (see
+            roll_forward); those before the series give the shares held at its
+            start.
+        cash_invested (pd.Series): The portfolio's cash invested on every date
+            of the series.
+        first_date: The first date of the portfolio (its first transaction's date).
+
+    Returns:
+        tuple: The value and the daily PnL of the index portfolio on the dates
+        of ``cash_invested``.
+    """
+    dates = cash_invested.index
+    day = dates[0] - pd.Timedelta(days=1)
+    # The days money was invested before the series, then the day before it,
+    # which leads the PnL series as in the simulation
+    earlier = transactions[transactions["date"] <= day]
+    if earlier.empty:
+        invested = pd.Series([0.0], index=[day])
+    else:
+        by_day = _invested_by_day(earlier)
+        invested = pd.concat([by_day[by_day.index < day], pd.Series([by_day.iloc[-1]], index=[day])])
+    invested = pd.concat([invested, cash_invested.astype(float)])
+
+    closes = price_store.get_closes_frame([comp_ticker], first_date, _fetch_end(dates[-1]))[comp_ticker]
+    prices = closes.reindex(closes.index.union(invested.index)).ffill().reindex(invested.index)
+    if prices.isna().all():
+        # An index without any closes is valued at 0, like a ticker
+        print(f"No data for {comp_ticker}")
+        prices = prices.fillna(0.0)
+
+    value = benchmark_shares(invested, prices) * prices
+    pnl = pnl_percentage_series(value, invested)
+    return value.iloc[-len(dates):], pnl.iloc[-len(dates):]
+
+
+@timed("simulate")
+def roll_forward_benchmark(portfolio_id, comp_ticker, transactions, currencies, cash_invested, store=None):
+    """
+    Returns benchmark_series over the whole history of a portfolio, computing
+    only the days after the last stored checkpoint of the index's shares and
+    moving it forward to the last day whose index close is final.
+
+    The cash invested on past days only depends on the transactions, so the
+    checkpoint stays valid as long as those dated on or before it do (as for
+    roll_forward).
+
+    Args:
+        portfolio_id (str): Identifies the portfolio the checkpoint belongs to.
+        comp_ticker (str): The comparison index ticker.
+        transactions (pd.DataFrame): The portfolio's transactions (see roll_forward).
+        currencies (dict): The currency of every portfolio ticker.
+        cash_invested (pd.Series): The portfolio's cash invested on every date
+            from its first one, as returned by roll_forward.
+        store (SeriesStore, optional): Where checkpoints are kept.
+
+    Returns:
+        tuple: The value and the daily PnL of the index portfolio on the dates
+        of ``cash_invested``.
+    """
+    store = store or series_store
+    key = f"{series_key(portfolio_id, currencies)}:{comp_ticker}"
+    dates = cash_invested.index
+
+    checkpoint = store.load(key)
+    if checkpoint is not None:
+        folded = transactions[transactions["date"] <= checkpoint["state"]["date"]]
+        if transactions_hash(folded) != checkpoint["transactions"]:
+            checkpoint = None
+    if checkpoint is None:
+        checkpoint = {
+            "state": {
+                "date": dates[0] - pd.Timedelta(days=1),
+                "invested": 0.0,
+                "shares": 0.0,
+                "value": 0.0,
+                "last_close": np.nan,
+            },
+            "transactions": transactions_hash(pd.DataFrame(columns=TRANSACTION_COLUMNS)),
+            "series": pd.DataFrame(columns=["value", "pnl"], dtype=float),
+        }
+    state = checkpoint["state"]
+    series = checkpoint["series"]
+    new_dates = dates[dates > state["date"]]
+
+    if len(new_dates):
+        closes = price_store.get_closes_frame(
+            [comp_ticker], state["date"] + pd.Timedelta(days=1), _fetch_end(new_dates[-1])
+        )[comp_ticker]
+        known = pd.concat([pd.Series([state["last_close"]], index=[state["date"]]), closes.dropna()])
+        prices = known.reindex(known.index.union(new_dates)).ffill().reindex(new_dates)
+        if prices.isna().all():
+            # An index without any closes is valued at 0, like a ticker
+            print(f"No data for {comp_ticker}")
+            prices = prices.fillna(0.0)
+
+        invested = cash_invested[new_dates].astype(float)
+        shares = benchmark_shares(invested, prices, state["invested"], state["shares"])
+        value = shares * prices
+        # The state's day leads the PnL series, as in the simulation
+        pnl = pnl_percentage_series(
+            pd.concat([pd.Series([state["value"]], index=[state["date"]]), value]),
+            pd.concat([pd.Series([state["invested"]], index=[state["date"]]), invested]),
+        ).iloc[1:]
+        new_series = pd.DataFrame({"value": value, "pnl": pnl})
+        series = _append(series, new_series)
+
+        checked = price_store.checked([comp_ticker])[comp_ticker]
+        if checked is not None:
+            final_date = min(pd.Timestamp(checked), pd.Timestamp(date.today())) - pd.Timedelta(days=1)
+            final = new_dates[new_dates <= final_date]
+            if len(final):
+                last = final[-1]
+                store.save(
+                    key,
+                    {
+                        "state": {
+                            "date": last,
+                            "invested": float(invested[last]),
+                            "shares": float(shares[last]),
+                            "value": float(value[last]),
+                            "last_close": float(prices[last]),
+                        },
+                        "transactions": transactions_hash(transactions[transactions["date"] <= last]),
+                        "series": _append(checkpoint["series"], new_series.loc[:last]),
+                    },
+                )
+
+    series = series.loc[: dates[-1]]
+    return series["value"], series["pnl"]
@@ -0,0 +1,30 @@
+"""
+Production entry point for the backend.
+
+Serves ``backend.app`` with waitress, a multi-threaded WSGI server, so many
+dashboard clients are handled at once and a request waiting on a slow ticker
+does not hold up the others. Market-data calls made while handling requests
+share the bounded pool configured in market_data.py.
+
+    python serve.py --host 0.0.0.0 --port 3000 --threads 16
+"""
+import argparse
+
+from waitress import serve
+
+from backend import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the portfolio backend.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=3000, help="Port to listen on.")
+    parser.add_argument(
+        "--threads", type=int, default=16, help="Number of requests handled at once."
+    )
+    args = parser.parse_args()
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
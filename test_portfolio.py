@@ -0,0 +1,103 @@
+"""
+Tests of the portfolio imports and of the analytics of portfolios without
+transactions.
+"""
+import io
+
+import pytest
+
+import report
+from portfolio_store import PortfolioStore, StoredPortfolio, csv_rows, ndjson_rows
+
+
+def test_import_csv_with_column_aliases():
+    store = PortfolioStore(":memory:")
+    store.create("p")
+    export = io.StringIO(
+        "Trade Date,Symbol,Side,Qty,Price\n"
+        "2024-01-10,AAA,Bought,10,50\n"
+        "2024-02-05,BBB.TO,BUY,5,48.5\n"
+        "2024-03-01,AAA,sold,4,52\n"
+    )
+    assert store.add_transactions("p", csv_rows(export)) == 3
+    portfolio = store.get("p")
+    assert portfolio == {
+        "USD": {
+            "AAA": [
+                {"type": "buy", "date": "2024-01-10 00:00:00", "quantity": 10, "price": 50.0},
+                {"type": "sell", "date": "2024-03-01 00:00:00", "quantity": 4, "price": 52.0},
+            ]
+        },
+        "CAD": {"BBB.TO": [{"type": "buy", "date": "2024-02-05 00:00:00", "quantity": 5, "price": 48.5}]},
+    }
+
+
+def test_import_ndjson_rejects_bad_row():
+    store = PortfolioStore(":memory:")
+    store.create("p")
+    lines = io.StringIO(
+        '{"date": "2024-01-10", "ticker": "AAA", "type": "buy", "quantity": 10, "price": 50}\n'
+        "\n"
+        '{"date": "2024-01-11", "ticker": "AAA", "type": "buy", "quantity": 5, "price": 51}\n'
+    )
+    assert store.add_transactions("p", ndjson_rows(lines)) == 2
+    revision = store.get("p").revision
+
+    lines = io.StringIO(
+        '{"date": "2024-02-01", "ticker": "AAA", "type": "sell", "quantity": 3, "price": 55}\n'
+        '{"date": "2024-02-02", "ticker": "AAA", "type": "hold", "quantity": 3, "price": 55}\n'
+    )
+    with pytest.raises(ValueError, match="Row 2: unknown type 'hold'"):
+        store.add_transactions("p", ndjson_rows(lines))
+    # Nothing of the rejected import is added
+    assert store.counts() == {"p": 2}
+    assert store.get("p").revision == revision
+
+
+def test_import_rejects_mixed_currencies():
+    store = PortfolioStore(":memory:")
+    store.create("p")
+    store.add_transactions(
+        "p", [{"date": "2024-01-10", "ticker": "AAA", "type": "buy", "quantity": 10, "price": 50}]
+    )
+
+    rows = [
+        {"date": "2024-01-11", "ticker": "BBB", "type": "buy", "quantity": 1, "price": 10},
+        {"date": "2024-01-12", "ticker": "AAA", "type": "buy", "quantity": 1, "price": 50, "currency": "CAD"},
+    ]
+    with pytest.raises(ValueError, match="Row 2: AAA is held in USD, not CAD"):
+        store.add_transactions("p", rows)
+
+    rows = [
+        {"date": "2024-01-11", "ticker": "CCC", "type": "buy", "quantity": 1, "price": 10, "currency": "EUR"},
+        {"date": "2024-01-12", "ticker": "CCC", "type": "sell", "quantity": 1, "price": 11},
+    ]
+    with pytest.raises(ValueError, match="Row 2: CCC is held in EUR, not USD"):
+        store.add_transactions("p", rows)
+    assert store.counts() == {"p": 1}
+
+
+def test_empty_portfolio(market):
+    portfolio = StoredPortfolio("empty", "revision")
+
+    comparison = report.get_comparison_data(portfolio, ["^IXIC"], series_format="columnar")
+    assert comparison["info"] == {"portfolio_value": 0, "cash_invested": 0, "roi_portfolio": 0}
+    assert comparison["series"]["index"] == []
+    assert comparison["benchmarks"]["^IXIC"]["value"] == []
+
+    comparison = report.get_comparison_data(portfolio, "^IXIC")
+    assert comparison["info"]["comp_value"] == 0
+    assert report.get_portfolio_performances(portfolio) == {}
+
+
+def test_tickers_without_transactions(market):
+    portfolio = {
+        "USD": {
+            "AAA": [{"type": "buy", "date": "2024-01-10 10:00:00", "quantity": 10, "price": 50.0}],
+            "BBB": [],
+        },
+        "CAD": {"CCC.TO": []},
+    }
+    performances = report.get_portfolio_performances(portfolio)
+    assert performances == {"USD": {"AAA": performances["USD"]["AAA"]}, "CAD": {}}
+    assert performances["USD"]["AAA"]["performance"]["total_invested"] > 0
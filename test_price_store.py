@@ -0,0 +1,39 @@
+"""
+Tests of the price store, run offline on synthetic market data (see
+market_data.write_synthetic_fixtures).
+"""
+import market_data
+from market_data import FixtureProvider, set_provider, write_synthetic_fixtures
+from price_store import PriceStore
+
+
+class FlakyProvider(FixtureProvider):
+    """
+    Fixture data whose history downloads fail ``failures`` times first.
+    """
+
+    def __init__(self, directory, failures):
+        super().__init__(directory)
+        self.failures = failures
+
+    def history(self, ticker, start, end, interval="1d"):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("network down")
+        return super().history(ticker, start, end, interval)
+
+
+def test_failed_download_is_fetched_again(tmp_path):
+    write_synthetic_fixtures(tmp_path, ["AAA"], "2024-01-01", "2024-07-01")
+    previous = market_data._provider
+    set_provider(FlakyProvider(str(tmp_path), failures=1))
+    try:
+        store = PriceStore(":memory:")
+        assert store.get_closes("AAA", "2024-02-01", "2024-06-01").empty
+        assert store._coverage("AAA") is None
+
+        closes = store.get_closes("AAA", "2024-02-01", "2024-06-01")
+        assert len(closes) == 87
+        assert closes.index[0].isoformat() == "2024-02-01T00:00:00"
+    finally:
+        set_provider(previous)
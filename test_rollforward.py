@@ -0,0 +1,110 @@
+"""
+Tests of the roll-forward of the portfolio series (see rollforward.py).
+"""
+import pandas as pd
+import pytest
+
+import rollforward
+from ledger import parse_portfolio
+from rollforward import SeriesStore, benchmark_series, roll_forward, roll_forward_benchmark, simulate_window
+
+PORTFOLIO = {
+    "USD": {
+        "AAA": [
+            {"type": "buy", "date": "2024-01-10 10:00:00", "quantity": 40, "price": 50.0},
+            {"type": "buy", "date": "2024-04-02 15:30:00", "quantity": 25, "price": 52.5},
+            {"type": "sell", "date": "2024-07-15 11:00:00", "quantity": 30, "price": 55.0},
+        ],
+    },
+    "CAD": {
+        "BBB.TO": [
+            {"type": "buy", "date": "2024-02-05 09:45:00", "quantity": 100, "price": 48.0},
+            {"type": "sell", "date": "2024-09-20 14:00:00", "quantity": 100, "price": 51.0},
+            {"type": "buy", "date": "2024-10-01 10:00:00", "quantity": 60, "price": 49.5},
+        ],
+    },
+}
+# The last day of the series, like today + 1 for the dashboard: its closes are
+# not read (see roll_forward), so the windows end before it
+END_DATE = pd.Timestamp("2025-01-15")
+
+
+def test_roll_forward_matches_full_series(market):
+    ledger = parse_portfolio(PORTFOLIO)
+    transactions = ledger.frame()
+    full, full_state = roll_forward(
+        "full", transactions, ledger.currencies, ledger.start_date, END_DATE, store=SeriesStore(":memory:")
+    )
+
+    store = SeriesStore(":memory:")
+    roll_forward("rolled", transactions, ledger.currencies, ledger.start_date, "2024-06-30", store=store)
+    assert store.load(rollforward.series_key("rolled", ledger.currencies)) is not None
+    rolled, rolled_state = roll_forward(
+        "rolled", transactions, ledger.currencies, ledger.start_date, END_DATE, store=store
+    )
+
+    assert full.index[0] == ledger.start_date
+    assert full.index[-1] == END_DATE
+    pd.testing.assert_frame_equal(rolled, full)
+    assert rolled_state["cash"] == pytest.approx(full_state["cash"])
+    pd.testing.assert_series_equal(rolled_state["holdings"], full_state["holdings"])
+
+
+def test_benchmark_roll_forward_matches_full_series(market):
+    ledger = parse_portfolio(PORTFOLIO)
+    transactions = ledger.frame()
+    full, _ = roll_forward("full", transactions, ledger.currencies, ledger.start_date, END_DATE)
+    cash_invested = full["cash_invested"]
+    full_value, full_pnl = benchmark_series("^IXIC", transactions, cash_invested, ledger.start_date)
+
+    store = SeriesStore(":memory:")
+    roll_forward_benchmark("p", "^IXIC", transactions, ledger.currencies, cash_invested[:"2024-06-30"], store=store)
+    key = f"{rollforward.series_key('p', ledger.currencies)}:^IXIC"
+    assert store.load(key)["state"]["date"] == pd.Timestamp("2024-06-30")
+    value, pnl = roll_forward_benchmark("p", "^IXIC", transactions, ledger.currencies, cash_invested, store=store)
+
+    pd.testing.assert_series_equal(value, full_value, check_freq=False, check_names=False)
+    pd.testing.assert_series_equal(pnl, full_pnl, check_freq=False, check_names=False)
+
+
+def test_checkpoint_moves_past_stale_tickers(market):
+    # OLD stops trading while held and NONE never traded at all; neither holds
+    # the checkpoint back
+    portfolio = dict(
+        PORTFOLIO,
+        USD=dict(
+            PORTFOLIO["USD"],
+            OLD=[{"type": "buy", "date": "2024-01-15 10:00:00", "quantity": 10, "price": 50.0}],
+            NONE=[{"type": "buy", "date": "2024-02-01 10:00:00", "quantity": 5, "price": 20.0}],
+        ),
+    )
+    ledger = parse_portfolio(portfolio)
+    store = SeriesStore(":memory:")
+    key = rollforward.series_key("stale", ledger.currencies)
+
+    roll_forward("stale", ledger.frame(), ledger.currencies, ledger.start_date, "2024-06-30", store=store)
+    assert store.load(key)["state"]["date"] == pd.Timestamp("2024-06-29")
+    rolled, _ = roll_forward("stale", ledger.frame(), ledger.currencies, ledger.start_date, END_DATE, store=store)
+    assert store.load(key)["state"]["date"] == END_DATE - pd.Timedelta(days=1)
+
+    full, _ = roll_forward(
+        "full", ledger.frame(), ledger.currencies, ledger.start_date, END_DATE, store=SeriesStore(":memory:")
+    )
+    pd.testing.assert_frame_equal(rolled, full)
+
+
+@pytest.mark.parametrize("start, end", [("2024-01-01", "2024-03-15"), ("2024-05-01", "2024-08-31"), ("2024-11-15", "2024-12-31")])
+def test_window_matches_full_series(market, start, end):
+    ledger = parse_portfolio(PORTFOLIO)
+    transactions = ledger.frame()
+    full, _ = roll_forward("full", transactions, ledger.currencies, ledger.start_date, END_DATE)
+    window_start = max(pd.Timestamp(start), ledger.start_date)
+    window, _ = simulate_window(transactions, ledger.currencies, ledger.start_date, window_start, end)
+
+    expected = full.loc[window_start:end]
+    pd.testing.assert_frame_equal(window, expected, check_freq=False)
+
+    full_value, full_pnl = benchmark_series("^IXIC", transactions, full["cash_invested"], ledger.start_date)
+    value, pnl = benchmark_series("^IXIC", transactions, window["cash_invested"], ledger.start_date)
+    pd.testing.assert_series_equal(value, full_value.loc[window_start:end], check_freq=False, check_names=False)
+    pd.testing.assert_series_equal(pnl, full_pnl.loc[window_start:end], check_freq=False, check_names=False)